@@ -1,9 +1,22 @@
+from array import array
+
 class Node:
-    """Base class for all AST nodes."""
-    pass
+    """Base class for all AST nodes.
+
+    Every node class lists its fields in _fields and stores them in
+    __slots__, so nodes carry no per-instance __dict__.
+    """
+    __slots__ = ()
+    _fields = ()
+
+    def __repr__(self):
+        fields = ', '.join(f'{name}={getattr(self, name)!r}' for name in self._fields)
+        return f'{type(self).__name__}({fields})'
 
 class FunctionDeclaration(Node):
     """Represents a function declaration."""
+    __slots__ = _fields = ('name', 'parameters', 'body')
+
     def __init__(self, name, parameters, body):
         self.name = name
         self.parameters = parameters
@@ -13,6 +26,8 @@ class FunctionDeclaration(Node):
 
 class IfNode(Node):
     """Represents an 'if' statement with optional 'elif' and 'else' blocks."""
+    __slots__ = _fields = ('condition', 'then_block', 'elif_blocks', 'else_block')
+
     def __init__(self, condition, then_block, elif_blocks, else_block):
         self.condition = condition
         self.then_block = then_block
@@ -21,17 +36,24 @@ class IfNode(Node):
 
 class WhileLoopNode(Node):
     """Represents a 'while' loop."""
+    __slots__ = _fields = ('condition', 'body')
+
     def __init__(self, condition, body):
         self.condition = condition
         self.body = body
 
 class DoWhileNode(Node):
     """Represents a 'do-while' loop."""
+    __slots__ = _fields = ('body', 'condition')
+
     def __init__(self, body, condition):
         self.body = body
         self.condition = condition
-        
-class ForLoopNode:
+
+class ForLoopNode(Node):
+    """Represents a 'for' loop counting a variable up to an end value."""
+    __slots__ = _fields = ('identifier', 'end_value', 'body')
+
     def __init__(self, identifier, end_value, body):
         self.identifier = identifier
         self.end_value = end_value
@@ -39,20 +61,34 @@ class ForLoopNode:
 
 class BinaryOperatorNode(Node):
     """Represents a binary operation (e.g., addition, subtraction)."""
+    __slots__ = _fields = ('left', 'operator', 'right')
+
     def __init__(self, left, operator, right):
         self.left = left
         self.operator = operator
         self.right = right
 
+class UnaryOperatorNode(Node):
+    """Represents a prefix operation (negation or logical not)."""
+    __slots__ = _fields = ('operator', 'operand')
+
+    def __init__(self, operator, operand):
+        self.operator = operator
+        self.operand = operand
+
 # Variables/Variable-Adjacent
 
 class NumberNode(Node):
     """Represents a numeric literal."""
+    __slots__ = _fields = ('value',)
+
     def __init__(self, value):
         self.value = value
 
 class VariableDeclarationNode(Node):
     """Represents a variable declaration."""
+    __slots__ = _fields = ('type_name', 'name', 'expression')
+
     def __init__(self, type_name, name, expression):
         self.type_name = type_name
         self.name = name
@@ -60,80 +96,441 @@ class VariableDeclarationNode(Node):
 
 class AssignNode(Node):
     """Represents an assignment to a variable."""
+    __slots__ = _fields = ('name', 'expression')
+
     def __init__(self, name, expression):
         self.name = name
         self.expression = expression
 
 class FunctionCallNode(Node):
     """Represents a function call."""
+    __slots__ = _fields = ('function_name', 'arguments')
+
     def __init__(self, function_name, arguments):
         self.function_name = function_name
         self.arguments = arguments
-        
+
 class StringLiteralNode(Node):
+    """Represents a string literal."""
+    __slots__ = _fields = ('value',)
+
     def __init__(self,value):
         self.value = value.strip('"')
-        
+
 class CharacterNode(Node):
     """Represents a character literal."""
+    __slots__ = _fields = ('value',)
+
     def __init__(self, value):
         # Ensure the character is stored without surrounding quotes
         self.value = value.strip("'")
-        
+
 class DoubleNode(Node):
     """Represents a double literal"""
+    __slots__ = _fields = ('value',)
+
     def __init__(self, value):
         self.value = value
-        
+
     def __repr__(self):
         return f'DoubleNode(value={self.value})'
-    
-class ArrayDeclarationNode:
+
+class ArrayDeclarationNode(Node):
+    """Represents an array declaration with its element type and initial elements."""
+    __slots__ = _fields = ('array_type', 'name', 'elements')
+
     def __init__(self, array_type, name, elements):
         self.array_type = array_type
         self.name = name
         self.elements = elements
-        
-class ArrayAccessNode:
+
+class ArrayAccessNode(Node):
+    """Represents reading an array element."""
+    __slots__ = _fields = ('name', 'index')
+
     def __init__(self, name, index):
         self.name = name
         self.index = index
-        
-class ArrayAssignNode:
+
+class ArrayAssignNode(Node):
+    """Represents storing a value into an array element."""
+    __slots__ = _fields = ('array_name', 'index', 'value')
+
     def __init__(self, array_name, index, value):
         self.array_name = array_name
         self.index = index
         self.value = value
-        
+
 # Operators
-    
+
 class ExpressionNode(Node):
+    __slots__ = _fields = ('left', 'operator', 'right')
+
     def __init__(self, left, operator=None, right=None):
         self.left = left
         self.operator = operator
         self.right = right
-        
+
 class IncrementNode(Node):
+    __slots__ = _fields = ('identifier',)
+
     def __init__(self, identifier):
         self.identifier = identifier
-        
+
 class DecrementNode(Node):
+    __slots__ = _fields = ('identifier',)
+
     def __init__(self, identifier):
         self.identifier = identifier
 
 class StopNode(Node):
-    pass
+    __slots__ = ()
 
 class OutputNode(Node):
+    __slots__ = _fields = ('value',)
+
     def __init__(self, value):
         self.value = value
 
     def __str__(self):
         return f"OutputNode(value={self.value})"
 
-class VariableAccessNode:
+class VariableAccessNode(Node):
+    __slots__ = _fields = ('identifier',)
+
     def __init__(self, identifier):
         self.identifier = identifier
 
     def __repr__(self):
         return f"VariableAccessNode(identifier='{self.identifier}')"
+
+# Compiler temporaries. The parser never builds these; optimizer passes do.
+# Their names are not valid identifiers, so they cannot clash with a
+# program's own variables.
+
+class TemporaryNode(Node):
+    """Evaluates expression the first time it is reached after a reset, then reuses that value."""
+    __slots__ = _fields = ('name', 'expression')
+
+    def __init__(self, name, expression):
+        self.name = name
+        self.expression = expression
+
+class ResetNode(Node):
+    """Statement that forgets the values of the named temporaries; evaluates to None."""
+    __slots__ = _fields = ('names',)
+
+    def __init__(self, names):
+        self.names = names
+
+# Typed operators. The parser never builds these either: the optimizer's
+# TypeSpecializer does, where inference proved the types of both operands,
+# so evaluating them needs no checks on the operator or operands.
+
+class IntegerOperatorNode(Node):
+    """Arithmetic or comparison on two integers."""
+    __slots__ = _fields = ('left', 'operator', 'right')
+
+    def __init__(self, left, operator, right):
+        self.left = left
+        self.operator = operator
+        self.right = right
+
+class DoubleOperatorNode(Node):
+    """Arithmetic or comparison on two numbers, at least one of which may be a double."""
+    __slots__ = _fields = ('left', 'operator', 'right')
+
+    def __init__(self, left, operator, right):
+        self.left = left
+        self.operator = operator
+        self.right = right
+
+class ConcatenateNode(Node):
+    """Joins two strings."""
+    __slots__ = _fields = ('left', 'right')
+
+    def __init__(self, left, right):
+        self.left = left
+        self.right = right
+
+# Array accesses the optimizer's BoundsCheckEliminator proved are in
+# bounds, on an array that is always defined there. They are also
+# instances of the checked classes, so analyses need not tell them apart.
+
+class UncheckedArrayAccessNode(ArrayAccessNode):
+    """Reads an array item without checking that the array exists."""
+    __slots__ = ()
+
+class UncheckedArrayAssignNode(ArrayAssignNode):
+    """Stores an array item without checking the array or the index."""
+    __slots__ = ()
+
+# Flat AST
+
+# Every concrete node class, in a fixed order: a node's kind in a FlatAST is
+# its class's index here.
+NODE_TYPES = (
+    FunctionDeclaration, IfNode, WhileLoopNode, DoWhileNode, ForLoopNode,
+    BinaryOperatorNode, UnaryOperatorNode, NumberNode, VariableDeclarationNode,
+    AssignNode, FunctionCallNode, StringLiteralNode, CharacterNode, DoubleNode,
+    ArrayDeclarationNode, ArrayAccessNode, ArrayAssignNode, ExpressionNode,
+    IncrementNode, DecrementNode, StopNode, OutputNode, VariableAccessNode,
+    TemporaryNode, ResetNode, IntegerOperatorNode, DoubleOperatorNode,
+    ConcatenateNode, UncheckedArrayAccessNode, UncheckedArrayAssignNode,
+)
+
+# Field values in a FlatAST are ints tagged in their low two bits.
+TAG_NODE = 0  # payload is a node index
+TAG_CONSTANT = 1  # payload is an index into the constants pool
+TAG_LIST = 2  # payload is an offset into fields holding a length and then the items
+TAG_TUPLE = 3  # as TAG_LIST, decoded as a tuple
+
+class FlatAST:
+    """A whole program stored in parallel arrays instead of node objects.
+
+    Node i has kind kinds[i] (an index into NODE_TYPES) and its encoded field
+    values start at fields[offsets[i]], one per name in the class's _fields.
+    Literal values and names live once each in the constants pool.
+
+    statements() returns lightweight views: instances of a subclass of each
+    node class whose fields read straight from the arrays. They look and
+    dispatch like ordinary nodes, so the interpreter walks either form.
+    """
+    def __init__(self):
+        self.kinds = array('B')
+        self.offsets = array('I')
+        self.fields = array('i')
+        self.constants = []
+        self.root = None  # Encoded list of the top-level statements
+        self._constant_index = {}
+
+    @classmethod
+    def from_nodes(cls, statements):
+        flat = cls()
+        flat.root = flat._encode(list(statements))
+        flat._constant_index = None  # Only needed while building
+        return flat
+
+    @classmethod
+    def from_arrays(cls, kinds, offsets, fields, constants, root):
+        """Wrap existing sequences, e.g. memoryviews over a cached file, without copying."""
+        flat = cls.__new__(cls)
+        flat.kinds = kinds
+        flat.offsets = offsets
+        flat.fields = fields
+        flat.constants = constants
+        flat.root = root
+        flat._constant_index = None
+        return flat
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def _encode(self, value):
+        if isinstance(value, Node):
+            node_type = type(value)
+            names = node_type._fields
+            encoded = [self._encode(getattr(value, name)) for name in names]
+            index = len(self.kinds)
+            self.kinds.append(NODE_KINDS[node_type])
+            self.offsets.append(len(self.fields))
+            self.fields.extend(encoded)
+            return index << 2 | TAG_NODE
+        if isinstance(value, (list, tuple)):
+            encoded = [self._encode(item) for item in value]
+            offset = len(self.fields)
+            self.fields.append(len(encoded))
+            self.fields.extend(encoded)
+            return offset << 2 | (TAG_LIST if isinstance(value, list) else TAG_TUPLE)
+        key = (type(value), value)  # Keep 1, 1.0 and True apart
+        index = self._constant_index.get(key)
+        if index is None:
+            index = self._constant_index[key] = len(self.constants)
+            self.constants.append(value)
+        return index << 2 | TAG_CONSTANT
+
+    def decode(self, encoded):
+        """Turn an encoded field value into a view, constant, list or tuple."""
+        tag = encoded & 3
+        payload = encoded >> 2
+        if tag == TAG_NODE:
+            return self.node(payload)
+        if tag == TAG_CONSTANT:
+            return self.constants[payload]
+        fields = self.fields
+        items = [self.decode(fields[i]) for i in range(payload + 1, payload + 1 + fields[payload])]
+        return items if tag == TAG_LIST else tuple(items)
+
+    def node(self, index):
+        """Return a view of node index."""
+        view_type = FLAT_VIEWS[self.kinds[index]]
+        view = view_type.__new__(view_type)
+        view._flat = self
+        view._index = index
+        return view
+
+    def statements(self):
+        """Return the top-level statements as views."""
+        return self.decode(self.root)
+
+    def to_nodes(self):
+        """Rebuild ordinary node objects for the whole program."""
+        # Children are encoded before their parents, so one pass in index
+        # order always finds a node's children already built.
+        kinds, offsets, fields, constants = self.kinds, self.offsets, self.fields, self.constants
+        nodes = []
+
+        def build(encoded):
+            tag = encoded & 3
+            payload = encoded >> 2
+            if tag == TAG_NODE:
+                return nodes[payload]
+            if tag == TAG_CONSTANT:
+                return constants[payload]
+            items = [build(fields[i]) for i in range(payload + 1, payload + 1 + fields[payload])]
+            return items if tag == TAG_LIST else tuple(items)
+
+        new = Node.__new__
+        for index in range(len(kinds)):
+            node_type = NODE_TYPES[kinds[index]]
+            node = new(node_type)
+            offset = offsets[index]
+            for position, name in enumerate(node_type._fields):
+                setattr(node, name, build(fields[offset + position]))
+            nodes.append(node)
+        return build(self.root)
+
+    def __iter__(self):
+        return iter(self.statements())
+
+def _flat_field(position):
+    def read(view):
+        flat = view._flat
+        return flat.decode(flat.fields[flat.offsets[view._index] + position])
+    return property(read)
+
+def _flat_view(node_type):
+    # Named like the node class so visitors dispatch on it unchanged
+    namespace = {'__slots__': ('_flat', '_index')}
+    for position, name in enumerate(node_type._fields):
+        namespace[name] = _flat_field(position)
+    return type(node_type.__name__, (node_type,), namespace)
+
+NODE_KINDS = {node_type: kind for kind, node_type in enumerate(NODE_TYPES)}
+FLAT_VIEWS = tuple(_flat_view(node_type) for node_type in NODE_TYPES)
+
+# Traversal
+
+class DispatchTable(dict):
+    """Maps node classes to the functions a visitor class handles them with.
+
+    A class's handler is its prefix + class name method, as an unbound
+    function, or the fallback method if it has none. Every node class is
+    looked up when the table is built; others, like subclasses defined
+    elsewhere, on first use.
+    """
+    def __init__(self, owner, prefix, fallback):
+        super().__init__()
+        self.owner = owner
+        self.prefix = prefix
+        self.fallback = fallback
+        for node_type in NODE_TYPES + FLAT_VIEWS:
+            self[node_type]
+
+    def __missing__(self, node_type):
+        function = getattr(self.owner, self.prefix + node_type.__name__, None)
+        if function is None:
+            function = getattr(self.owner, self.fallback)
+        self[node_type] = function
+        return function
+
+def dispatch_table(owner, prefix='visit_', fallback='generic_visit'):
+    """Return owner's DispatchTable for prefix, building it on first use; subclasses get their own."""
+    attribute = '_dispatch_' + prefix
+    table = owner.__dict__.get(attribute)
+    if table is None:
+        table = DispatchTable(owner, prefix, fallback)
+        setattr(owner, attribute, table)
+    return table
+
+class NodeVisitor:
+    """Walks a tree, calling visit_<class name> for each node it has one for.
+
+    visit() dispatches through the class's DispatchTable and falls back to
+    generic_visit(), which visits the nodes in every field in _fields,
+    including those in lists and tuples.
+    """
+    def visit(self, node):
+        return self._dispatch_visit_[type(node)](self, node)
+
+    def generic_visit(self, node):
+        for name in node._fields:
+            self.visit_value(getattr(node, name))
+
+    def visit_value(self, value):
+        if isinstance(value, Node):
+            return self.visit(value)
+        if isinstance(value, (list, tuple)):
+            for item in value:
+                self.visit_value(item)
+        return None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        dispatch_table(cls)
+
+def rebuild(node, values):
+    """Return a new node of node's class with the given field values."""
+    new = Node.__new__(type(node))
+    for name, value in zip(node._fields, values):
+        setattr(new, name, value)
+    return new
+
+class NodeTransformer(NodeVisitor):
+    """A NodeVisitor that rewrites a tree without changing it.
+
+    A visitor returns the replacement node; in a list, None removes the item
+    and a list splices its items in. Nodes are never modified in place: a
+    node is copied only when one of its fields changed, so a transformer can
+    run over trees whose nodes are shared, e.g. with a ParseCache.
+    """
+    def run(self, statements):
+        return self.visit_list(list(statements))
+
+    def generic_visit(self, node):
+        values = []
+        changed = False
+        for name in node._fields:
+            value = getattr(node, name)
+            new = self.visit_value(value)
+            changed = changed or new is not value
+            values.append(new)
+        return rebuild(node, values) if changed else node
+
+    def visit_value(self, value):
+        if isinstance(value, Node):
+            return self.visit(value)
+        if isinstance(value, list):
+            return self.visit_list(value)
+        if isinstance(value, tuple):
+            items = tuple(self.visit_value(item) for item in value)
+            return value if all(new is old for new, old in zip(items, value)) else items
+        return value
+
+    def visit_list(self, items):
+        """Visit a block or other list of nodes; the result is the same list if nothing changed."""
+        result = []
+        changed = False
+        for item in items:
+            new = self.visit_value(item)
+            if new is not item:
+                changed = True
+            if new is None:
+                continue
+            if isinstance(new, list) and not isinstance(item, list):
+                result.extend(new)
+            else:
+                result.append(new)
+        return result if changed else items
+
+dispatch_table(NodeVisitor)
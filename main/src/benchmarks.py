@@ -0,0 +1,466 @@
+import contextlib
+import os
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from ast import FlatAST
+from cache import ParseCache, ProgramCache
+from interpreter import ENGINES, run_program
+from lexer import IncrementalLexer, Lexer
+from output import StreamSink
+from parser import Parser
+
+# A block of Quetzal that touches most token kinds. Generated scripts are made
+# by repeating it, which is close to what our code generators emit.
+SAMPLE_PROGRAM = '''integer counter : 10
+double ratio : 2.5
+string greeting : "Hello"
+character letter : 'q'
+array integer values[1, 2, 3, 4, 5]
+while counter > 4
+    -> greeting
+    -> values[0]
+    values[0]++
+    counter--
+if counter :> 3 then
+    -> letter
+else then
+    -> ratio
+do
+    -> counter
+    ++counter
+while counter :< 8
+stop
+'''
+
+# The lexer's original pattern table: one regex per token type, keywords included.
+LEGACY_PATTERNS = {
+    'TYPE_STRING': r'\bstring\b',
+    'TYPE_INTEGER': r'\binteger\b',
+    'TYPE_DOUBLE': r'\bdouble\b',
+    'TYPE_CHARACTER': r'\bcharacter\b',
+    'STRING_LITERAL': r'"[^"]*"',
+    'FLOAT_LITERAL': r'\b\d+\.\d+\b',
+    'NUMBER': r'\b\d+\b',
+    'CHARACTER_LITERAL': r"'.'",
+    'FUN': r'\bfun\b',
+    'IF': r'\bif\b',
+    'ELSE_IF': r'\belse_if\b',
+    'ELSE': r'\belse\b',
+    'THEN': r'\bthen\b',
+    'STOP': r'\bstop\b',
+    'FOR': r'\bfor\b',
+    'WHILE': r'\bwhile\b',
+    'FROM': r'\bfrom\b',
+    'TO': r'\bto\b',
+    'ENQUEUE': r'\benqueue\b',
+    'DEQUEUE': r'\bdequeue\b',
+    'POP': r'\bpop\b',
+    'PUSH': r'\bpush\b',
+    'PEEK': r'\bpeek\b',
+    'POP_BACK': r'\bpop_back\b',
+    'PUSH_BACK': r'\bpush_back\b',
+    'DO': r'\bdo\b',
+    'UNTIL': r'\buntil\b',
+    'ARRAY': r'\barray\b',
+    'NEW_LINE': r'\n',
+    'IDENTIFIER': r'\b[a-zA-Z_][a-zA-Z0-9_]*\b',
+    'INCREMENT': r'\+\+',
+    'DECREMENT': r'--',
+    'PLUS_EQUAL': r':\+',
+    'MINUS_EQUAL': r':-',
+    'EQUAL': r':=',
+    'GREATER': r'>',
+    'LESS': r'<',
+    'GREATER_EQUAL': r':>',
+    'LESS_EQUAL': r':<',
+    'NOT_EQUAL': r':!',
+    'AND': r':&',
+    'OR': r':\|',
+    'COLON': r':',
+    'OUTPUT': r'->',
+    'PLUS': r'\+',
+    'MINUS': r'-',
+    'DIVIDE': r'/',
+    'MULTIPLY': r'\*',
+    'COMMA': r',',
+    'OPEN_PAREN': r'\(',
+    'CLOSE_PAREN': r'\)',
+    'OPEN_BRACE': r'\{',
+    'CLOSE_BRACE': r'\}',
+    'SQUARE_OPEN': r'\[',
+    'SQUARE_CLOSE': r'\]',
+}
+
+# Loop-heavy Quetzal for comparing execution engines.
+LOOP_PROGRAM = '''integer total : 0
+integer i : 0
+while i < 20000
+    total : total + i * 2
+    if total > 1000000 then
+        total : total - 1000000
+    i++
+array integer counts[0, 0, 0]
+integer j : 0
+for j to 20000
+    counts[1]++
+    counts[2] : counts[1] + j
+do
+    i--
+    j : j - 2
+while i > 0
+-> total
+-> counts[2]
+'''
+
+# The shape generated scripts take: sizes declared once up front, then loops
+# whose bounds and steps are expressions over them.
+CONSTANT_PROGRAM = '''integer width : 40
+integer height : 25
+integer scale : 4
+integer cells : width * height
+integer total : 0
+integer i : 0
+while i < cells * scale - width / 2
+    total : total + scale * 2 - 1
+    i : i + width / width
+-> total
+'''
+
+# Nested loops whose inner bound and scaling depend only on the outer loop
+# and on sizes declared once.
+INVARIANT_PROGRAM = '''integer rows : 60
+integer columns : 60
+integer weight : 3
+integer total : 0
+integer i : 0
+while i < rows
+    integer j : 0
+    while j < columns - i / 2
+        total : total + (weight * i + rows / weight) * j
+        j++
+    i++
+-> total
+'''
+
+# Neighbouring items read several times per statement, as generated
+# smoothing and comparison loops do.
+REPEATED_PROGRAM = '''array integer values[4, 8, 15, 16, 23, 42, 7, 1, 9, 12]
+integer total : 0
+integer round : 0
+while round < 300
+    integer i : 0
+    while i < 9
+        total : total + (values[i + 1] - values[i]) * (values[i + 1] - values[i])
+        if values[i + 1] > values[i] then
+            total : total + values[i + 1]
+        i++
+    round++
+-> total
+'''
+
+# For loops over a fixed-size array, indexed by the loop variables; every
+# access is provably in bounds.
+INDEXED_PROGRAM = '''array integer values[4, 8, 15, 16, 23, 42, 7, 1, 9, 12]
+integer total : 0
+integer round : 0
+while round < 1000
+    for integer i : 0 to 10
+        values[i] : values[i] + round
+    for integer i : 1 to 10
+        total : total + values[i] - values[i - 1]
+    round++
+-> total
+'''
+
+# Nested loops whose output grows with ROUNDS, for comparing returned and
+# streamed output.
+OUTPUT_PROGRAM = '''integer total : 0
+for integer i : 0 to ROUNDS
+    for integer j : 0 to 3
+        total : total + j
+    -> total
+'''
+
+def generate_source(lines):
+    """Return a Quetzal script of roughly the requested number of lines."""
+    block_lines = SAMPLE_PROGRAM.count('\n')
+    return SAMPLE_PROGRAM * max(1, lines // block_lines)
+
+
+def legacy_tokenize(source_code):
+    """The original per-pattern lexing loop, kept as the baseline to compare against."""
+    tokens = []
+    indent_stack = [0]
+    for line in source_code.split('\n'):
+        position = 0
+        current_indent = len(line) - len(line.lstrip())
+        previous_indent = indent_stack[-1]
+
+        if current_indent > previous_indent:
+            indent_stack.append(current_indent)
+            tokens.append(('INDENT', ' ' * current_indent))
+        while current_indent < previous_indent:
+            indent_stack.pop()
+            previous_indent = indent_stack[-1]
+            tokens.append(('DEDENT', ''))
+
+        while position < len(line):
+            match = None
+            for token_type, pattern in LEGACY_PATTERNS.items():
+                regex = re.compile(pattern)
+                match = regex.match(line, position)
+                if match:
+                    tokens.append((token_type, match.group()))
+                    print(f"Generated Token: {token_type}, Value: '{match.group()}'")
+                    position = match.end()
+                    break
+            if not match:
+                print(f"No match at position {position} in line: {line}")
+                position += 1
+    return tokens
+
+
+def peak_memory(function, *args):
+    """Run function with stdout silenced and return (peak traced bytes, result)."""
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        tracemalloc.start()
+        try:
+            result = function(*args)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return peak, result
+
+
+def measure(function, *args, repeat=3):
+    """Run function several times with stdout silenced and return (best seconds, result)."""
+    best = None
+    result = None
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = function(*args)
+            elapsed = time.perf_counter() - start
+            if best is None or elapsed < best:
+                best = elapsed
+    return best, result
+
+
+def bench_lexer(lines=20000):
+    """Compare tokens per second of the original loop and the current Lexer."""
+    source = generate_source(lines)
+    legacy_time, legacy_tokens = measure(legacy_tokenize, source, repeat=1)
+    current_time, current_tokens = measure(lambda: list(Lexer(source).tokenize()))
+    if list(legacy_tokens) != current_tokens:
+        raise AssertionError("Lexer token stream differs from the original implementation")
+    count = len(current_tokens)
+    print(f"lexer: {source.count(chr(10))} lines, {count} tokens")
+    print(f"  before: {count / legacy_time:12,.0f} tokens/s ({legacy_time:.3f}s)")
+    print(f"  after:  {count / current_time:12,.0f} tokens/s ({current_time:.3f}s)")
+    print(f"  speedup: {legacy_time / current_time:.1f}x")
+
+
+def bench_token_memory(lines=20000):
+    """Compare peak lexer memory of a list of tuples and the compact TokenBuffer."""
+    source = generate_source(lines)
+    list_peak, tokens = peak_memory(lambda: list(Lexer(source).stream()))
+    buffer_peak, buffer = peak_memory(lambda: Lexer(source).tokenize())
+    print(f"token memory: {len(buffer)} tokens")
+    print(f"  tuple list:   {list_peak / 1024:10,.0f} KiB")
+    print(f"  TokenBuffer:  {buffer_peak / 1024:10,.0f} KiB")
+    print(f"  reduction: {list_peak / buffer_peak:.1f}x")
+
+
+def bench_incremental(lines=10000):
+    """Time a one-line edit through IncrementalLexer against a full re-lex."""
+    source = generate_source(lines)
+    incremental = IncrementalLexer(source)
+    middle = len(incremental.lines) // 2
+    edited_line = incremental.lines[middle] + ' + 1'
+    edited = incremental.lines[:]
+    edited[middle] = edited_line
+    edited_source = '\n'.join(edited)
+    full_time, _ = measure(lambda: Lexer(edited_source).tokenize())
+    edit_time, relexed = measure(incremental.edit, middle, middle + 1, edited_line)
+    if incremental.tokens() != list(Lexer(edited_source).tokenize()):
+        raise AssertionError("Incremental tokens differ from a full re-lex")
+    print(f"incremental: one-line edit in {len(incremental.lines)} lines, {relexed} line(s) re-lexed")
+    print(f"  full re-lex:  {full_time * 1000:8.2f} ms")
+    print(f"  incremental:  {edit_time * 1000:8.2f} ms")
+
+
+def bench_parallel(lines=200000):
+    """Compare sequential lexing with the process-pool lexer on a large generated source."""
+    source = generate_source(lines)
+    workers = os.cpu_count() or 1
+    sequential_time, sequential = measure(lambda: Lexer(source).tokenize(), repeat=1)
+    parallel_time, parallel = measure(lambda: Lexer(source).tokenize_parallel(workers), repeat=1)
+    if list(sequential) != list(parallel):
+        raise AssertionError("Parallel lexing differs from Lexer.tokenize")
+    print(f"parallel lexing: {len(sequential)} tokens, {workers} worker(s)")
+    print(f"  sequential: {len(sequential) / sequential_time:12,.0f} tokens/s ({sequential_time:.3f}s)")
+    print(f"  parallel:   {len(parallel) / parallel_time:12,.0f} tokens/s ({parallel_time:.3f}s)")
+
+
+def count_statements(statements):
+    """Count statements in a parsed program, including those nested in blocks."""
+    total = 0
+    for statement in statements:
+        total += 1
+        for block in ('body', 'then_block', 'else_block'):
+            total += count_statements(getattr(statement, block, None) or [])
+        for _, block in getattr(statement, 'elif_blocks', None) or []:
+            total += count_statements(block)
+    return total
+
+
+def bench_parser(lines=100000):
+    """Report parse throughput over a large pre-lexed corpus."""
+    source = generate_source(lines)
+    tokens = Lexer(source).tokenize()
+    parse_time, ast = measure(lambda: Parser(tokens).parse())
+    statements = count_statements(ast)
+    print(f"parser: {source.count(chr(10))} lines, {len(tokens)} tokens, {statements} statements")
+    print(f"  {len(tokens) / parse_time:12,.0f} tokens/s")
+    print(f"  {statements / parse_time:12,.0f} statements/s ({parse_time:.3f}s)")
+
+
+def bench_expressions(operators=100000, nesting=200):
+    """Report parse speed for one very long operator chain and for deeply parenthesized expressions."""
+    operator_cycle = ['+', '*', '-', '/', '<', ':&', ':|', ':!']
+    chain = 'integer x : 1 ' + ' '.join(f'{operator_cycle[i % len(operator_cycle)]} {i % 97 + 1}' for i in range(operators))
+    nested = '\n'.join(f"integer y{i} : {'(' * nesting}1{' + 2)' * nesting}" for i in range(100))
+    for label, source in (('long chain', chain), ('nested', nested)):
+        tokens = Lexer(source).tokenize()
+        parse_time, _ = measure(lambda: Parser(tokens).parse())
+        print(f"expressions ({label}): {len(tokens)} tokens in {parse_time * 1000:.1f} ms, {len(tokens) / parse_time:12,.0f} tokens/s")
+
+
+def retained_memory(function, *args):
+    """Run function with stdout silenced and return (bytes still allocated afterwards, result)."""
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        tracemalloc.start()
+        try:
+            result = function(*args)
+            current = tracemalloc.get_traced_memory()[0]
+        finally:
+            tracemalloc.stop()
+    return current, result
+
+
+def bench_ast_memory(lines=20000):
+    """Report memory per node for the object AST and the flat array AST."""
+    tokens = Lexer(generate_source(lines)).tokenize()
+    tree_bytes, ast = retained_memory(lambda: Parser(tokens).parse())
+    flat_bytes, flat = retained_memory(FlatAST.from_nodes, ast)
+    nodes = len(flat)
+    print(f"ast memory: {nodes} nodes")
+    print(f"  node objects: {tree_bytes / 1024:10,.0f} KiB, {tree_bytes / nodes:6.1f} bytes/node")
+    print(f"  flat arrays:  {flat_bytes / 1024:10,.0f} KiB, {flat_bytes / nodes:6.1f} bytes/node")
+
+
+def bench_cache(lines=20000):
+    """Compare a cold compile with loading the same program from the on-disk cache."""
+    source = generate_source(lines)
+    with tempfile.TemporaryDirectory() as directory:
+        cache = ProgramCache(directory)
+        cold_time, ast = measure(lambda: Parser(Lexer(source).tokenize()).parse())
+        cache.put(source, ast)
+        warm_time, nodes = measure(lambda: cache.get(source).to_nodes())
+        if repr(nodes) != repr(ast):
+            raise AssertionError("Cached program differs from a fresh parse")
+        size = os.path.getsize(cache.path(cache.digest(source)))
+    print(f"cache: {source.count(chr(10))} lines, {size / 1024:,.0f} KiB on disk")
+    print(f"  lex + parse:  {cold_time * 1000:8.1f} ms")
+    print(f"  cached load:  {warm_time * 1000:8.1f} ms")
+    print(f"  speedup: {cold_time / warm_time:.1f}x")
+
+
+def bench_parse_cache(lines=10000):
+    """Time re-parsing a buffer after a one-line edit, with and without the ParseCache."""
+    source = generate_source(lines)
+    cache = ParseCache()
+    cache.parse(source)
+    edited = source.replace('integer counter : 10', 'integer counter : 11', 1)
+    full_time, ast = measure(lambda: Parser(Lexer(edited).tokenize()).parse())
+    hits, misses = cache.hits, cache.misses
+    cached_time, cached = measure(cache.parse, edited, repeat=1)
+    if repr(cached) != repr(ast):
+        raise AssertionError("ParseCache result differs from a full parse")
+    print(f"parse cache: one-line edit in {source.count(chr(10))} lines, "
+          f"{cache.hits - hits} hits, {cache.misses - misses} misses, {cache.size / 1024:,.0f} KiB cached")
+    print(f"  full parse:  {full_time * 1000:8.1f} ms")
+    print(f"  cached:      {cached_time * 1000:8.1f} ms")
+
+
+def bench_engines(engines=None):
+    """Time each execution engine on the loop-heavy program, parsing excluded."""
+    ast = Parser(Lexer(LOOP_PROGRAM).tokenize()).parse()
+    engines = engines or list(ENGINES)
+    baseline, expected = measure(run_program, ast, 'tree')
+    print(f"engines: loop program, tree-walker {baseline * 1000:.1f} ms")
+    for engine in engines:
+        elapsed, result = measure(run_program, ast, engine)
+        if result != expected:
+            raise AssertionError(f"Engine {engine} differs from the tree-walker")
+        print(f"  {engine:<8} {elapsed * 1000:8.1f} ms  {baseline / elapsed:5.1f}x")
+
+def bench_optimizer(engines=None):
+    """Time each engine on programs the optimizer's passes target, as parsed and optimized.
+
+    The optimized timing includes running the optimizer itself.
+    """
+    programs = (
+        ('constant-bounds', CONSTANT_PROGRAM),
+        ('loop-invariant', INVARIANT_PROGRAM),
+        ('repeated-subexpression', REPEATED_PROGRAM),
+        ('indexed-array', INDEXED_PROGRAM),
+    )
+    for label, source in programs:
+        ast = Parser(Lexer(source).tokenize()).parse()
+        print(f"optimizer: {label} program")
+        for engine in engines or list(ENGINES):
+            plain, expected = measure(run_program, ast, engine)
+            optimized, result = measure(run_program, ast, engine, True)
+            if result != expected:
+                raise AssertionError(f"Optimized program differs under engine {engine}")
+            print(f"  {engine:<8} {plain * 1000:8.1f} ms -> {optimized * 1000:8.1f} ms  {plain / optimized:5.1f}x")
+
+
+def bench_output(rounds=(2000, 8000, 32000)):
+    """Compare the tree-walker returning its output with writing it to a sink, as the output grows."""
+    print("output: tree-walker, results returned -> streamed to a sink")
+    for count in rounds:
+        ast = Parser(Lexer(OUTPUT_PROGRAM.replace('ROUNDS', str(count))).tokenize()).parse()
+        with open(os.devnull, 'w') as devnull:
+            returned_time, expected = measure(run_program, ast)
+            streamed_time, _ = measure(run_program, ast, 'tree', False, StreamSink(devnull))
+            returned_peak, _ = peak_memory(run_program, ast)
+            streamed_peak, _ = peak_memory(run_program, ast, 'tree', False, StreamSink(devnull))
+        print(f"  {len(expected) / 1024:8,.0f} KiB output: {returned_time * 1000:7.1f} ms -> {streamed_time * 1000:7.1f} ms,"
+              f" peak {returned_peak / 1024:8,.0f} KiB -> {streamed_peak / 1024:6,.0f} KiB")
+
+
+BENCHMARKS = {
+    'lexer': bench_lexer,
+    'token-memory': bench_token_memory,
+    'incremental': bench_incremental,
+    'parallel': bench_parallel,
+    'parser': bench_parser,
+    'expressions': bench_expressions,
+    'ast-memory': bench_ast_memory,
+    'cache': bench_cache,
+    'parse-cache': bench_parse_cache,
+    'engines': bench_engines,
+    'optimizer': bench_optimizer,
+    'output': bench_output,
+}
+
+if __name__ == "__main__":
+    selected = sys.argv[1:] or list(BENCHMARKS)
+    for name in selected:
+        BENCHMARKS[name]()
@@ -0,0 +1,749 @@
+import operator
+from array import array
+
+from ast import (
+    ArrayAccessNode,
+    ArrayAssignNode,
+    ArrayDeclarationNode,
+    AssignNode,
+    BinaryOperatorNode,
+    CharacterNode,
+    DecrementNode,
+    DoWhileNode,
+    DoubleNode,
+    ForLoopNode,
+    IfNode,
+    IncrementNode,
+    NumberNode,
+    OutputNode,
+    ResetNode,
+    StringLiteralNode,
+    VariableAccessNode,
+    VariableDeclarationNode,
+    WhileLoopNode,
+)
+from output import MemorySink, ResultCollector, ResultWriter
+from resolver import UNSET, resolve
+
+# Opcodes. Every instruction is two ints in the code array, the opcode and
+# its argument, which is 0 when an instruction takes none. Jump targets are
+# instruction numbers, and variables are named by their frame slot, an index
+# into variables. Opcodes are numbered roughly by how often loops run
+# them, which is also the order the VM tests them in.
+LOAD_NAME = 0  # push the variable in slot arg, or fail with "Undefined variable"
+LOAD_CONST = 1  # push constants[arg]
+BINARY_CONST = 2  # replace the top with BINARY_FUNCTIONS[arg & 15](top, constants[arg >> 4])
+BINARY_NAME = 3  # as BINARY_CONST, with the variable in slot arg >> 4 as right operand
+BINARY = 4  # pop right and left; push BINARY_FUNCTIONS[arg](left, right)
+JUMP_IF_FALSE = 5  # pop; continue at arg if falsy
+JUMP_IF_TRUE = 6  # pop; continue at arg if truthy
+JUMP = 7  # continue at arg
+INCREMENT_NAME = 8  # add 1 to the variable in slot arg
+DECREMENT_NAME = 9
+ASSIGN_STATEMENT = 10  # pop a value into slot arg; write the assignment message as a result
+DECLARE_STATEMENT = 11  # as ASSIGN_STATEMENT, with the declaration message
+OUTPUT_STATEMENT = 12  # pop a value and write it as a result, as a string
+STATEMENT_RESULT = 13  # pop a statement's value and write it as a result unless it is None
+BEGIN_RESULTS_STATEMENT = 14  # open a compound statement's block in the result writer
+END_RESULTS_STATEMENT = 15  # close the block opened by BEGIN_RESULTS_STATEMENT
+FOR_ITER = 16  # store the next value of the iterator on top in slot arg and skip the next instruction, or pop it
+LOAD_RAW = 17  # push the variable in slot arg, failing with a plain KeyError like environment[name]
+SUBSCRIPT = 18  # pop index and array; push array[index]
+LOAD_ARRAY = 19  # push the variable in slot arg, or None, like environment.get(name)
+STORE_ITEM = 20  # pop value, index and array (slot arg) and store with a bounds check
+INCREMENT_ITEM = 21  # pop index and array; add 1 to array[index]
+DECREMENT_ITEM = 22
+JUMP_IF_FALSE_OR_POP = 23  # if the top is falsy continue at arg, keeping it, else pop it
+JUMP_IF_TRUE_OR_POP = 24  # if the top is truthy continue at arg, keeping it, else pop it
+NEGATE = 25
+NOT = 26
+TO_STRING = 27
+ASSIGN = 28  # pop a value into slot arg; push the assignment message
+DECLARE = 29  # as ASSIGN, with the declaration message
+DECLARE_ARRAY = 30  # as DECLARE, for an array
+DECLARE_ARRAY_STATEMENT = 31
+BUILD_LIST = 32  # pop arg values into a new list
+FOR_RANGE = 33  # pop end and start; push an iterator over range(start, end)
+END_RESULTS = 34  # finish collecting and push the results joined with newlines, restoring the writer
+LOAD_FUNCTION = 35  # push the builtin function names[arg]
+CALL = 36  # pop arg arguments and a function; push its result
+FAIL = 37  # raise Exception(constants[arg])
+LOAD_TEMPORARY = 38  # push the temporary in slot arg and continue, or if it is unset skip the next instruction
+STORE_TEMPORARY = 39  # store the top in slot arg, keeping it
+RESET = 40  # unset the temporaries in the slots listed by constants[arg]
+HALT = 41  # stop
+STORE_ITEM_UNCHECKED = 42  # pop value and index and store them in the array in slot arg, unchecked
+BEGIN_RESULTS = 43  # start collecting statement results for a compound statement used as a value
+
+# Superinstructions. They never appear in a code array: VM.decode() fuses
+# them from the common sequences named in their comments.
+NAME_BINARY_CONST = 44  # LOAD_NAME, BINARY_CONST
+NAME_BINARY_NAME = 45  # LOAD_NAME, BINARY_NAME
+LOAD_ITEM_CONST = 46  # LOAD_RAW, LOAD_CONST, SUBSCRIPT
+INCREMENT_ITEM_CONST = 47  # LOAD_RAW, LOAD_CONST, INCREMENT_ITEM
+DECREMENT_ITEM_CONST = 48  # LOAD_RAW, LOAD_CONST, DECREMENT_ITEM
+COMPARE_CONST_JUMP_IF_FALSE = 49  # LOAD_NAME, BINARY_CONST, JUMP_IF_FALSE
+COMPARE_CONST_JUMP_IF_TRUE = 50  # LOAD_NAME, BINARY_CONST, JUMP_IF_TRUE
+
+OPCODE_NAMES = {value: name for name, value in globals().items() if name.isupper() and isinstance(value, int)}
+
+# The BINARY opcodes' operator numbers index these tables.
+BINARY_OPERATORS = ('PLUS', 'MINUS', 'MULTIPLY', 'DIVIDE', 'EQUAL', 'NOT_EQUAL', 'GREATER', 'LESS', 'GREATER_EQUAL', 'LESS_EQUAL')
+BINARY_FUNCTIONS = (
+    operator.add, operator.sub, operator.mul, operator.truediv, operator.eq,
+    operator.ne, operator.gt, operator.lt, operator.ge, operator.le,
+)
+BINARY_INDEX = {name: index for index, name in enumerate(BINARY_OPERATORS)}
+
+UNARY_OPCODES = {'NEGATE': NEGATE, 'NOT': NOT}
+
+# Statements whose code ends in one of these write their value as a result
+# directly. Only the node types in SELF_TERMINATED qualify: their last
+# instruction is always their own, so no jump inside them lands after it.
+SELF_TERMINATED = (
+    VariableDeclarationNode, AssignNode, ArrayDeclarationNode, OutputNode,
+    IfNode, WhileLoopNode, DoWhileNode, ForLoopNode,
+)
+STATEMENT_FORMS = {
+    ASSIGN: ASSIGN_STATEMENT,
+    DECLARE: DECLARE_STATEMENT,
+    DECLARE_ARRAY: DECLARE_ARRAY_STATEMENT,
+    TO_STRING: OUTPUT_STATEMENT,
+    END_RESULTS: END_RESULTS_STATEMENT,
+}
+
+# Opcodes whose argument is a variable's slot
+SLOT_OPCODES = frozenset((
+    LOAD_NAME, INCREMENT_NAME, DECREMENT_NAME, ASSIGN_STATEMENT, DECLARE_STATEMENT,
+    FOR_ITER, LOAD_RAW, LOAD_ARRAY, STORE_ITEM, ASSIGN, DECLARE, DECLARE_ARRAY,
+    DECLARE_ARRAY_STATEMENT, LOAD_TEMPORARY, STORE_TEMPORARY, STORE_ITEM_UNCHECKED,
+))
+
+ARRAY_FUSIONS = {
+    SUBSCRIPT: LOAD_ITEM_CONST,
+    INCREMENT_ITEM: INCREMENT_ITEM_CONST,
+    DECREMENT_ITEM: DECREMENT_ITEM_CONST,
+}
+
+LITERALS = (NumberNode, StringLiteralNode, CharacterNode, DoubleNode)
+
+# Statements the tree-walker evaluates to None, which therefore add nothing
+# to their block's results.
+VALUELESS = (IncrementNode, DecrementNode, ArrayAssignNode, ResetNode)
+
+class CodeObject:
+    """A compiled program: instructions plus the tables their arguments index.
+
+    names holds the builtin functions the program calls and variables the
+    variable in each frame slot.
+    """
+    def __init__(self, code, constants, names, variables=()):
+        self.code = code
+        self.constants = constants
+        self.names = names
+        self.variables = variables
+        self._decoded = None
+
+    def __len__(self):
+        return len(self.code) // 2
+
+    def instructions(self):
+        """Yield (opcode, argument) pairs."""
+        code = self.code
+        for position in range(0, len(code), 2):
+            yield code[position], code[position + 1]
+
+    def disassemble(self):
+        """Return a readable listing, one instruction per line."""
+        lines = []
+        for number, (op, arg) in enumerate(self.instructions()):
+            if op in (LOAD_CONST, FAIL):
+                detail = repr(self.constants[arg])
+            elif op == BINARY:
+                detail = BINARY_OPERATORS[arg]
+            elif op == BINARY_CONST:
+                detail = f"{BINARY_OPERATORS[arg & 15]} {self.constants[arg >> 4]!r}"
+            elif op == BINARY_NAME:
+                detail = f"{BINARY_OPERATORS[arg & 15]} {self.variables[arg >> 4]}"
+            elif op in SLOT_OPCODES:
+                detail = self.variables[arg]
+            elif op == RESET:
+                detail = ', '.join(self.variables[slot] for slot in self.constants[arg])
+            elif op == LOAD_FUNCTION:
+                detail = self.names[arg]
+            else:
+                detail = str(arg) if arg else ''
+            lines.append(f"{number:6} {OPCODE_NAMES[op]:<24}{detail}")
+        return '\n'.join(lines)
+
+class Compiler:
+    """Compiles a list of AST nodes into a CodeObject for the VM.
+
+    Each node compiles to code that pushes exactly the value Interpreter.visit
+    would return for it, so the VM reproduces the tree-walker's results,
+    including the newline-joined results of loops and if statements.
+    """
+    def __init__(self):
+        self.code = array('i')
+        self.constants = []
+        self.names = []
+        self.scope = None
+        self._constant_index = {}
+        self._name_index = {}
+
+    def compile(self, statements):
+        self.scope = resolve(statements)
+        self.block(statements)
+        self.emit(HALT)
+        return CodeObject(self.code, self.constants, self.names, self.scope.names)
+
+    def emit(self, op, arg=0):
+        """Append an instruction and return its number."""
+        self.code.append(op)
+        self.code.append(arg)
+        return len(self.code) // 2 - 1
+
+    def here(self):
+        """The number of the next instruction to be emitted."""
+        return len(self.code) // 2
+
+    def patch(self, number, target=None):
+        """Point the jump numbered number at target, by default the next instruction."""
+        self.code[number * 2 + 1] = self.here() if target is None else target
+
+    def constant(self, value):
+        key = (type(value), value)  # Keep 1, 1.0 and True apart
+        index = self._constant_index.get(key)
+        if index is None:
+            index = self._constant_index[key] = len(self.constants)
+            self.constants.append(value)
+        return index
+
+    def name(self, name):
+        index = self._name_index.get(name)
+        if index is None:
+            index = self._name_index[name] = len(self.names)
+            self.names.append(name)
+        return index
+
+    def slot(self, name):
+        return self.scope.declare(name)
+
+    def fail(self, message):
+        self.emit(FAIL, self.constant(message))
+
+    def statement(self, node):
+        """Compile a statement whose value, unless None, joins its block's results."""
+        first = len(self.code)
+        self.node(node)
+        if isinstance(node, VALUELESS):
+            return
+        last = len(self.code) - 2
+        statement_form = STATEMENT_FORMS.get(self.code[last]) if isinstance(node, SELF_TERMINATED) else None
+        if statement_form is None:
+            self.emit(STATEMENT_RESULT)
+        else:
+            self.code[last] = statement_form
+            if statement_form == END_RESULTS_STATEMENT:
+                # Compound statements start with their BEGIN_RESULTS
+                self.code[first] = BEGIN_RESULTS_STATEMENT
+
+    def block(self, statements):
+        for statement in statements:
+            self.statement(statement)
+
+    def expression(self, node):
+        """Compile a node that must leave its value on the stack."""
+        self.node(node)
+        if isinstance(node, VALUELESS):
+            self.emit(LOAD_CONST, self.constant(None))
+
+    def node(self, node):
+        method = getattr(self, 'compile_' + type(node).__name__, None)
+        if method is None:
+            self.fail(f'No visit_{type(node).__name__} method')
+        else:
+            method(node)
+
+    # Literals and variables
+
+    def compile_NumberNode(self, node):
+        self.emit(LOAD_CONST, self.constant(node.value))
+
+    compile_StringLiteralNode = compile_CharacterNode = compile_DoubleNode = compile_NumberNode
+
+    def compile_VariableAccessNode(self, node):
+        self.emit(LOAD_NAME, self.slot(node.identifier))
+
+    def compile_VariableDeclarationNode(self, node):
+        self.expression(node.expression)
+        self.emit(DECLARE, self.slot(node.name))
+
+    def compile_AssignNode(self, node):
+        self.expression(node.expression)
+        self.emit(ASSIGN, self.slot(node.name))
+
+    def compile_ArrayDeclarationNode(self, node):
+        for element in node.elements:
+            self.expression(element)
+        self.emit(BUILD_LIST, len(node.elements))
+        self.emit(DECLARE_ARRAY, self.slot(node.name))
+
+    def compile_ArrayAccessNode(self, node):
+        self.emit(LOAD_RAW, self.slot(node.name))
+        self.expression(node.index)
+        self.emit(SUBSCRIPT)
+
+    def compile_ArrayAssignNode(self, node):
+        name = self.slot(node.array_name)
+        self.emit(LOAD_ARRAY, name)
+        self.expression(node.index)
+        self.expression(node.value)
+        self.emit(STORE_ITEM, name)
+
+    # The optimizer proved these in bounds on a defined array
+    compile_UncheckedArrayAccessNode = compile_ArrayAccessNode
+
+    def compile_UncheckedArrayAssignNode(self, node):
+        self.expression(node.index)
+        self.expression(node.value)
+        self.emit(STORE_ITEM_UNCHECKED, self.slot(node.array_name))
+
+    def compile_IncrementNode(self, node, name_op=INCREMENT_NAME, item_op=INCREMENT_ITEM):
+        if isinstance(node.identifier, ArrayAccessNode):
+            self.emit(LOAD_RAW, self.slot(node.identifier.name))
+            self.expression(node.identifier.index)
+            self.emit(item_op)
+        else:
+            self.emit(name_op, self.slot(node.identifier))
+
+    def compile_DecrementNode(self, node):
+        self.compile_IncrementNode(node, DECREMENT_NAME, DECREMENT_ITEM)
+
+    def compile_TemporaryNode(self, node):
+        # A set temporary is pushed and the JUMP skips its expression; an
+        # unset one skips the JUMP, so the expression runs and is stored.
+        slot = self.slot(node.name)
+        self.emit(LOAD_TEMPORARY, slot)
+        to_end = self.emit(JUMP)
+        self.expression(node.expression)
+        self.emit(STORE_TEMPORARY, slot)
+        self.patch(to_end)
+
+    def compile_ResetNode(self, node):
+        if node.names:
+            self.emit(RESET, self.constant(tuple(self.slot(name) for name in node.names)))
+
+    # Operators
+
+    def compile_BinaryOperatorNode(self, node):
+        if node.operator in ('AND', 'OR'):
+            self.expression(node.left)
+            jump = self.emit(JUMP_IF_FALSE_OR_POP if node.operator == 'AND' else JUMP_IF_TRUE_OR_POP)
+            self.expression(node.right)
+            self.patch(jump)
+            return
+        self.expression(node.left)
+        index = BINARY_INDEX.get(node.operator)
+        right = node.right
+        if index is not None and type(right) in LITERALS:
+            self.emit(BINARY_CONST, self.constant(right.value) << 4 | index)
+        elif index is not None and type(right) is VariableAccessNode:
+            self.emit(BINARY_NAME, self.slot(right.identifier) << 4 | index)
+        else:
+            self.expression(right)
+            if index is None:
+                self.fail(f"Unsupported operator {node.operator}")
+            else:
+                self.emit(BINARY, index)
+
+    compile_IntegerOperatorNode = compile_DoubleOperatorNode = compile_BinaryOperatorNode
+
+    def compile_ConcatenateNode(self, node):
+        self.compile_BinaryOperatorNode(BinaryOperatorNode(node.left, 'PLUS', node.right))
+
+    def compile_UnaryOperatorNode(self, node):
+        self.expression(node.operand)
+        op = UNARY_OPCODES.get(node.operator)
+        if op is None:
+            self.fail(f"Unsupported operator {node.operator}")
+        else:
+            self.emit(op)
+
+    def compile_OutputNode(self, node):
+        self.expression(node.value)
+        self.emit(TO_STRING)
+
+    def compile_FunctionCallNode(self, node):
+        self.emit(LOAD_FUNCTION, self.name(node.function_name))
+        for argument in node.arguments:
+            self.expression(argument)
+        self.emit(CALL, len(node.arguments))
+
+    # Compound statements
+
+    def compile_IfNode(self, node):
+        self.emit(BEGIN_RESULTS)
+        self.expression(node.condition)
+        to_else = self.emit(JUMP_IF_FALSE)
+        self.block(node.then_block)
+        if node.elif_blocks or node.else_block:
+            to_end = self.emit(JUMP)
+            self.patch(to_else)
+            # As in the tree-walker, the else block runs whenever the if
+            # condition was false, even after an else_if block has run.
+            to_else_block = []
+            for condition, block in node.elif_blocks or ():
+                self.expression(condition)
+                to_next = self.emit(JUMP_IF_FALSE)
+                self.block(block)
+                to_else_block.append(self.emit(JUMP))
+                self.patch(to_next)
+            for jump in to_else_block:
+                self.patch(jump)
+            self.block(node.else_block or ())
+            self.patch(to_end)
+        else:
+            self.patch(to_else)
+        self.emit(END_RESULTS)
+
+    def compile_WhileLoopNode(self, node):
+        # The condition is placed after the body, so each iteration ends in a
+        # single conditional jump back to the top.
+        self.emit(BEGIN_RESULTS)
+        to_condition = self.emit(JUMP)
+        top = self.here()
+        self.block(node.body)
+        self.patch(to_condition)
+        self.expression(node.condition)
+        self.emit(JUMP_IF_TRUE, top)
+        self.emit(END_RESULTS)
+
+    def compile_DoWhileNode(self, node):
+        self.emit(BEGIN_RESULTS)
+        top = self.here()
+        self.block(node.body)
+        self.expression(node.condition)
+        self.emit(JUMP_IF_TRUE, top)
+        self.emit(END_RESULTS)
+
+    def compile_ForLoopNode(self, node):
+        name = self.slot(node.identifier)
+        self.emit(BEGIN_RESULTS)
+        self.emit(LOAD_RAW, name)
+        self.expression(node.end_value)
+        self.emit(FOR_RANGE)
+        top = self.emit(FOR_ITER, name)
+        to_end = self.emit(JUMP)
+        self.block(node.body)
+        self.emit(JUMP, top)
+        self.patch(to_end)
+        self.emit(END_RESULTS)
+
+def compile_program(statements):
+    """Compile parsed statements into a CodeObject."""
+    return Compiler().compile(statements)
+
+class VM:
+    """A stack machine that runs CodeObjects.
+
+    decode() turns the code array into a list of (opcode, a, b) tuples with
+    constants, names and operator functions already looked up, fusing common
+    pairs into superinstructions. execute() is a single dispatch loop over
+    that list, handing each result to an output.ResultWriter as it is
+    produced. Variables live in a list frame indexed by the slots the
+    resolver gave them; a slot still holding UNSET was never assigned. The VM
+    emits no trace messages; trace with the 'tree' engine.
+    """
+    def __init__(self, namespace=None):
+        self.namespace = namespace if namespace is not None else {}
+        self.frame = None
+
+    @staticmethod
+    def decode(code_object):
+        if code_object._decoded is not None:
+            return code_object._decoded
+        constants = code_object.constants
+        names = code_object.names
+        variables = code_object.variables
+        decoded = []
+        for op, arg in code_object.instructions():
+            if op == LOAD_CONST or op == FAIL or op == RESET:
+                decoded.append((op, constants[arg], None))
+            elif op == BINARY:
+                decoded.append((op, BINARY_FUNCTIONS[arg], None))
+            elif op == BINARY_CONST:
+                decoded.append((op, BINARY_FUNCTIONS[arg & 15], constants[arg >> 4]))
+            elif op == BINARY_NAME:
+                decoded.append((op, BINARY_FUNCTIONS[arg & 15], arg >> 4))
+            elif op in SLOT_OPCODES:
+                decoded.append((op, arg, variables[arg]))
+            elif op == LOAD_FUNCTION:
+                decoded.append((op, names[arg], None))
+            else:
+                decoded.append((op, arg, None))
+        # A fused instruction replaces the first of its sequence and skips the
+        # rest, which stay in place since a jump may still land on them.
+        for number in range(len(decoded) - 1):
+            op, a, _ = decoded[number]
+            next_op, next_a, next_b = decoded[number + 1]
+            if op == LOAD_NAME and next_op == BINARY_CONST:
+                jump_op, target, _ = decoded[number + 2] if number + 2 < len(decoded) else (None, None, None)
+                if jump_op == JUMP_IF_FALSE:
+                    decoded[number] = (COMPARE_CONST_JUMP_IF_FALSE, a, (next_a, next_b, target))
+                elif jump_op == JUMP_IF_TRUE:
+                    decoded[number] = (COMPARE_CONST_JUMP_IF_TRUE, a, (next_a, next_b, target))
+                else:
+                    decoded[number] = (NAME_BINARY_CONST, a, (next_a, next_b))
+            elif op == LOAD_NAME and next_op == BINARY_NAME:
+                decoded[number] = (NAME_BINARY_NAME, a, (next_a, next_b))
+            elif op == LOAD_TEMPORARY and next_op == JUMP:
+                decoded[number] = (LOAD_TEMPORARY, a, next_a)
+            elif op == LOAD_RAW and next_op == LOAD_CONST and number + 2 < len(decoded):
+                fused = ARRAY_FUSIONS.get(decoded[number + 2][0])
+                if fused is not None:
+                    decoded[number] = (fused, a, next_a)
+        code_object._decoded = decoded
+        return decoded
+
+    def run(self, code_object, sink=None):
+        """Run a program, writing its results to sink, or returning them as Interpreter.interpret would if None."""
+        memory = MemorySink() if sink is None else None
+        try:
+            self.execute(code_object, ResultWriter(sink or memory))
+        finally:
+            (sink or memory).flush()
+        if memory is not None:
+            return memory.getvalue()[:-1]
+
+    def execute(self, code_object, writer):
+        code = self.decode(code_object)
+        variables = code_object.variables
+        frame = self.frame = [UNSET] * len(variables)
+        stack = []
+        push = stack.append
+        pop = stack.pop
+        outer_writers = []  # writers replaced by the collector of a compound statement used as a value
+        pc = 0
+        while True:
+            op, a, b = code[pc]
+            pc += 1
+            if op == COMPARE_CONST_JUMP_IF_TRUE:
+                left = frame[a]
+                if left is UNSET:
+                    raise Exception(f"Undefined variable {variables[a]}")
+                function, right, target = b
+                pc = target if function(left, right) else pc + 2
+            elif op == COMPARE_CONST_JUMP_IF_FALSE:
+                left = frame[a]
+                if left is UNSET:
+                    raise Exception(f"Undefined variable {variables[a]}")
+                function, right, target = b
+                pc = pc + 2 if function(left, right) else target
+            elif op == NAME_BINARY_CONST:
+                left = frame[a]
+                if left is UNSET:
+                    raise Exception(f"Undefined variable {variables[a]}")
+                push(b[0](left, b[1]))
+                pc += 1
+            elif op == LOAD_NAME:
+                value = frame[a]
+                if value is UNSET:
+                    raise Exception(f"Undefined variable {b}")
+                push(value)
+            elif op == LOAD_CONST:
+                push(a)
+            elif op == BINARY_CONST:
+                stack[-1] = a(stack[-1], b)
+            elif op == NAME_BINARY_NAME:
+                left = frame[a]
+                if left is UNSET:
+                    raise Exception(f"Undefined variable {variables[a]}")
+                right = frame[b[1]]
+                if right is UNSET:
+                    raise Exception(f"Undefined variable {variables[b[1]]}")
+                push(b[0](left, right))
+                pc += 1
+            elif op == BINARY_NAME:
+                right = frame[b]
+                if right is UNSET:
+                    raise Exception(f"Undefined variable {variables[b]}")
+                stack[-1] = a(stack[-1], right)
+            elif op == BINARY:
+                right = pop()
+                stack[-1] = a(stack[-1], right)
+            elif op == LOAD_TEMPORARY:
+                # Decoded with the target of the JUMP that follows it
+                value = frame[a]
+                if value is UNSET:
+                    pc += 1
+                else:
+                    push(value)
+                    pc = b
+            elif op == STORE_TEMPORARY:
+                frame[a] = stack[-1]
+            elif op == JUMP_IF_FALSE:
+                if not pop():
+                    pc = a
+            elif op == JUMP_IF_TRUE:
+                if pop():
+                    pc = a
+            elif op == JUMP:
+                pc = a
+            elif op == RESET:
+                for slot in a:
+                    frame[slot] = UNSET
+            elif op == INCREMENT_NAME:
+                value = frame[a]
+                if value is UNSET:
+                    raise KeyError(b)
+                value += 1  # In place, as the tree-walker does, so a type error reads the same
+                frame[a] = value
+            elif op == DECREMENT_NAME:
+                value = frame[a]
+                if value is UNSET:
+                    raise KeyError(b)
+                value -= 1  # In place, as the tree-walker does, so a type error reads the same
+                frame[a] = value
+            elif op == ASSIGN_STATEMENT:
+                value = frame[a] = pop()
+                writer.result(f"Variable {b} assigned value {value}")
+            elif op == DECLARE_STATEMENT:
+                value = frame[a] = pop()
+                writer.result(f"Variable '{b}' set to {value}")
+            elif op == OUTPUT_STATEMENT:
+                writer.result(str(pop()))
+            elif op == STATEMENT_RESULT:
+                value = pop()
+                if value is not None:
+                    writer.result(value)
+            elif op == BEGIN_RESULTS_STATEMENT:
+                writer.open()
+            elif op == END_RESULTS_STATEMENT:
+                writer.close()
+            elif op == LOAD_ITEM_CONST:
+                array = frame[a]
+                if array is UNSET:
+                    raise KeyError(variables[a])
+                push(array[b])
+                pc += 2
+            elif op == STORE_ITEM_UNCHECKED:
+                value = pop()
+                frame[a][pop()] = value
+            elif op == INCREMENT_ITEM_CONST:
+                array = frame[a]
+                if array is UNSET:
+                    raise KeyError(variables[a])
+                array[b] += 1
+                pc += 2
+            elif op == FOR_ITER:
+                value = next(stack[-1], _DONE)
+                if value is _DONE:
+                    pop()
+                else:
+                    frame[a] = value
+                    pc += 1
+            elif op == LOAD_RAW:
+                value = frame[a]
+                if value is UNSET:
+                    raise KeyError(b)
+                push(value)
+            elif op == SUBSCRIPT:
+                index = pop()
+                stack[-1] = stack[-1][index]
+            elif op == LOAD_ARRAY:
+                value = frame[a]
+                push(None if value is UNSET else value)
+            elif op == STORE_ITEM:
+                value = pop()
+                index = pop()
+                array = pop()
+                if array is not None and 0 <= index < len(array):
+                    array[index] = value
+                else:
+                    raise Exception(f"Array assignment out of bounds or array '{b}' not defined")
+            elif op == INCREMENT_ITEM:
+                index = pop()
+                pop()[index] += 1
+            elif op == DECREMENT_ITEM:
+                index = pop()
+                pop()[index] -= 1
+            elif op == DECREMENT_ITEM_CONST:
+                array = frame[a]
+                if array is UNSET:
+                    raise KeyError(variables[a])
+                array[b] -= 1
+                pc += 2
+            elif op == JUMP_IF_FALSE_OR_POP:
+                if stack[-1]:
+                    pop()
+                else:
+                    pc = a
+            elif op == JUMP_IF_TRUE_OR_POP:
+                if stack[-1]:
+                    pc = a
+                else:
+                    pop()
+            elif op == NEGATE:
+                stack[-1] = -stack[-1]
+            elif op == NOT:
+                stack[-1] = not stack[-1]
+            elif op == TO_STRING:
+                stack[-1] = str(stack[-1])
+            elif op == ASSIGN:
+                value = frame[a] = pop()
+                push(f"Variable {b} assigned value {value}")
+            elif op == DECLARE:
+                value = frame[a] = pop()
+                push(f"Variable '{b}' set to {value}")
+            elif op == DECLARE_ARRAY:
+                value = frame[a] = pop()
+                push(f"Array '{b}' set to {value}")
+            elif op == DECLARE_ARRAY_STATEMENT:
+                value = frame[a] = pop()
+                writer.result(f"Array '{b}' set to {value}")
+            elif op == BUILD_LIST:
+                values = stack[len(stack) - a:]
+                del stack[len(stack) - a:]
+                push(values)
+            elif op == FOR_RANGE:
+                end_value = pop()
+                stack[-1] = iter(range(stack[-1], end_value))
+            elif op == END_RESULTS:
+                writer.close()
+                push(writer.text())
+                writer = outer_writers.pop()
+            elif op == LOAD_FUNCTION:
+                function = self.namespace.get(a)
+                if not function:
+                    raise NameError(f"Function {a} not defined")
+                push(function)
+            elif op == CALL:
+                arguments = stack[len(stack) - a:]
+                del stack[len(stack) - a:]
+                stack[-1] = stack[-1](*arguments)
+            elif op == FAIL:
+                raise Exception(a)
+            elif op == BEGIN_RESULTS:
+                outer_writers.append(writer)
+                writer = ResultCollector()
+                writer.open()
+            elif op == HALT:
+                return
+            else:
+                raise Exception(f"Unknown opcode {op} at {pc - 1}")
+
+_DONE = object()  # Marks an exhausted FOR_ITER iterator
+
+if __name__ == "__main__":
+    from lexer import Lexer
+    from parser import Parser
+
+    code = '''integer total : 0
+for integer i : 0 to 5
+    total : total + i
+-> total
+'''
+    program = compile_program(Parser(Lexer(code).tokenize()).parse())
+    print(program.disassemble())
+    print(VM().run(program))
@@ -0,0 +1,362 @@
+import hashlib
+import importlib.util
+import marshal
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import threading
+import zlib
+from collections import OrderedDict
+
+from ast import NODE_TYPES, FlatAST, Node
+from lexer import Lexer
+from parser import Parser, SyntaxError
+
+# Bump whenever the lexer, parser, an optimizer pass or the transpiler would
+# build a different program from the same source. Changes to the node classes
+# themselves are picked up by the schema fingerprint below without a bump.
+COMPILER_VERSION = 3
+
+MAGIC = b'QZC\x02'
+
+# magic, source digest, compiler digest, a CRC-32, then the length of each
+# section and the encoded root. Sections follow the header, each padded to 4
+# bytes. The CRC covers the lengths, the root and everything after the header.
+HEADER = struct.Struct('=4s32s32sIIIIIi')
+LAYOUT = struct.Struct('=IIIIi')
+
+CODE_MAGIC = b'QZP\x01'
+
+# Like a .pyc: magic, the interpreter's bytecode magic number, source digest
+# and compiler digest, followed by the marshalled code object.
+CODE_HEADER = struct.Struct('=4s4s32s32s')
+
+def _compiler_digest():
+    schema = ';'.join(f"{node_type.__name__}({','.join(node_type._fields)})" for node_type in NODE_TYPES)
+    # Arrays are written in native layout, so a file from a machine with a
+    # different byte order or int size must count as stale too.
+    layout = f"{sys.byteorder} I{struct.calcsize('I')} i{struct.calcsize('i')}"
+    text = f"{COMPILER_VERSION}|{schema}|{layout}|{sys.version_info[:2]}"
+    return hashlib.sha256(text.encode()).digest()
+
+COMPILER_DIGEST = _compiler_digest()
+
+def _padding(size):
+    return -size % 4
+
+def default_directory():
+    """QUETZAL_CACHE_DIR if set, otherwise ~/.cache/quetzal."""
+    return os.environ.get('QUETZAL_CACHE_DIR') or os.path.join(os.path.expanduser('~'), '.cache', 'quetzal')
+
+class ProgramCache:
+    """Compiled programs on disk, one file per distinct source text.
+
+    A file is named after the SHA-256 of its source and holds the program's
+    FlatAST arrays as raw bytes plus its constants pool in marshal format.
+    Its header records the compiler digest; an entry written by a different
+    compiler version or node schema is stale, so it is treated as a miss and
+    overwritten by the next put(). Files are written to a temporary name and
+    renamed into place, so readers never see a partial entry.
+
+    For the 'python' engine the same source can also map to a .qzpyc file
+    holding the transpiled code object, which is also stale once Python's
+    bytecode magic number changes.
+
+    Every method takes an optimized flag: a program stored after running the
+    optimizer is a separate entry from the plain parse of the same source.
+    """
+    def __init__(self, directory=None):
+        self.directory = directory or default_directory()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def digest(source, optimized=False):
+        prefix = b'\1' if optimized else b'\0'
+        return hashlib.sha256(prefix + source.encode('utf-8', 'surrogatepass')).digest()
+
+    def path(self, digest):
+        return os.path.join(self.directory, digest.hex() + '.qzc')
+
+    def get(self, source, optimized=False):
+        """Return the cached FlatAST for source, or None on a miss or stale entry."""
+        digest = self.digest(source, optimized)
+        flat = self._load(self.path(digest), digest)
+        if flat is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return flat
+
+    def put(self, source, statements, optimized=False):
+        """Store a parsed program for source and return it as a FlatAST."""
+        flat = statements if isinstance(statements, FlatAST) else FlatAST.from_nodes(statements)
+        digest = self.digest(source, optimized)
+        sections = [
+            bytes(flat.kinds),
+            bytes(flat.offsets),
+            bytes(flat.fields),
+            marshal.dumps(flat.constants),
+        ]
+        body = []
+        for section in sections:
+            body.append(section)
+            body.append(b'\0' * _padding(len(section)))
+        layout = LAYOUT.pack(*map(len, sections), flat.root)
+        checksum = zlib.crc32(layout)
+        for chunk in body:
+            checksum = zlib.crc32(chunk, checksum)
+        header = HEADER.pack(MAGIC, digest, COMPILER_DIGEST, checksum, *LAYOUT.unpack(layout))
+        self._write(self.path(digest), [header, b'\0' * _padding(HEADER.size)] + body)
+        return flat
+
+    def code_path(self, digest):
+        return os.path.join(self.directory, digest.hex() + '.qzpyc')
+
+    def get_code(self, source, optimized=False):
+        """Return the cached Python code object transpiled from source, or None on a miss or stale entry."""
+        digest = self.digest(source, optimized)
+        code = self._load_code(self.code_path(digest), digest)
+        if code is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return code
+
+    def put_code(self, source, code, optimized=False):
+        """Store a code object from transpiler.compile_python for source and return it."""
+        digest = self.digest(source, optimized)
+        header = CODE_HEADER.pack(CODE_MAGIC, importlib.util.MAGIC_NUMBER, digest, COMPILER_DIGEST)
+        self._write(self.code_path(digest), [header, marshal.dumps(code)])
+        return code
+
+    def _write(self, path, chunks):
+        os.makedirs(self.directory, exist_ok=True)
+        descriptor, temporary = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(descriptor, 'wb') as file:
+                for chunk in chunks:
+                    file.write(chunk)
+            os.replace(temporary, path)
+        except BaseException:
+            try:
+                os.unlink(temporary)
+            except OSError:
+                pass
+            raise
+
+    def _load_code(self, path, digest):
+        try:
+            with open(path, 'rb') as file:
+                data = file.read()
+        except OSError:
+            return None
+        if len(data) < CODE_HEADER.size:
+            return None
+        magic, python_magic, stored_digest, compiler = CODE_HEADER.unpack_from(data)
+        if (magic != CODE_MAGIC or python_magic != importlib.util.MAGIC_NUMBER
+                or stored_digest != digest or compiler != COMPILER_DIGEST):
+            return None
+        try:
+            return marshal.loads(data[CODE_HEADER.size:])
+        except (EOFError, ValueError, TypeError):  # Truncated or corrupt
+            return None
+
+    def _load(self, path, digest):
+        try:
+            with open(path, 'rb') as file:
+                data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):  # Missing, unreadable or empty
+            return None
+        view = memoryview(data)
+        if len(view) < HEADER.size:
+            return None
+        magic, stored_digest, compiler, checksum, *lengths, root = HEADER.unpack_from(view)
+        if magic != MAGIC or stored_digest != digest or compiler != COMPILER_DIGEST:
+            return None
+        start = position = HEADER.size + _padding(HEADER.size)
+        sections = []
+        for length in lengths:
+            sections.append(view[position:position + length])
+            position += length + _padding(length)
+        # Truncated, padded out or corrupt
+        if position != len(view) or zlib.crc32(view[start:], zlib.crc32(LAYOUT.pack(*lengths, root))) != checksum:
+            return None
+        kinds, offsets, fields, constants = sections
+        # The arrays are used in place as typed memoryviews over the mapping;
+        # only the constants pool is unpacked into objects.
+        try:
+            return FlatAST.from_arrays(
+                kinds,
+                offsets.cast('I'),
+                fields.cast('i'),
+                marshal.loads(constants),
+                root,
+            )
+        except (EOFError, ValueError, TypeError):  # Corrupt
+            return None
+
+    def clear(self):
+        """Delete every cache entry in the directory."""
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return
+        for name in names:
+            if name.endswith(('.qzc', '.qzpyc')):
+                os.unlink(os.path.join(self.directory, name))
+
+    def __repr__(self):
+        return f"ProgramCache({self.directory!r}, hits={self.hits}, misses={self.misses})"
+
+# Words that continue the statement on the line before rather than start one.
+CONTINUATION_WORDS = ('else', 'else_if', 'then', 'to')
+
+def _first_word(line):
+    end = 0
+    while end < len(line) and (line[end].isalnum() or line[end] == '_'):
+        end += 1
+    return line[:end]
+
+def split_statements(source):
+    """Split source into the text of its top-level statements.
+
+    A statement starts at an unindented line, where the lexer's indent stack
+    is back to empty, so each piece lexes and parses exactly as it does in
+    place. Unindented lines that continue a statement stay with it: else
+    and else_if, the while that closes a do, and lines that don't open with
+    a word, a literal or ->, such as a line starting with an operator.
+    """
+    statements = []
+    lines = []
+    open_do = False
+    for line in source.split('\n'):
+        if line[:1].isspace() or not line.strip():
+            lines.append(line)
+            continue
+        word = _first_word(line)
+        if word in CONTINUATION_WORDS or (word == 'while' and open_do):
+            open_do = False
+        elif word or line[0] in '"\'' or line.startswith('->') or not lines:
+            if lines:
+                statements.append(lines)
+            lines = []
+            open_do = word == 'do'
+        lines.append(line)
+    if lines:
+        statements.append(lines)
+    return ['\n'.join(statement) for statement in statements]
+
+class IncompleteStatement(SyntaxError):
+    """A piece of source ended in the middle of a statement."""
+
+def normalize(statement):
+    """Drop trailing whitespace from lines with code and trailing empty lines, neither of which changes the tokens."""
+    lines = [line.rstrip() if line.strip() else line for line in statement.split('\n')]
+    while lines and not lines[-1]:
+        lines.pop()
+    return '\n'.join(lines)
+
+def ast_size(value):
+    """Approximate bytes held by a parsed subtree, counting nodes, lists and their values."""
+    size = sys.getsizeof(value)
+    if isinstance(value, Node):
+        for name in value._fields:
+            size += ast_size(getattr(value, name))
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            size += ast_size(item)
+    return size
+
+class ParseCache:
+    """An in-memory LRU map from top-level statement text to its parsed nodes.
+
+    parse() splits a program with split_statements() and only lexes and
+    parses statements it hasn't seen, so re-running a mostly unchanged
+    buffer costs little more than a dictionary lookup per statement. The
+    cache holds at most max_bytes, counting key text and the ast_size() of
+    each entry, and evicts the least recently used statements first.
+
+    Cached nodes are shared between runs and must not be mutated.
+    """
+    def __init__(self, max_bytes=8 << 20):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # text -> (statements, size)
+        self._lock = threading.Lock()
+
+    def parse(self, source):
+        """Return the statements of source, parsing only the ones not already cached."""
+        program = []
+        statements = split_statements(source)
+        start = 0
+        while start < len(statements):
+            # A statement can go on past an unindented line that
+            # split_statements took for the start of the next one, e.g.
+            # after a trailing operator or comma; the piece then ends in the
+            # middle of it and is parsed again together with the next.
+            end = start + 1
+            while True:
+                text = normalize('\n'.join(statements[start:end]))
+                # Each statement is lexed with the newline that ends it, which
+                # closes its blocks; only the last one can lack it.
+                if end < len(statements) or source.endswith('\n'):
+                    text += '\n'
+                try:
+                    parsed = self.parse_statement(text)
+                    break
+                except IncompleteStatement:
+                    if end == len(statements):
+                        return self.parse_whole(source)
+                    end += 1
+                except SyntaxError:
+                    return self.parse_whole(source)
+            program.extend(parsed)
+            start = end
+        return program
+
+    @staticmethod
+    def parse_whole(source):
+        # Errors are reported from the whole source, so their line numbers are right
+        return Parser(Lexer(source).tokenize()).parse()
+
+    def parse_statement(self, text):
+        """Return the parsed statements of text, which is lexed exactly as given."""
+        with self._lock:
+            entry = self._entries.get(text)
+            if entry is not None:
+                self._entries.move_to_end(text)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+        parser = Parser(Lexer(text).tokenize())
+        try:
+            statements = parser.parse()
+        except SyntaxError as error:
+            if parser.tokens.type is None:
+                raise IncompleteStatement(*error.args) from None
+            raise
+        size = sys.getsizeof(text) + ast_size(statements)
+        with self._lock:
+            if size <= self.max_bytes and text not in self._entries:
+                self._entries[text] = (statements, size)
+                self.size += size
+                while self.size > self.max_bytes:
+                    _, (_, evicted) = self._entries.popitem(last=False)
+                    self.size -= evicted
+        return statements
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __repr__(self):
+        return f"ParseCache({len(self)} statements, {self.size} bytes, hits={self.hits}, misses={self.misses})"
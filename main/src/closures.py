@@ -0,0 +1,457 @@
+from ast import (
+    ArrayAccessNode,
+    ArrayAssignNode,
+    BinaryOperatorNode,
+    CharacterNode,
+    DecrementNode,
+    DoWhileNode,
+    DoubleNode,
+    ForLoopNode,
+    IfNode,
+    IncrementNode,
+    NumberNode,
+    ResetNode,
+    StringLiteralNode,
+    WhileLoopNode,
+)
+from output import MemorySink, ResultCollector, ResultWriter
+from resolver import UNSET, resolve
+
+# Statements the tree-walker evaluates to None; blocks skip the None check
+# for them.
+VALUELESS = (IncrementNode, DecrementNode, ArrayAssignNode, ResetNode)
+
+# Statements that write their blocks' results as they run, as the
+# tree-walker's execute_ methods do
+COMPOUND = (IfNode, WhileLoopNode, DoWhileNode, ForLoopNode)
+
+# How a block calls each statement's closure: for its value, only for its
+# effect, or with the ResultWriter as well
+VALUE, NO_VALUE, WRITES = range(3)
+
+# One factory per operator, so each operation is a direct Python operator
+# applied to its operands' closures rather than a lookup at run time.
+BINARY_CLOSURES = {
+    'PLUS': lambda left, right: lambda env: left(env) + right(env),
+    'MINUS': lambda left, right: lambda env: left(env) - right(env),
+    'MULTIPLY': lambda left, right: lambda env: left(env) * right(env),
+    'DIVIDE': lambda left, right: lambda env: left(env) / right(env),
+    'EQUAL': lambda left, right: lambda env: left(env) == right(env),
+    'NOT_EQUAL': lambda left, right: lambda env: left(env) != right(env),
+    'GREATER': lambda left, right: lambda env: left(env) > right(env),
+    'LESS': lambda left, right: lambda env: left(env) < right(env),
+    'GREATER_EQUAL': lambda left, right: lambda env: left(env) >= right(env),
+    'LESS_EQUAL': lambda left, right: lambda env: left(env) <= right(env),
+    'AND': lambda left, right: lambda env: left(env) and right(env),
+    'OR': lambda left, right: lambda env: left(env) or right(env),
+}
+
+# The same operators with a constant right operand, the shape of most loop
+# conditions and counters.
+CONSTANT_CLOSURES = {
+    'PLUS': lambda left, value: lambda env: left(env) + value,
+    'MINUS': lambda left, value: lambda env: left(env) - value,
+    'MULTIPLY': lambda left, value: lambda env: left(env) * value,
+    'DIVIDE': lambda left, value: lambda env: left(env) / value,
+    'EQUAL': lambda left, value: lambda env: left(env) == value,
+    'NOT_EQUAL': lambda left, value: lambda env: left(env) != value,
+    'GREATER': lambda left, value: lambda env: left(env) > value,
+    'LESS': lambda left, value: lambda env: left(env) < value,
+    'GREATER_EQUAL': lambda left, value: lambda env: left(env) >= value,
+    'LESS_EQUAL': lambda left, value: lambda env: left(env) <= value,
+}
+
+LITERALS = (NumberNode, StringLiteralNode, CharacterNode, DoubleNode)
+
+def fail(message):
+    def run(env):
+        raise Exception(message)
+    return run
+
+def block(statements):
+    """Return a closure running statements and writing their non-None results to a ResultWriter."""
+    if not statements:
+        return lambda env, writer: None
+    if len(statements) == 1:
+        statement, kind = statements[0]
+        if kind == WRITES:
+            return statement
+        if kind == NO_VALUE:
+            def run(env, writer):
+                statement(env)
+        else:
+            def run(env, writer):
+                result = statement(env)
+                if result is not None:
+                    writer.result(result)
+        return run
+
+    def run(env, writer):
+        for statement, kind in statements:
+            if kind == VALUE:
+                result = statement(env)
+                if result is not None:
+                    writer.result(result)
+            elif kind == NO_VALUE:
+                statement(env)
+            else:
+                statement(env, writer)
+    return run
+
+class ClosureCompiler:
+    """Converts each AST node once into a nested Python closure.
+
+    A node's closure takes the program's frame, a list holding each variable
+    at the slot the resolver gave it, and returns what Interpreter.visit
+    would return for the node. Running a program is a call to its root
+    closure, with no visit() dispatch, operator chains or name lookups.
+    Compound statements compile through their write_ methods to closures
+    that also take the ResultWriter and write their blocks' results to it
+    as they are produced.
+    """
+    def __init__(self, namespace=None):
+        self.namespace = namespace if namespace is not None else {}
+        self.scope = None
+
+    def compile(self, statements):
+        """Return a function that runs the program like Interpreter.interpret, in a new frame by default.
+
+        It writes the results to the sink it is given, or returns them if none is.
+        """
+        self.scope = scope = resolve(statements)
+        body = self.statements(statements)
+
+        def program(env=None, sink=None):
+            if env is None:
+                env = scope.frame().values
+            memory = MemorySink() if sink is None else None
+            try:
+                body(env, ResultWriter(sink or memory))
+            finally:
+                (sink or memory).flush()
+            if memory is not None:
+                return memory.getvalue()[:-1]
+        return program
+
+    def slot(self, name):
+        return self.scope.declare(name)
+
+    def statements(self, statements):
+        compiled = []
+        for statement in statements:
+            if isinstance(statement, COMPOUND):
+                compiled.append((self.writer(statement), WRITES))
+            else:
+                compiled.append((self.node(statement), NO_VALUE if isinstance(statement, VALUELESS) else VALUE))
+        return block(compiled)
+
+    def writer(self, node):
+        return getattr(self, 'write_' + type(node).__name__)(node)
+
+    def node(self, node):
+        method = getattr(self, 'compile_' + type(node).__name__, None)
+        if method is None:
+            return fail(f'No visit_{type(node).__name__} method')
+        return method(node)
+
+    # Literals and variables
+
+    def compile_NumberNode(self, node):
+        value = node.value
+        return lambda env: value
+
+    compile_StringLiteralNode = compile_CharacterNode = compile_DoubleNode = compile_NumberNode
+
+    def compile_VariableAccessNode(self, node):
+        name = node.identifier
+        slot = self.slot(name)
+
+        def load(env):
+            value = env[slot]
+            if value is UNSET:
+                raise Exception(f"Undefined variable {name}")
+            return value
+        return load
+
+    def compile_VariableDeclarationNode(self, node):
+        name = node.name
+        slot = self.slot(name)
+        expression = self.node(node.expression)
+
+        def declare(env):
+            value = env[slot] = expression(env)
+            return f"Variable '{name}' set to {value}"
+        return declare
+
+    def compile_AssignNode(self, node):
+        name = node.name
+        slot = self.slot(name)
+        expression = self.node(node.expression)
+
+        def assign(env):
+            value = env[slot] = expression(env)
+            return f"Variable {name} assigned value {value}"
+        return assign
+
+    def compile_ArrayDeclarationNode(self, node):
+        name = node.name
+        slot = self.slot(name)
+        elements = [self.node(element) for element in node.elements]
+
+        def declare(env):
+            value = env[slot] = [element(env) for element in elements]
+            return f"Array '{name}' set to {value}"
+        return declare
+
+    def raw(self, name):
+        """Return a closure reading name that fails with a plain KeyError, like environment[name]."""
+        slot = self.slot(name)
+
+        def load(env):
+            value = env[slot]
+            if value is UNSET:
+                raise KeyError(name)
+            return value
+        return load
+
+    def compile_ArrayAccessNode(self, node):
+        array = self.raw(node.name)
+        index = self.node(node.index)
+        return lambda env: array(env)[index(env)]
+
+    def compile_ArrayAssignNode(self, node):
+        name = node.array_name
+        slot = self.slot(name)
+        index = self.node(node.index)
+        value = self.node(node.value)
+
+        def store(env):
+            array = env[slot]
+            if array is UNSET:
+                array = None
+            position = index(env)
+            item = value(env)
+            if array is not None and 0 <= position < len(array):
+                array[position] = item
+            else:
+                raise Exception(f"Array assignment out of bounds or array '{name}' not defined")
+        return store
+
+    # The optimizer proved these in bounds on a defined array
+
+    def compile_UncheckedArrayAccessNode(self, node):
+        slot = self.slot(node.name)
+        index = self.node(node.index)
+        return lambda env: env[slot][index(env)]
+
+    def compile_UncheckedArrayAssignNode(self, node):
+        slot = self.slot(node.array_name)
+        index = self.node(node.index)
+        value = self.node(node.value)
+
+        def store(env):
+            position = index(env)
+            env[slot][position] = value(env)
+        return store
+
+    def compile_IncrementNode(self, node):
+        target = node.identifier
+        if isinstance(target, ArrayAccessNode):
+            array = self.raw(target.name)
+            index = self.node(target.index)
+
+            def increment_item(env):
+                items = array(env)
+                items[index(env)] += 1
+            return increment_item
+        slot = self.slot(target)
+
+        def increment(env):
+            value = env[slot]
+            if value is UNSET:
+                raise KeyError(target)
+            value += 1  # In place, as the tree-walker does, so a type error reads the same
+            env[slot] = value
+        return increment
+
+    def compile_DecrementNode(self, node):
+        target = node.identifier
+        if isinstance(target, ArrayAccessNode):
+            array = self.raw(target.name)
+            index = self.node(target.index)
+
+            def decrement_item(env):
+                items = array(env)
+                items[index(env)] -= 1
+            return decrement_item
+        slot = self.slot(target)
+
+        def decrement(env):
+            value = env[slot]
+            if value is UNSET:
+                raise KeyError(target)
+            value -= 1  # In place, as the tree-walker does, so a type error reads the same
+            env[slot] = value
+        return decrement
+
+    def compile_TemporaryNode(self, node):
+        slot = self.slot(node.name)
+        expression = self.node(node.expression)
+
+        def load(env):
+            value = env[slot]
+            if value is UNSET:
+                value = env[slot] = expression(env)
+            return value
+        return load
+
+    def compile_ResetNode(self, node):
+        slots = [self.slot(name) for name in node.names]
+
+        def reset(env):
+            for slot in slots:
+                env[slot] = UNSET
+        return reset
+
+    # Operators
+
+    def compile_BinaryOperatorNode(self, node):
+        operator = node.operator
+        left = self.node(node.left)
+        if type(node.right) in LITERALS and operator in CONSTANT_CLOSURES:
+            return CONSTANT_CLOSURES[operator](left, node.right.value)
+        right = self.node(node.right)
+        factory = BINARY_CLOSURES.get(operator)
+        if factory is None:
+            def unsupported(env):
+                left(env)
+                right(env)
+                raise Exception(f"Unsupported operator {operator}")
+            return unsupported
+        return factory(left, right)
+
+    compile_IntegerOperatorNode = compile_DoubleOperatorNode = compile_BinaryOperatorNode
+
+    def compile_ConcatenateNode(self, node):
+        return self.compile_BinaryOperatorNode(BinaryOperatorNode(node.left, 'PLUS', node.right))
+
+    def compile_UnaryOperatorNode(self, node):
+        operand = self.node(node.operand)
+        if node.operator == 'NEGATE':
+            return lambda env: -operand(env)
+        if node.operator == 'NOT':
+            return lambda env: not operand(env)
+        operator = node.operator
+
+        def unsupported(env):
+            operand(env)
+            raise Exception(f"Unsupported operator {operator}")
+        return unsupported
+
+    def compile_OutputNode(self, node):
+        value = self.node(node.value)
+        return lambda env: str(value(env))
+
+    def compile_FunctionCallNode(self, node):
+        name = node.function_name
+        arguments = [self.node(argument) for argument in node.arguments]
+        namespace = self.namespace
+
+        def call(env):
+            function = namespace.get(name)
+            if function:
+                return function(*[argument(env) for argument in arguments])
+            raise NameError(f"Function {name} not defined")
+        return call
+
+    # Compound statements. Met as an expression, which the parser never
+    # produces, they evaluate to their blocks' results joined by newlines.
+
+    def capture(self, node):
+        write = self.writer(node)
+
+        def run(env):
+            collector = ResultCollector()
+            write(env, collector)
+            return collector.text()
+        return run
+
+    compile_IfNode = compile_WhileLoopNode = compile_DoWhileNode = compile_ForLoopNode = capture
+
+    def write_IfNode(self, node):
+        condition = self.node(node.condition)
+        then_block = self.statements(node.then_block)
+        elif_blocks = [(self.node(test), self.statements(body)) for test, body in node.elif_blocks or ()]
+        else_block = self.statements(node.else_block) if node.else_block else None
+
+        def branch(env, writer):
+            writer.open()
+            if condition(env):
+                then_block(env, writer)
+            else:
+                for test, body in elif_blocks:
+                    if test(env):
+                        body(env, writer)
+                        break
+                # As in the tree-walker, the else block runs whenever the if
+                # condition was false, even after an else_if block has run.
+                if else_block is not None:
+                    else_block(env, writer)
+            writer.close()
+        return branch
+
+    def write_WhileLoopNode(self, node):
+        condition = self.node(node.condition)
+        body = self.statements(node.body)
+
+        def loop(env, writer):
+            writer.open()
+            while condition(env):
+                body(env, writer)
+            writer.close()
+        return loop
+
+    def write_DoWhileNode(self, node):
+        condition = self.node(node.condition)
+        body = self.statements(node.body)
+
+        def loop(env, writer):
+            writer.open()
+            while True:
+                body(env, writer)
+                if not condition(env):
+                    break
+            writer.close()
+        return loop
+
+    def write_ForLoopNode(self, node):
+        start_value = self.raw(node.identifier)
+        slot = self.slot(node.identifier)
+        end_value = self.node(node.end_value)
+        body = self.statements(node.body)
+
+        def loop(env, writer):
+            start = start_value(env)
+            end = end_value(env)
+            writer.open()
+            for value in range(start, end):
+                env[slot] = value
+                body(env, writer)
+            writer.close()
+        return loop
+
+def compile_closures(statements, namespace=None):
+    """Compile parsed statements into a function that runs them."""
+    return ClosureCompiler(namespace).compile(statements)
+
+if __name__ == "__main__":
+    from lexer import Lexer
+    from parser import Parser
+
+    code = '''integer total : 0
+for integer i : 0 to 5
+    total : total + i
+-> total
+'''
+    program = compile_closures(Parser(Lexer(code).tokenize()).parse())
+    print(program())
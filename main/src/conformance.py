@@ -0,0 +1,298 @@
+import contextlib
+import io
+import sys
+
+from ast import (
+    ForLoopNode,
+    FunctionCallNode,
+    IfNode,
+    NumberNode,
+    OutputNode,
+    StringLiteralNode,
+    VariableAccessNode,
+    VariableDeclarationNode,
+)
+from interpreter import ENGINES, run_program
+from lexer import Lexer
+from output import MemorySink
+from parser import Parser
+
+# Programs every execution engine must run exactly like the tree-walking
+# Interpreter: same result string, same error text, and the same lines
+# written to a sink, up to and including the error. Most are Quetzal source;
+# the parser never builds function calls, so those are given as nodes.
+def nested_blocks(depth):
+    """Return a program whose blocks nest depth deep, cycling through every kind of loop and if."""
+    lines = ['integer n : 0']
+    closing = []
+    for level in range(depth):
+        indent = '    ' * level
+        kind = level % 4
+        if kind == 0:
+            lines.append(f'{indent}while n < {level + 1}')
+        elif kind == 1:
+            lines.append(f'{indent}for integer i{level} : 0 to 1')
+        elif kind == 2:
+            lines.append(f'{indent}if n :> 0 then')
+        else:
+            lines.append(f'{indent}do')
+            closing.append(f'{indent}while n < 0')
+    lines.append('    ' * depth + 'n++')
+    lines.append('    ' * depth + '-> n')
+    lines.extend(reversed(closing))
+    lines.append('-> n')
+    return '\n'.join(lines) + '\n'
+
+CORPUS = {
+    'arithmetic': '''integer a : 7
+integer b : 2
+double d : 2.5
+integer r : a + b * 3
+r : (a + b) * 3
+r : a / b
+r : a - -b
+r : d * a
+r : :! a
+-> a + b
+''',
+    'logic': '''integer a : 7
+integer b : 0
+integer r : a > b
+r : a :< b :| b < a
+r : a :& b
+r : b :| a
+r : a := 7
+r : a :! 7
+''',
+    'strings': '''string s : "Hi"
+character c : 'x'
+string t : s + " there"
+-> c
+-> ""
+s : s + s
+-> s
+''',
+    'string-quotes': '''string s : "a" + '"'
+-> s
+string t : s + s
+-> t
+character q : '"'
+string u : q
+-> u
+''',
+    'while': '''integer i : 0
+while i < 5
+    -> i
+    i++
+-> "done"
+''',
+    'while-empty-results': '''integer i : 0
+while i < 4
+    if i > 1 then
+        -> i
+    i++
+''',
+    'do-while': '''integer n : 10
+do
+    -> n
+    n--
+while n :> 5
+''',
+    'for-declared': '''for integer i : 0 to 5
+    integer square : i * i
+-> i
+''',
+    'for-existing': '''integer j : 2
+for j to 6
+    -> j
+    j : j + 10
+''',
+    'arrays': '''array integer v[5, 6, 7]
+array string w["a", "b"]
+integer sum : v[0] + v[2]
+v[1] : 40
+v[1]++
+v[0]--
+-> v[1]
+-> w[1]
+integer last : v[2 - 3]
+''',
+    'if-elif-else': '''integer x : 5
+if x > 10 then
+    -> "big"
+else_if x > 3 then
+    -> "mid"
+else_if x > 1 then
+    -> "small"
+else then
+    -> "else runs after an elif too"
+if x > 1 then
+    -> "then"
+else then
+    -> "not reached"
+''',
+    'increments': '''integer x : 1
+x++
+++x
+-> x
+x--
+--x
+--x
+-> x
+''',
+    'expression-statements': '''integer z : 0
+z
+while z < 3
+    z
+    z++
+z
+''',
+    'nested-loops': '''integer i : 0
+while i < 3
+    integer j : 0
+    while j < i
+        integer pair : i * 10 + j
+        j++
+    i++
+''',
+    'bubble-sort': '''array integer v[5, 3, 8, 1, 9, 2]
+integer i : 0
+integer n : 6
+while i < n
+    integer j : 0
+    while j < n - i - 1
+        if v[j] > v[j + 1] then
+            integer t : v[j]
+            v[j] : v[j + 1]
+            v[j + 1] : t
+        j++
+    i++
+-> v[0]
+-> v[1]
+-> v[2]
+-> v[3]
+-> v[4]
+-> v[5]
+''',
+    'sum': '''integer total : 0
+integer i : 0
+while i < 1000
+    total : total + i
+    i++
+-> total
+''',
+    'undefined-variable': '''integer a : 1
+-> a
+-> b
+''',
+    'undefined-loop-variable': '''for k to 3
+    -> k
+''',
+    'division-by-zero': '''integer i : 3
+while i > -1
+    integer sixth : 6 / i
+    i--
+''',
+    'array-out-of-bounds': '''array integer v[1, 2]
+v[2] : 5
+''',
+    'array-increment-out-of-range': '''array integer v[1]
+v[3]++
+''',
+    'stop': '''integer a : 1
+stop
+-> a
+''',
+    # Type errors must read the same, so ++ and -- apply += and -= as the
+    # tree-walker does
+    'decrement-string': '''string s : "a"
+-> s
+s--
+-> s
+''',
+    'increment-in-loop': '''integer x : 0
+double d : 0.5
+for integer i : 0 to 3
+    x++
+    --x
+    x++
+    d++
+-> x
+-> d
+string s : "a"
+while x > 0
+    -> x
+    x--
+    ++x
+    --x
+    s--
+''',
+    'increment-array': '''array integer v[1, 2]
+v++
+-> v
+''',
+    # Deeper than CPython compiles loops in one function, and deeper than it
+    # indents in one source
+    'deep-nesting': nested_blocks(25),
+    'very-deep-nesting': nested_blocks(100),
+    'calls': [
+        OutputNode(FunctionCallNode('pow', [NumberNode(2), NumberNode(10)])),
+        VariableDeclarationNode('TYPE_STRING', 's', FunctionCallNode('upper', [StringLiteralNode('quetzal')])),
+        OutputNode(FunctionCallNode('sqrt', [FunctionCallNode('factorial', [NumberNode(4)])])),
+        OutputNode(VariableAccessNode('s')),
+    ],
+    'undefined-function': [
+        OutputNode(FunctionCallNode('nope', [NumberNode(1)])),
+    ],
+    # Compound statements used as values evaluate to their joined results
+    'compound-values': [
+        VariableDeclarationNode('TYPE_INTEGER', 'i', NumberNode(0)),
+        OutputNode(IfNode(NumberNode(1), [
+            OutputNode(NumberNode(5)),
+            IfNode(NumberNode(0), [OutputNode(NumberNode(1))], None, None),
+            ForLoopNode('i', NumberNode(3), [OutputNode(VariableAccessNode('i'))]),
+        ], None, None)),
+        VariableDeclarationNode('TYPE_STRING', 's', IfNode(NumberNode(1), [], None, None)),
+        OutputNode(VariableAccessNode('s')),
+    ],
+}
+
+def parse(program):
+    if isinstance(program, str):
+        return Parser(Lexer(program).tokenize()).parse()
+    return program
+
+def run_quietly(ast, engine, optimize=False):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return run_program(ast, engine, optimize)
+
+def sink_output(ast, engine, optimize=False):
+    """Return what running ast writes to a sink, including the output before any error."""
+    sink = MemorySink(buffer_size=0)
+    with contextlib.redirect_stdout(io.StringIO()):
+        run_program(ast, engine, optimize, sink)
+    return sink.getvalue()
+
+def check(engine, optimize=False):
+    """Return the names of corpus programs whose result or sink output under engine differs from the unoptimized tree-walker's."""
+    failures = []
+    for name, program in CORPUS.items():
+        ast = parse(program)
+        if (run_quietly(ast, engine, optimize) != run_quietly(ast, 'tree')
+                or sink_output(ast, engine, optimize) != sink_output(ast, 'tree')):
+            failures.append(name)
+    return failures
+
+if __name__ == "__main__":
+    engines = sys.argv[1:] or list(ENGINES)
+    # Every engine runs both as parsed and optimized, except the
+    # unoptimized tree-walker, which is the reference.
+    for engine in engines:
+        for optimize in (False, True):
+            if engine == 'tree' and not optimize:
+                continue
+            failures = check(engine, optimize)
+            label = f"{engine} (optimized)" if optimize else engine
+            print(f"{label}: {len(CORPUS) - len(failures)}/{len(CORPUS)} programs match")
+            for name in failures:
+                print(f"  differs: {name}")
@@ -1,6 +1,9 @@
 from tkinter import Tk, Text, Scrollbar, Button, Frame, messagebox
 from tkinter.scrolledtext import ScrolledText
+from cache import ParseCache
 from interpreter import run
+from output import QueueSink
+import queue
 import threading
 
 class GUI:
@@ -35,6 +38,13 @@ class GUI:
         scrollbar_output.pack(side='right', fill='y')
         self.output_area.config(yscrollcommand=scrollbar_output.set)
 
+        # Re-runs only lex and parse the top-level statements that changed
+        self.parse_cache = ParseCache()
+
+        # The interpreter thread puts output here as it runs; the Tk thread shows it
+        self.output_queue = queue.Queue()
+        self.poll_output()
+
         # Run code button
         run_button = Button(self.root, text="Run Code", command=self.execute_code)
         run_button.pack()
@@ -47,17 +57,25 @@ class GUI:
     def run_interpreter(self, code):
         print(f"Running interpreter with code: {code}")
         try:
-            output = run(code)
-            print(f"Interpreter output: {output}")
-            self.output_area.after(0, self.update_output_area, output)
+            run(code, cache=self.parse_cache, sink=QueueSink(self.output_queue))
         except Exception as e:
             messagebox.showerror("Error", str(e))
-            self.output_area.after(0, self.update_output_area, "Error occurred!")
+            self.output_queue.put("Error occurred!\n")
+
+    def poll_output(self):
+        """ Show any output the interpreter thread has produced, then check again shortly """
+        while True:
+            try:
+                output = self.output_queue.get_nowait()
+            except queue.Empty:
+                break
+            self.update_output_area(output)
+        self.root.after(50, self.poll_output)
 
     def update_output_area(self, output):
         """ Update the output area with provided text """
         self.output_area.config(state='normal')  # Enable the text widget
-        self.output_area.insert('end', output + '\n')  # Insert output at the end
+        self.output_area.insert('end', output)  # Insert output at the end
         self.output_area.config(state='disabled')  # Disable the text widget to prevent editing
 
 
@@ -0,0 +1,295 @@
+import errors
+from ast import (
+    ArrayAccessNode,
+    ArrayAssignNode,
+    ArrayDeclarationNode,
+    AssignNode,
+    BinaryOperatorNode,
+    CharacterNode,
+    ConcatenateNode,
+    DecrementNode,
+    DoubleNode,
+    DoubleOperatorNode,
+    ForLoopNode,
+    FunctionCallNode,
+    IncrementNode,
+    IntegerOperatorNode,
+    Node,
+    NumberNode,
+    StringLiteralNode,
+    TemporaryNode,
+    UnaryOperatorNode,
+    VariableAccessNode,
+    VariableDeclarationNode,
+)
+
+# Types are named as in declarations. 'number' is an integer or a double,
+# and 'any' a value of unknown type. None stands for no value at all, e.g.
+# a variable no statement binds.
+INTEGER = 'integer'
+DOUBLE = 'double'
+NUMBER = 'number'
+STRING = 'string'
+BOOLEAN = 'boolean'
+ARRAY = 'array'
+ANY = 'any'
+
+NUMERIC = (INTEGER, DOUBLE, NUMBER)
+
+# The type a declaration's type name promises
+DECLARED_TYPES = {
+    'integer': INTEGER,
+    'double': DOUBLE,
+    'string': STRING,
+    'character': STRING,
+}
+
+ARITHMETIC = ('PLUS', 'MINUS', 'MULTIPLY', 'DIVIDE')
+ORDERING = ('GREATER', 'LESS', 'GREATER_EQUAL', 'LESS_EQUAL')
+
+# Builtins whose result type follows from their argument types
+STRING_FUNCTIONS = ('upper', 'lower')
+
+def join(first, second):
+    """Return the type of a value that has either type."""
+    if first is None:
+        return second
+    if second is None or first == second:
+        return first
+    if first in NUMERIC and second in NUMERIC:
+        return NUMBER
+    return ANY
+
+def numeric_result(left, right):
+    if left == right == INTEGER:
+        return INTEGER
+    return DOUBLE if DOUBLE in (left, right) else NUMBER
+
+def binary_type(operator, left, right):
+    """Return the type operator gives for operands of the given types."""
+    if left is None or right is None:
+        return None
+    if operator in ('AND', 'OR'):
+        return join(left, right)
+    if operator in ('EQUAL', 'NOT_EQUAL'):
+        return BOOLEAN
+    numeric = left in NUMERIC and right in NUMERIC
+    if operator in ORDERING:
+        return BOOLEAN if numeric or left == right == STRING else ANY
+    if operator == 'DIVIDE':
+        return DOUBLE if numeric else ANY
+    if numeric and operator in ARITHMETIC:
+        return numeric_result(left, right)
+    if operator == 'PLUS' and left == right == STRING:
+        return STRING
+    if operator == 'MULTIPLY' and {left, right} == {STRING, INTEGER}:
+        return STRING
+    return ANY
+
+def operation_error(operator, left, right):
+    """Return why operator always fails on operands of the given types, or None if it may not."""
+    # Python treats booleans as the integers 0 and 1
+    number = (INTEGER, DOUBLE, NUMBER, BOOLEAN)
+    if ANY in (left, right) or None in (left, right) or operator in ('AND', 'OR', 'EQUAL', 'NOT_EQUAL'):
+        return None
+    if left in number and right in number:
+        return None
+    if operator in ORDERING and left == right:
+        return None
+    if operator == 'PLUS' and left == right:
+        return None
+    if operator == 'MULTIPLY' and {left, right} in ({STRING, INTEGER}, {STRING, BOOLEAN}, {ARRAY, INTEGER}, {ARRAY, BOOLEAN}):
+        return None
+    return f"unsupported operand types for {operator}: {left} and {right}"
+
+class TypeInference:
+    """Infers the type of every variable and expression of a program.
+
+    Declared types are not enforced when a program runs, so they cannot
+    simply be believed: a variable's type is the join of the types of every
+    value any statement binds to it, computed to a fixed point, and is only
+    known when all of them agree. Where it is known, it holds wherever the
+    variable has a value. Array items are typed together, as arrays can be
+    shared between variables.
+
+    check() compares the result with the declarations and reports, as
+    errors.TypeError, declarations and assignments of values of another
+    type and operations that always fail on the types of their operands.
+    """
+    def __init__(self, statements):
+        self.statements = statements
+        self.variables = {}
+        self.items = None
+        self.declared = {}
+        self.bindings = []
+        self._types = None
+        self._collect(statements)
+        self._solve()
+
+    def _collect(self, value):
+        """Record every statement that binds a variable or array item."""
+        if isinstance(value, Node):
+            if isinstance(value, (VariableDeclarationNode, AssignNode)):
+                self.bindings.append((value.name, value.expression))
+                if isinstance(value, VariableDeclarationNode):
+                    declared = DECLARED_TYPES.get(value.type_name, ANY)
+                    self.declared[value.name] = declared if self.declared.get(value.name, declared) == declared else ANY
+            elif isinstance(value, ArrayDeclarationNode):
+                self.bindings.append((value.name, ARRAY))
+                self.bindings.extend((ArrayAccessNode, element) for element in value.elements)
+            elif isinstance(value, ArrayAssignNode):
+                self.bindings.append((ArrayAccessNode, value.value))
+            elif isinstance(value, ForLoopNode):
+                self.bindings.append((value.identifier, INTEGER))
+            elif isinstance(value, (IncrementNode, DecrementNode)):
+                target = value.identifier
+                self.bindings.append((ArrayAccessNode if isinstance(target, ArrayAccessNode) else target, IncrementNode))
+            elif isinstance(value, FunctionCallNode) and value.function_name not in STRING_FUNCTIONS:
+                # Other builtins, like split(), may return arrays of anything
+                self.bindings.append((ArrayAccessNode, ANY))
+            for name in value._fields:
+                self._collect(getattr(value, name))
+        elif isinstance(value, (list, tuple)):
+            for item in value:
+                self._collect(item)
+
+    def _solve(self):
+        changed = True
+        while changed:
+            changed = False
+            for target, source in self.bindings:
+                old = self.items if target is ArrayAccessNode else self.variables.get(target)
+                if source is IncrementNode:
+                    # Adding one keeps a number's type, and makes a boolean an integer
+                    kind = INTEGER if old == BOOLEAN else old if old in NUMERIC or old is None else ANY
+                elif isinstance(source, str):
+                    kind = source
+                else:
+                    kind = self.type_of(source)
+                new = join(old, kind)
+                if new != old:
+                    changed = True
+                    if target is ArrayAccessNode:
+                        self.items = new
+                    else:
+                        self.variables[target] = new
+        self._types = {}
+
+    def type_of(self, node):
+        """Return node's type, 'any' if it is unknown or None if node never has a value."""
+        types = self._types
+        if types is not None:
+            kind = types.get(id(node), False)
+            if kind is not False:
+                return kind
+        kind = self._type_of(node)
+        if types is not None:
+            types[id(node)] = kind
+        return kind
+
+    def _type_of(self, node):
+        if isinstance(node, NumberNode):
+            return {int: INTEGER, bool: BOOLEAN}.get(type(node.value), ANY)
+        if isinstance(node, DoubleNode):
+            return DOUBLE if type(node.value) is float else ANY
+        if isinstance(node, (StringLiteralNode, CharacterNode)):
+            return STRING if type(node.value) is str else ANY
+        if isinstance(node, VariableAccessNode):
+            return self.variables.get(node.identifier)
+        if isinstance(node, TemporaryNode):
+            return self.type_of(node.expression)
+        if isinstance(node, (BinaryOperatorNode, IntegerOperatorNode, DoubleOperatorNode)):
+            return binary_type(node.operator, self.type_of(node.left), self.type_of(node.right))
+        if isinstance(node, ConcatenateNode):
+            return binary_type('PLUS', self.type_of(node.left), self.type_of(node.right))
+        if isinstance(node, UnaryOperatorNode):
+            operand = self.type_of(node.operand)
+            if operand is None:
+                return None
+            if node.operator == 'NOT':
+                return BOOLEAN
+            if node.operator == 'NEGATE' and operand in NUMERIC:
+                return operand
+            return ANY
+        if isinstance(node, ArrayAccessNode):
+            container = self.variables.get(node.name)
+            if container == ARRAY:
+                return self.items
+            return STRING if container == STRING else None if container is None else ANY
+        if isinstance(node, FunctionCallNode) and node.function_name in STRING_FUNCTIONS:
+            if len(node.arguments) == 1 and self.type_of(node.arguments[0]) == STRING:
+                return STRING
+        return ANY
+
+    def of(self, node):
+        """Return node's type, or None if it is not known."""
+        kind = self.type_of(node)
+        return None if kind == ANY else kind
+
+    def check(self):
+        """Return the type errors found in the program, in the order they appear."""
+        found = []
+        self._check(self.statements, found)
+        return found
+
+    def _check(self, value, found):
+        if isinstance(value, Node):
+            for name in value._fields:
+                self._check(getattr(value, name), found)
+            message = self._problem(value)
+            if message is not None:
+                found.append(errors.TypeError(message))
+        elif isinstance(value, (list, tuple)):
+            for item in value:
+                self._check(item, found)
+
+    def _problem(self, node):
+        if isinstance(node, (VariableDeclarationNode, AssignNode)):
+            declared = self.declared.get(node.name, ANY)
+            given = self.of(node.expression)
+            if declared == ANY or given is None or given == declared or declared == DOUBLE and given in NUMERIC:
+                return None
+            if isinstance(node, VariableDeclarationNode):
+                return f"variable '{node.name}' is declared {node.type_name} but given a {given}"
+            return f"cannot assign a {given} to {declared} variable '{node.name}'"
+        if isinstance(node, ArrayDeclarationNode):
+            declared = DECLARED_TYPES.get(node.array_type, ANY)
+            for element in node.elements:
+                given = self.of(element)
+                if declared != ANY and given is not None and given != declared and not (declared == DOUBLE and given in NUMERIC):
+                    return f"array '{node.name}' of {node.array_type} has an item of type {given}"
+            return None
+        if isinstance(node, (BinaryOperatorNode, IntegerOperatorNode, DoubleOperatorNode)):
+            return operation_error(node.operator, self.of(node.left), self.of(node.right))
+        if isinstance(node, ArrayAccessNode):
+            index = self.of(node.index)
+            if index in (DOUBLE, STRING, ARRAY):
+                return f"index of '{node.name}' must be an integer, not a {index}"
+        return None
+
+def infer_types(statements):
+    """Return the TypeInference of a parsed program."""
+    return TypeInference(statements)
+
+def check_types(statements):
+    """Return the type errors in a parsed program as errors.TypeError instances, without running it."""
+    return infer_types(statements).check()
+
+if __name__ == "__main__":
+    from lexer import Lexer
+    from parser import Parser
+
+    code = '''integer count : 10
+double rate : 0.5
+string name : "quetzal"
+integer scaled : count * 2
+double total : count * rate
+integer wrong : name
+string greeting : name + count
+-> greeting
+'''
+    statements = Parser(Lexer(code).tokenize()).parse()
+    types = infer_types(statements)
+    print(types.variables)
+    for error in check_types(statements):
+        print(error)
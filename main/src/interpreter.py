@@ -1,26 +1,37 @@
+import operator
+
 import math_utils
 import string_utils
 import file_utils
+import tracing
+from types import CodeType
+from bytecode import VM, compile_program
+from cache import ParseCache, ProgramCache
+from closures import compile_closures
 from lexer import Lexer
+from optimizer import optimize as optimize_program, trace as optimizer_trace, trace_type_errors
+from output import MemorySink, ResultCollector, ResultWriter
 from parser import Parser
-from ast import (
-    FunctionDeclaration,
-    ForLoopNode,
-    WhileLoopNode,
-    DoWhileNode,
-    IfNode,
-    BinaryOperatorNode,
-    NumberNode,
-    VariableDeclarationNode,
-    AssignNode,
-    ArrayDeclarationNode,
-    ArrayAccessNode,
-    FunctionCallNode,
-    OutputNode,
-    VariableAccessNode,
-    IncrementNode,
-    StopNode
-)
+from transpiler import NestingError, compile_python, load
+from ast import ArrayAccessNode, dispatch_table
+
+trace = tracing.get_channel('interpreter')
+loop_trace = tracing.get_channel('loop')
+
+# What typed operator nodes compute; their operands' types are already known
+# to suit the operator.
+TYPED_OPERATIONS = {
+    'PLUS': operator.add,
+    'MINUS': operator.sub,
+    'MULTIPLY': operator.mul,
+    'DIVIDE': operator.truediv,
+    'EQUAL': operator.eq,
+    'NOT_EQUAL': operator.ne,
+    'GREATER': operator.gt,
+    'LESS': operator.lt,
+    'GREATER_EQUAL': operator.ge,
+    'LESS_EQUAL': operator.le,
+}
 
 global_namespace = {
     'factorial': math_utils.factorial,
@@ -34,108 +45,151 @@ global_namespace = {
 }
 
 class Interpreter:
-    def __init__(self, parser):
+    def __init__(self, parser=None, sink=None):
         self.parser = parser
+        self.sink = sink  # An output.Sink for the results; interpret() returns them if None
+        self.writer = None
         self.environment = {}
+        self.temporaries = {}  # Values of the optimizer's TemporaryNodes, kept out of the program's variables
+        # Node class -> visitor function, built once per Interpreter class
+        self.visitors = dispatch_table(type(self), fallback='no_visit_method')
+        self.executors = dispatch_table(type(self), 'execute_', 'execute_value')
 
     def interpret(self, ast):
-        results = []
-        for node in ast:
-            result = self.visit(node)
-            if result is not None:
-                results.append(result)
-        return '\n'.join(map(str, filter(None, results)))  # Ensure all results are strings
+        # ast is a list of nodes or a FlatAST, whose statement views visit like nodes
+        sink = self.sink if self.sink is not None else MemorySink()
+        self.writer = ResultWriter(sink)
+        try:
+            for node in ast:
+                self.execute(node)
+        finally:
+            sink.flush()
+        if self.sink is None:
+            return sink.getvalue()[:-1]
+
+    def execute(self, node):
+        """Run node as a statement, writing its results to the writer as they are produced."""
+        if trace.debug:
+            trace.emit(f"Visiting: {type(node).__name__}")
+        self.executors[type(node)](self, node)
+
+    def execute_value(self, node):
+        value = self.visitors[type(node)](self, node)
+        if value is not None:
+            self.writer.result(value)
+
+    def capture(self, node):
+        """Run a compound statement met as an expression and return its results joined by newlines."""
+        writer = self.writer
+        collector = self.writer = ResultCollector()
+        try:
+            self.executors[type(node)](self, node)
+        finally:
+            self.writer = writer
+        return collector.text()
 
     def visit(self, node):
-        print(f"Visiting: {type(node).__name__}")
-        method_name = 'visit_' + type(node).__name__
-        visitor = getattr(self, method_name, self.no_visit_method)
-        return visitor(node)
+        if trace.debug:
+            trace.emit(f"Visiting: {type(node).__name__}")
+        return self.visitors[type(node)](self, node)
+
+    # Compound statements write their blocks' results as they run. Met as
+    # an expression, which the parser never produces, they evaluate to them
+    # joined by newlines instead.
 
-    def visit_ForLoopNode(self, node):
+    def execute_ForLoopNode(self, node):
         start_value = self.environment[node.identifier]
         end_value = self.visit(node.end_value)
-        results = []
+        execute = self.execute
+        self.writer.open()
         for i in range(start_value, end_value):
             self.environment[node.identifier] = i
             for stmt in node.body:
-                result = self.visit(stmt)
-                if result is not None:
-                    results.append(result)
-        return '\n'.join(map(str, results))  # Ensure all results are strings
-    
-    def visit_WhileLoopNode(self, node):
-        results = []
+                execute(stmt)
+        self.writer.close()
+
+    def execute_WhileLoopNode(self, node):
+        execute = self.execute
+        self.writer.open()
         while self.visit(node.condition):
-            print(f"Condition {node.condition} evaluated to True")  # Debug print
+            if loop_trace.debug:
+                loop_trace.emit(f"Condition {node.condition} evaluated to True")
             for stmt in node.body:
-                result = self.visit(stmt)
-                if result is not None:
-                    results.append(result)
-            print(f"End of WHILE loop iteration, environment: {self.environment}")  # Debug print
-        print(f"WHILE loop condition {node.condition} evaluated to False")  # Debug print
-        return '\n'.join(map(str, results))  # Ensure all results are strings
-    
-    def visit_DoWhileNode(self, node):
-        results = []
+                execute(stmt)
+            if loop_trace.debug:
+                loop_trace.emit(f"End of WHILE loop iteration, environment: {self.environment}")
+        if loop_trace.info:
+            loop_trace.emit(f"WHILE loop condition {node.condition} evaluated to False")
+        self.writer.close()
+
+    def execute_DoWhileNode(self, node):
+        execute = self.execute
+        self.writer.open()
         while True:
             for stmt in node.body:
-                result = self.visit(stmt)
-                if result is not None:
-                    results.append(result)
+                execute(stmt)
             if not self.visit(node.condition):
                 break
-            print(f"End of DO-WHILE loop iteration, environment: {self.environment}")  # Debug print
-        print(f"DO-WHILE loop condition {node.condition} evaluated to False")  # Debug print
-        return '\n'.join(map(str, results))  # Ensure all results are strings
+            if loop_trace.debug:
+                loop_trace.emit(f"End of DO-WHILE loop iteration, environment: {self.environment}")
+        if loop_trace.info:
+            loop_trace.emit(f"DO-WHILE loop condition {node.condition} evaluated to False")
+        self.writer.close()
+
+    visit_ForLoopNode = visit_WhileLoopNode = visit_DoWhileNode = capture
 
     def visit_IncrementNode(self, node):
         if isinstance(node.identifier, ArrayAccessNode):
             array = self.environment[node.identifier.name]
             index = self.visit(node.identifier.index)
             array[index] += 1
-            print(f"Incremented {node.identifier.name}[{index}], new value: {array[index]}")
+            if trace.info:
+                trace.emit(f"Incremented {node.identifier.name}[{index}], new value: {array[index]}")
         else:
             self.environment[node.identifier] += 1
-            print(f"Incremented {node.identifier}, new value: {self.environment[node.identifier]}")
+            if trace.info:
+                trace.emit(f"Incremented {node.identifier}, new value: {self.environment[node.identifier]}")
 
     def visit_DecrementNode(self, node):
         if isinstance(node.identifier, ArrayAccessNode):
             array = self.environment[node.identifier.name]
             index = self.visit(node.identifier.index)
             array[index] -= 1
-            print(f"Decremented {node.identifier.name}[{index}], new value: {array[index]}")
+            if trace.info:
+                trace.emit(f"Decremented {node.identifier.name}[{index}], new value: {array[index]}")
         else:
             self.environment[node.identifier] -= 1
-            print(f"Decremented {node.identifier}, new value: {self.environment[node.identifier]}")
+            if trace.info:
+                trace.emit(f"Decremented {node.identifier}, new value: {self.environment[node.identifier]}")
 
-    def visit_IfNode(self, node):
+    def execute_IfNode(self, node):
         condition_value = self.visit(node.condition)
-        results = []
+        self.writer.open()
         if condition_value:
             for stmt in node.then_block:
-                result = self.visit(stmt)
-                if result is not None:
-                    results.append(result)
+                self.execute(stmt)
         elif node.elif_blocks:
             for (cond, block) in node.elif_blocks:
                 if self.visit(cond):
                     for stmt in block:
-                        result = self.visit(stmt)
-                        if result is not None:
-                            results.append(result)
+                        self.execute(stmt)
                     break
         if not condition_value and node.else_block:
             for stmt in node.else_block:
-                result = self.visit(stmt)
-                if result is not None:
-                    results.append(result)
-        return '\n'.join(map(str, results))  # Ensure all results are strings
+                self.execute(stmt)
+        self.writer.close()
+
+    visit_IfNode = capture
 
     def visit_BinaryOperatorNode(self, node):
+        if node.operator == 'AND':
+            return self.visit(node.left) and self.visit(node.right)
+        elif node.operator == 'OR':
+            return self.visit(node.left) or self.visit(node.right)
         left_val = self.visit(node.left)
         right_val = self.visit(node.right)
-        print(f"Evaluating Binary Operator: {left_val} {node.operator} {right_val}")  # Debug print
+        if trace.debug:
+            trace.emit(f"Evaluating Binary Operator: {left_val} {node.operator} {right_val}")
         if node.operator == 'PLUS':
             return left_val + right_val
         elif node.operator == 'MINUS':
@@ -159,6 +213,27 @@ class Interpreter:
         else:
             raise Exception(f"Unsupported operator {node.operator}")
 
+    def visit_IntegerOperatorNode(self, node):
+        left_val = self.visit(node.left)
+        right_val = self.visit(node.right)
+        if trace.debug:
+            trace.emit(f"Evaluating Binary Operator: {left_val} {node.operator} {right_val}")
+        return TYPED_OPERATIONS[node.operator](left_val, right_val)
+
+    visit_DoubleOperatorNode = visit_IntegerOperatorNode
+
+    def visit_ConcatenateNode(self, node):
+        return self.visit(node.left) + self.visit(node.right)
+
+    def visit_UnaryOperatorNode(self, node):
+        operand = self.visit(node.operand)
+        if node.operator == 'NEGATE':
+            return -operand
+        elif node.operator == 'NOT':
+            return not operand
+        else:
+            raise Exception(f"Unsupported operator {node.operator}")
+
     def visit_NumberNode(self, node):
         return node.value
 
@@ -174,13 +249,15 @@ class Interpreter:
     def visit_VariableDeclarationNode(self, node):
         evaluated_expression = self.visit(node.expression)
         self.environment[node.name] = evaluated_expression
-        print(f"Declared: {node.name} = {evaluated_expression}")
+        if trace.info:
+            trace.emit(f"Declared: {node.name} = {evaluated_expression}")
         return f"Variable '{node.name}' set to {evaluated_expression}"
     
     def visit_ArrayDeclarationNode(self, node):
         evaluated_elements = [self.visit(element) for element in node.elements]
         self.environment[node.name] = evaluated_elements
-        print(f"Declared array: {node.name} = {evaluated_elements}")
+        if trace.info:
+            trace.emit(f"Declared array: {node.name} = {evaluated_elements}")
         return f"Array '{node.name}' set to {evaluated_elements}"
 
     def visit_ArrayAccessNode(self, node):
@@ -194,24 +271,49 @@ class Interpreter:
         value = self.visit(node.value)
         if array is not None and 0 <= index < len(array):
             array[index] = value
-            print(f"Assigned {value} to {node.array_name}[{index}]")
+            if trace.info:
+                trace.emit(f"Assigned {value} to {node.array_name}[{index}]")
         else:
             raise Exception(f"Array assignment out of bounds or array '{node.array_name}' not defined")
 
-    def visit_OutputNode(self, node):
+    def visit_UncheckedArrayAccessNode(self, node):
+        return self.environment[node.name][self.visit(node.index)]
+
+    def visit_UncheckedArrayAssignNode(self, node):
+        array = self.environment[node.array_name]
+        index = self.visit(node.index)
+        value = array[index] = self.visit(node.value)
+        if trace.info:
+            trace.emit(f"Assigned {value} to {node.array_name}[{index}]")
+
+    def execute_OutputNode(self, node):
         output_value = self.visit(node.value)
-        print(f"Output: {output_value}")
-        return str(output_value)  # Ensure the output value is converted to a string
+        if trace.info:
+            trace.emit(f"Output: {output_value}")
+        self.writer.result(str(output_value))
+
+    visit_OutputNode = capture
 
     def visit_AssignNode(self, node):
         self.environment[node.name] = self.visit(node.expression)
         return f"Variable {node.name} assigned value {self.environment[node.name]}"
 
     def visit_VariableAccessNode(self, node):
-        if node.identifier in self.environment:
+        try:
             return self.environment[node.identifier]
-        else:
-            raise Exception(f"Undefined variable {node.identifier}")
+        except KeyError:
+            raise Exception(f"Undefined variable {node.identifier}") from None
+
+    def visit_TemporaryNode(self, node):
+        try:
+            return self.temporaries[node.name]
+        except KeyError:
+            value = self.temporaries[node.name] = self.visit(node.expression)
+            return value
+
+    def visit_ResetNode(self, node):
+        for name in node.names:
+            self.temporaries.pop(name, None)
 
     def visit_FunctionCallNode(self, node):
         func = global_namespace.get(node.function_name)
@@ -227,18 +329,121 @@ class Interpreter:
     def no_visit_method(self, node):
         raise Exception(f'No visit_{type(node).__name__} method')
 
-def run(code):
+def write_results(text, sink):
+    """Return text, or write it to sink as a line if one is given."""
+    if sink is None:
+        return text
+    if text:
+        sink.write(text + '\n')
+    return None
+
+def run_tree(ast, sink=None):
+    return Interpreter(sink=sink).interpret(ast)
+
+def run_vm(ast, sink=None):
+    return VM(global_namespace).run(compile_program(ast), sink)
+
+def run_closures(ast, sink=None):
+    return compile_closures(ast, global_namespace)(sink=sink)
+
+def run_python(ast, sink=None):
+    # ast may already be the code object, e.g. from ProgramCache.get_code()
+    if isinstance(ast, CodeType):
+        code = ast
+    else:
+        try:
+            code = compile_python(ast)
+        except NestingError:
+            # Too deep for CPython to compile; the closures run any depth the parser does
+            return run_closures(ast, sink)
+    return load(code, global_namespace)(sink)
+
+# Execution engines run() can select; every one must match the tree-walker
+# on the programs in conformance.py. Given a sink, each writes every result
+# to it as it is produced.
+ENGINES = {
+    'tree': run_tree,
+    'vm': run_vm,
+    'closure': run_closures,
+    'python': run_python,
+}
+
+def run(code, trace=None, cache=None, engine='tree', optimize=False, sink=None):
+    """Run Quetzal source given as a string, an open text file or an os.PathLike path.
+
+    trace optionally switches on trace channels for this run only, e.g. 'loop=info,interpreter'.
+    cache is a ProgramCache, or True for one in the default directory; string
+    sources found there run without being lexed or parsed again. It may also
+    be a ParseCache, which re-parses only the top-level statements it hasn't
+    seen before.
+    engine names an entry of ENGINES: 'tree' walks the AST, 'vm' compiles it
+    to bytecode for the stack VM, 'closure' turns each node into a Python
+    closure once and calls the root, and 'python' transpiles it to a Python
+    function; with a ProgramCache, that function's code object is what gets
+    cached.
+    optimize runs the optimizer's passes over the parsed program first.
+    sink is an output.Sink, e.g. a StreamSink on stdout, that receives the
+    results line by line instead of run() returning them as one string; run()
+    then returns None, and an error is written as the last line.
+    """
+    if trace is not None:
+        with tracing.configured(trace):
+            return run(code, cache=cache, engine=engine, optimize=optimize, sink=sink)
+    if isinstance(cache, ParseCache) and isinstance(code, str):
+        return run_program(cache.parse(code), engine, optimize, sink)
+    if cache and isinstance(code, str):
+        # Programs are stored as optimize leaves them, so a warm run skips the passes too
+        program_cache = cache if isinstance(cache, ProgramCache) else ProgramCache()
+        code_object = program_cache.get_code(code, optimize) if engine == 'python' else None
+        flat = program_cache.get(code, optimize) if code_object is None else None
+        if code_object is None and flat is None:
+            statements = parse_program(code, optimize)
+        else:
+            if optimize and optimizer_trace.info:
+                # The passes don't run again, but their warnings are traced as on a cold run
+                trace_type_errors(parse_program(code))
+            if code_object is not None:
+                return run_program(code_object, engine, sink=sink)
+            statements = flat.to_nodes()
+        if engine == 'python':
+            try:
+                code_object = program_cache.put_code(code, compile_python(statements), optimize)
+            except NestingError:
+                # Too deep for CPython; the tree stays cached for the closure engine
+                engine = 'closure'
+            else:
+                return run_program(code_object, engine, sink=sink)
+        if flat is None:
+            program_cache.put(code, statements, optimize)
+        return run_program(statements, engine, sink=sink)
     lexer = Lexer(code)
-    tokens = lexer.tokenize()
-    parser = Parser(tokens)
-    ast = parser.parse()
-    interpreter = Interpreter(parser)
+    # Strings are lexed into a compact TokenBuffer, which gives the parser
+    # random access and line numbers; files are streamed a line at a time.
+    tokens = lexer.tokenize() if isinstance(code, str) else lexer.stream()
+    return run_tokens(tokens, engine, optimize, sink)
+
+def parse_program(code, optimize=False):
+    """Parse source given as a string, optimizing it if asked."""
+    ast = Parser(Lexer(code).tokenize()).parse()
+    return optimize_program(ast) if optimize else ast
+
+def run_tokens(tokens, engine='tree', optimize=False, sink=None):
+    """Parse and run an already lexed token sequence, e.g. from an IncrementalLexer."""
+    return run_program(Parser(tokens).parse(), engine, optimize, sink)
+
+def run_program(ast, engine='tree', optimize=False, sink=None):
+    """Run an already parsed program with the named engine, optionally optimizing it first."""
     try:
-        result = interpreter.interpret(ast)
+        if optimize:
+            ast = optimize_program(ast)
+        result = ENGINES[engine](ast, sink)
         return result
     except Exception as e:
         print(f"Error during interpretation: {e}")
-        return f'Error: {str(e)}'
+        return write_results(f'Error: {str(e)}', sink)
+    finally:
+        if sink is not None:
+            sink.flush()
 
 if __name__ == "__main__":
     code = '''
@@ -1,97 +1,427 @@
+import os
 import re
+from array import array
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from sys import intern
+
+import tracing
+
+trace = tracing.get_channel('lexer')
+
+# Reserved words and their token types. Identifiers are scanned by a single
+# pattern and then classified here, instead of trying a regex per keyword.
+KEYWORDS = {
+    'string': 'TYPE_STRING',
+    'integer': 'TYPE_INTEGER',
+    'double': 'TYPE_DOUBLE',
+    'character': 'TYPE_CHARACTER',
+    'fun': 'FUN',
+    'if': 'IF',
+    'else_if': 'ELSE_IF',
+    'else': 'ELSE',
+    'then': 'THEN',
+    'stop': 'STOP',
+    'for': 'FOR',
+    'while': 'WHILE',
+    'from': 'FROM',
+    'to': 'TO',
+    'enqueue': 'ENQUEUE',
+    'dequeue': 'DEQUEUE',
+    'pop': 'POP',
+    'push': 'PUSH',
+    'peek': 'PEEK',
+    'pop_back': 'POP_BACK',
+    'push_back': 'PUSH_BACK',
+    'do': 'DO',
+    'until': 'UNTIL',
+    'array': 'ARRAY',
+}
+
+# Token patterns in priority order. At any position the first pattern that
+# matches wins, so multi-character operators stay ahead of their prefixes.
+TOKEN_PATTERNS = {
+    'STRING_LITERAL': r'"[^"]*"',
+    'FLOAT_LITERAL': r'\b\d+\.\d+\b',
+    'NUMBER': r'\b\d+\b',
+    'CHARACTER_LITERAL': r"'.'",
+    'NEW_LINE': r'\n',
+    'IDENTIFIER': r'\b[a-zA-Z_][a-zA-Z0-9_]*\b',
+    'INCREMENT': r'\+\+',
+    'DECREMENT': r'--',
+    'PLUS_EQUAL': r':\+',
+    'MINUS_EQUAL': r':-',
+    'EQUAL': r':=',
+    'GREATER': r'>',
+    'LESS': r'<',
+    'GREATER_EQUAL': r':>',
+    'LESS_EQUAL': r':<',
+    'NOT_EQUAL': r':!',
+    'AND': r':&',
+    'OR': r':\|',
+    'COLON': r':',
+    'OUTPUT': r'->',
+    'PLUS': r'\+',
+    'MINUS': r'-',
+    'DIVIDE': r'/',
+    'MULTIPLY': r'\*',
+    'COMMA': r',',
+    'OPEN_PAREN': r'\(',
+    'CLOSE_PAREN': r'\)',
+    'OPEN_BRACE': r'\{',
+    'CLOSE_BRACE': r'\}',
+    'SQUARE_OPEN': r'\[',
+    'SQUARE_CLOSE': r'\]',
+}
+
+# All patterns folded into one alternation of named groups, compiled once per
+# process. Regex alternation is tried left to right, so a single match call
+# picks exactly the token the first matching pattern above would.
+MASTER_PATTERN = re.compile('|'.join(f'(?P<{name}>{pattern})' for name, pattern in TOKEN_PATTERNS.items()))
+
+# Integer token-type codes. INDENT and DEDENT come first, then the patterns in
+# priority order, so the code for a match is simply its group number plus one,
+# and finally the keyword types.
+TOKEN_TYPES = ('INDENT', 'DEDENT') + tuple(TOKEN_PATTERNS) + tuple(KEYWORDS.values())
+TOKEN_CODES = {name: code for code, name in enumerate(TOKEN_TYPES)}
+INDENT = TOKEN_CODES['INDENT']
+DEDENT = TOKEN_CODES['DEDENT']
+IDENTIFIER = TOKEN_CODES['IDENTIFIER']
+KEYWORD_CODES = {word: TOKEN_CODES[name] for word, name in KEYWORDS.items()}
+
+# Identifier and keyword lexemes are interned, so the names the interpreter
+# later uses as environment keys compare by identity.
+WORD_CODES = frozenset([IDENTIFIER, *KEYWORD_CODES.values()])
+
+LEADING_WHITESPACE = re.compile(r'\s*')
+
+class TokenBuffer:
+    """Compact token storage backed by parallel arrays.
+
+    Each token is an integer type code plus start and end offsets into the
+    source. Lexemes are sliced out of the source only when they are asked for,
+    and indexing or iterating yields the usual (type, lexeme) tuples.
+    """
+    __slots__ = ('source', 'types', 'starts', 'ends', '_line_starts')
+
+    def __init__(self, source):
+        self.source = source
+        self.types = array('H')
+        self.starts = array('I')
+        self.ends = array('I')
+        self._line_starts = None
+
+    def append(self, code, start, end):
+        self.types.append(code)
+        self.starts.append(start)
+        self.ends.append(end)
+
+    def type_at(self, index):
+        """Return the token type name at index without touching the source."""
+        return TOKEN_TYPES[self.types[index]]
+
+    def lexeme_at(self, index):
+        """Return the lexeme at index, sliced from the source on demand."""
+        code = self.types[index]
+        start = self.starts[index]
+        end = self.ends[index]
+        if code in WORD_CODES:
+            return intern(self.source[start:end])
+        if code == INDENT:
+            return ' ' * (end - start)  # Indentation is reported as spaces whatever it was written with
+        return self.source[start:end]
+
+    def position_at(self, index):
+        """Return the 1-based (line, column) where the token at index starts."""
+        if self._line_starts is None:
+            self._line_starts = array('I', [0])
+            self._line_starts.extend(match.end() for match in re.finditer('\n', self.source))
+        offset = self.starts[index]
+        line = bisect_right(self._line_starts, offset)
+        return line, offset - self._line_starts[line - 1] + 1
+
+    def __len__(self):
+        return len(self.types)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        return (TOKEN_TYPES[self.types[index]], self.lexeme_at(index))
+
+    def __iter__(self):
+        for index in range(len(self.types)):
+            yield (TOKEN_TYPES[self.types[index]], self.lexeme_at(index))
+
+    def __repr__(self):
+        return f"TokenBuffer({len(self)} tokens)"
+
+def scan_tokens(text, start, end):
+    """Yield (code, start, end) spans for the tokens of the line text[start:end], ignoring indentation."""
+    match_token = MASTER_PATTERN.match
+    debug = trace.debug
+    position = start
+    while position < end:
+        match = match_token(text, position, end)
+        if match:
+            code = match.lastindex + 1
+            if code == IDENTIFIER:
+                code = KEYWORD_CODES.get(match.group(), IDENTIFIER)
+            if debug:
+                trace.emit(f"Generated Token: {TOKEN_TYPES[code]}, Value: '{match.group()}'")
+            yield (code, position, match.end())
+            position = match.end()
+        else:
+            if debug:
+                trace.emit(f"No match at position {position - start} in line: {text[start:end]}")
+            position += 1
+
+def _lex_chunk(chunk):
+    """Process pool worker: lex the lines of one chunk of source, leaving indentation to the caller.
+
+    Returns arrays of line start offsets, indent widths and the index of each
+    line's first token, plus the token arrays themselves. All offsets are
+    absolute positions in the full source.
+    """
+    text, base, last = chunk
+    line_starts = array('I')
+    indents = array('I')
+    first_tokens = array('I')
+    types = array('H')
+    starts = array('I')
+    ends = array('I')
+    start = 0
+    while True:
+        end = text.find('\n', start)
+        if end == -1:
+            if not last:
+                break  # A chunk other than the last always ends right after a newline
+            end = len(text)
+        line_starts.append(base + start)
+        indents.append(LEADING_WHITESPACE.match(text, start, end).end() - start)
+        first_tokens.append(len(types))
+        for code, token_start, token_end in scan_tokens(text, start, end):
+            types.append(code)
+            starts.append(base + token_start)
+            ends.append(base + token_end)
+        if end == len(text):
+            break
+        start = end + 1
+    return line_starts, indents, first_tokens, types, starts, ends
 
 class Lexer:
     def __init__(self, source_code):
+        """Source may be a string of code, an open text file or an os.PathLike path."""
         self.tokens = []
         self.source_code = source_code
         self.indent_stack = [0]  # Start with an initial indent level of 0
 
     def tokenize(self):
-        patterns = {
-            'TYPE_STRING': r'\bstring\b',
-            'TYPE_INTEGER': r'\binteger\b',
-            'TYPE_DOUBLE': r'\bdouble\b',
-            'TYPE_CHARACTER': r'\bcharacter\b',
-            'STRING_LITERAL': r'"[^"]*"',
-            'FLOAT_LITERAL': r'\b\d+\.\d+\b',
-            'NUMBER': r'\b\d+\b',
-            'CHARACTER_LITERAL': r"'.'",
-            'FUN': r'\bfun\b',
-            'IF': r'\bif\b',
-            'ELSE_IF': r'\belse_if\b',
-            'ELSE': r'\belse\b',
-            'THEN': r'\bthen\b',
-            'STOP': r'\bstop\b',
-            'FOR': r'\bfor\b',
-            'WHILE': r'\bwhile\b',
-            'FROM': r'\bfrom\b',
-            'TO': r'\bto\b',
-            'ENQUEUE': r'\benqueue\b',
-            'DEQUEUE': r'\bdequeue\b',
-            'POP': r'\bpop\b',
-            'PUSH': r'\bpush\b',
-            'PEEK': r'\bpeek\b',
-            'POP_BACK': r'\bpop_back\b',
-            'PUSH_BACK': r'\bpush_back\b',
-            'DO': r'\bdo\b',
-            'UNTIL': r'\buntil\b',
-            'ARRAY': r'\barray\b',
-            'NEW_LINE': r'\n',
-            'IDENTIFIER': r'\b[a-zA-Z_][a-zA-Z0-9_]*\b',
-            'INCREMENT': r'\+\+',
-            'DECREMENT': r'--',
-            'PLUS_EQUAL': r':\+',
-            'MINUS_EQUAL': r':-',
-            'EQUAL': r':=',
-            'GREATER': r'>',
-            'LESS': r'<',
-            'GREATER_EQUAL': r':>',
-            'LESS_EQUAL': r':<',
-            'NOT_EQUAL': r':!',
-            'AND': r':&',
-            'OR': r':\|',
-            'COLON': r':',
-            'OUTPUT': r'->',
-            'PLUS': r'\+',
-            'MINUS': r'-',
-            'DIVIDE': r'/',
-            'MULTIPLY': r'\*',
-            'COMMA': r',',
-            'OPEN_PAREN': r'\(',
-            'CLOSE_PAREN': r'\)',
-            'OPEN_BRACE': r'\{',
-            'CLOSE_BRACE': r'\}',
-            'SQUARE_OPEN': r'\[',
-            'SQUARE_CLOSE': r'\]',
-        }
-
-        for line in self.source_code.split('\n'):
-            position = 0
-            current_indent = len(line) - len(line.lstrip())
+        """Lex a string source into a TokenBuffer without copying any lexemes."""
+        source = self.source_code
+        if not isinstance(source, str):
+            self.tokens.extend(self.stream())
+            return self.tokens
+        self.tokens = buffer = TokenBuffer(source)
+        append = buffer.append
+        start = 0
+        while True:
+            end = source.find('\n', start)
+            if end == -1:
+                end = len(source)
+            for code, token_start, token_end in self.scan(source, start, end):
+                append(code, token_start, token_end)
+            if end == len(source):
+                return buffer
+            start = end + 1
+
+    def tokenize_parallel(self, workers=None, min_chunk_size=1 << 18):
+        """Lex a large string source across a process pool; the result equals tokenize().
+
+        The source is cut into chunks at line boundaries and each chunk is
+        lexed in a worker process without indentation tracking. A sequential
+        pass then replays the per-line indent widths through the indent stack,
+        inserting the INDENT/DEDENT tokens between runs of copied tokens.
+        """
+        source = self.source_code
+        if not isinstance(source, str):
+            return self.tokenize()
+        workers = workers or os.cpu_count() or 1
+        # A few chunks per worker keeps the pool busy when lines vary in density
+        chunk_size = max(min_chunk_size, -(-len(source) // (workers * 4)))
+        chunks = []
+        start = 0
+        while True:
+            end = source.find('\n', start + chunk_size - 1)
+            if end == -1:
+                chunks.append((source[start:], start, True))
+                break
+            chunks.append((source[start:end + 1], start, False))
+            start = end + 1
+        if len(chunks) == 1:
+            return self.tokenize()
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = executor.map(_lex_chunk, chunks)
+
+            self.tokens = buffer = TokenBuffer(source)
+            types, starts, ends = buffer.types, buffer.starts, buffer.ends
+            indent_stack = self.indent_stack
+            for line_starts, indents, first_tokens, chunk_types, chunk_starts, chunk_ends in results:
+                copied = 0
+                for line, current_indent in enumerate(indents):
+                    previous_indent = indent_stack[-1]
+                    if current_indent == previous_indent:
+                        continue
+                    first = first_tokens[line]
+                    types.extend(chunk_types[copied:first])
+                    starts.extend(chunk_starts[copied:first])
+                    ends.extend(chunk_ends[copied:first])
+                    copied = first
+                    line_start = line_starts[line]
+                    if current_indent > previous_indent:
+                        indent_stack.append(current_indent)
+                        buffer.append(INDENT, line_start, line_start + current_indent)
+                    while current_indent < previous_indent:
+                        indent_stack.pop()
+                        previous_indent = indent_stack[-1]
+                        buffer.append(DEDENT, line_start, line_start)
+                types.extend(chunk_types[copied:])
+                starts.extend(chunk_starts[copied:])
+                ends.extend(chunk_ends[copied:])
+        return buffer
+
+    def stream(self):
+        """Lazily yield tokens, reading and lexing the source one line at a time."""
+        for line in self.lines():
+            yield from self.tokenize_line(line)
+
+    def lines(self):
+        """Yield source lines without their newline, matching str.split('\\n')."""
+        source = self.source_code
+        if isinstance(source, str):
+            start = 0
+            end = source.find('\n')
+            while end != -1:
+                yield source[start:end]
+                start = end + 1
+                end = source.find('\n', start)
+            yield source[start:]
+        elif isinstance(source, os.PathLike):
+            with open(source, 'r', newline='') as file:
+                yield from self._file_lines(file)
+        else:
+            yield from self._file_lines(source)
+
+    def _file_lines(self, file):
+        line = ''
+        for line in file:
+            yield line[:-1] if line.endswith('\n') else line
+        # split('\n') always ends with the text after the last newline, even when empty
+        if line == '' or line.endswith('\n'):
+            yield ''
+
+    def tokenize_line(self, line):
+        """Yield the tokens of a single line, including any INDENT/DEDENT it opens with."""
+        for code, start, end in self.scan(line, 0, len(line)):
+            if code in WORD_CODES:
+                yield (TOKEN_TYPES[code], intern(line[start:end]))
+            elif code == INDENT:
+                yield ('INDENT', ' ' * (end - start))
+            else:
+                yield (TOKEN_TYPES[code], line[start:end])
+
+    def scan(self, text, start, end):
+        """Yield (code, start, end) spans for the line text[start:end].
+
+        The line is matched in place, so no substring is made for it or for
+        its tokens. Leading INDENT/DEDENT tokens update the indent stack.
+        """
+        current_indent = LEADING_WHITESPACE.match(text, start, end).end() - start
+        previous_indent = self.indent_stack[-1]
+
+        if current_indent > previous_indent:
+            self.indent_stack.append(current_indent)
+            yield (INDENT, start, start + current_indent)
+        while current_indent < previous_indent:
+            self.indent_stack.pop()
             previous_indent = self.indent_stack[-1]
+            yield (DEDENT, start, start)
+
+        yield from scan_tokens(text, start, end)
+
+class IncrementalLexer:
+    """Line-incremental lexer for editors.
+
+    Tokens are kept per line together with a checkpoint of the indent stack at
+    the start of every line. An edit re-lexes the changed lines and then keeps
+    going only while the indent state differs from the old checkpoints; the
+    remaining lines are reused untouched.
+    """
+    def __init__(self, source_code=''):
+        self.lines = []
+        self.line_tokens = []  # Tokens of each line, INDENT/DEDENT included
+        self.checkpoints = [(0,)]  # Indent stack at the start of each line, plus one for the end
+        self.edit(0, 0, source_code)
+
+    def tokens(self):
+        """Return the full token list, identical to Lexer(source).tokenize()."""
+        return [token for line in self.line_tokens for token in line]
+
+    def source(self):
+        return '\n'.join(self.lines)
+
+    def set_text(self, source_code):
+        """Bring the lexer up to date with a new version of the whole text.
+
+        Lines shared with the old text at the start and end are detected and
+        kept, so a typical keystroke turns into a one-line edit.
+        Returns the number of lines that were re-lexed.
+        """
+        new_lines = source_code.split('\n')
+        old_lines = self.lines
+        limit = min(len(new_lines), len(old_lines))
+        prefix = 0
+        while prefix < limit and new_lines[prefix] == old_lines[prefix]:
+            prefix += 1
+        suffix = 0
+        while suffix < limit - prefix and new_lines[-1 - suffix] == old_lines[-1 - suffix]:
+            suffix += 1
+        return self._replace(prefix, len(old_lines) - suffix, new_lines[prefix:len(new_lines) - suffix])
+
+    def edit(self, start_line, end_line, text):
+        """Replace lines [start_line, end_line) with text, given as a string or a list of lines.
+
+        Returns the number of lines that were re-lexed.
+        """
+        if not 0 <= start_line <= end_line <= len(self.lines):
+            raise IndexError(f"Edit range {start_line}:{end_line} outside of {len(self.lines)} lines")
+        new_lines = text.split('\n') if isinstance(text, str) else list(text)
+        return self._replace(start_line, end_line, new_lines)
+
+    def _replace(self, start, end, new_lines):
+        lexer = Lexer('')
+        lexer.indent_stack = list(self.checkpoints[start])
+        new_tokens = []
+        new_checkpoints = []
+        for line in new_lines:
+            new_checkpoints.append(tuple(lexer.indent_stack))
+            new_tokens.append(list(lexer.tokenize_line(line)))
+
+        # Lines after the edit only need re-lexing while the indent state
+        # entering them differs from what it was before the edit.
+        stop = end
+        while stop < len(self.lines) and tuple(lexer.indent_stack) != self.checkpoints[stop]:
+            new_checkpoints.append(tuple(lexer.indent_stack))
+            new_tokens.append(list(lexer.tokenize_line(self.lines[stop])))
+            new_lines.append(self.lines[stop])
+            stop += 1
 
-            if current_indent > previous_indent:
-                self.indent_stack.append(current_indent)
-                self.tokens.append(('INDENT', ' ' * current_indent))
-            while current_indent < previous_indent:
-                self.indent_stack.pop()
-                previous_indent = self.indent_stack[-1]
-                self.tokens.append(('DEDENT', ''))
-
-            while position < len(line):
-                match = None
-                for token_type, pattern in patterns.items():
-                    regex = re.compile(pattern)
-                    match = regex.match(line, position)
-                    if match:
-                        self.tokens.append((token_type, match.group()))
-                        print(f"Generated Token: {token_type}, Value: '{match.group()}'")
-                        position = match.end()
-                        break
-                if not match:
-                    print(f"No match at position {position} in line: {line}")
-                    position += 1
-        return self.tokens
+        self.lines[start:stop] = new_lines
+        self.line_tokens[start:stop] = new_tokens
+        self.checkpoints[start:stop] = new_checkpoints
+        # Either unchanged, or the final indent state when re-lexing ran to the end
+        self.checkpoints[start + len(new_lines)] = tuple(lexer.indent_stack)
+        return len(new_lines)
 
 # Example usage
 if __name__ == "__main__":
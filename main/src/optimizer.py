@@ -0,0 +1,1019 @@
+import operator
+
+import math_utils
+import string_utils
+import tracing
+from ast import (
+    ArrayAccessNode,
+    ArrayAssignNode,
+    ArrayDeclarationNode,
+    AssignNode,
+    BinaryOperatorNode,
+    CharacterNode,
+    ConcatenateNode,
+    DecrementNode,
+    DoWhileNode,
+    DoubleNode,
+    DoubleOperatorNode,
+    FlatAST,
+    ForLoopNode,
+    FunctionCallNode,
+    FunctionDeclaration,
+    IfNode,
+    IncrementNode,
+    IntegerOperatorNode,
+    Node,
+    NodeTransformer,
+    NumberNode,
+    ResetNode,
+    StopNode,
+    StringLiteralNode,
+    TemporaryNode,
+    UnaryOperatorNode,
+    UncheckedArrayAccessNode,
+    UncheckedArrayAssignNode,
+    VariableAccessNode,
+    VariableDeclarationNode,
+    WhileLoopNode,
+    rebuild,
+)
+from inference import INTEGER, NUMERIC, STRING, check_types, infer_types
+
+trace = tracing.get_channel('optimizer')
+
+LITERALS = (NumberNode, StringLiteralNode, CharacterNode, DoubleNode)
+LOOPS = (WhileLoopNode, DoWhileNode, ForLoopNode)
+
+# Operators that can give back an array: + and * build new ones, AND and OR
+# return an operand.
+ARRAY_OPERATORS = ('PLUS', 'MULTIPLY', 'AND', 'OR')
+
+# Stands for the items of every array in the names array_names() returns
+ARRAY_ITEMS = '[]'
+
+# Operators folded when both operands are literals; AND and OR are handled
+# separately since they return one of their operands.
+FOLDABLE_OPERATORS = {
+    'PLUS': operator.add,
+    'MINUS': operator.sub,
+    'MULTIPLY': operator.mul,
+    'DIVIDE': operator.truediv,
+    'EQUAL': operator.eq,
+    'NOT_EQUAL': operator.ne,
+    'GREATER': operator.gt,
+    'LESS': operator.lt,
+    'GREATER_EQUAL': operator.ge,
+    'LESS_EQUAL': operator.le,
+}
+
+# Builtins with no side effects, which can run at compile time on constant
+# arguments. These are the same functions the interpreter's namespace binds.
+PURE_FUNCTIONS = {
+    'pow': math_utils.pow,
+    'sqrt': math_utils.sqrt,
+    'upper': string_utils.upper,
+    'lower': string_utils.lower,
+}
+
+# Folding must not do unbounded work for code that may never run
+MAX_FOLDED_EXPONENT = 256
+MAX_FOLDED_LENGTH = 4096
+
+def is_literal(node):
+    return isinstance(node, LITERALS)
+
+def make_literal(node_type, value):
+    """Return a node_type literal holding value as it is; the parser's constructors strip quotes from it."""
+    node = Node.__new__(node_type)
+    node.value = value
+    return node
+
+def literal(value):
+    """Return a literal node evaluating to value, or None if no node type can hold it."""
+    if isinstance(value, (bool, int)):
+        return make_literal(NumberNode, value)
+    if isinstance(value, float):
+        return make_literal(DoubleNode, value)
+    if isinstance(value, str):
+        if len(value) > MAX_FOLDED_LENGTH:
+            return None
+        return make_literal(StringLiteralNode, value)
+    return None
+
+def assignment_counts(statements):
+    """Count, per variable, the declarations and the other statements that rebind it."""
+    declarations = {}
+    rebinds = {}
+
+    def walk(value):
+        if isinstance(value, Node):
+            if isinstance(value, VariableDeclarationNode):
+                declarations[value.name] = declarations.get(value.name, 0) + 1
+            elif isinstance(value, (AssignNode, ArrayDeclarationNode)):
+                rebinds[value.name] = rebinds.get(value.name, 0) + 1
+            elif isinstance(value, (IncrementNode, DecrementNode, ForLoopNode)):
+                if isinstance(value.identifier, str):
+                    rebinds[value.identifier] = rebinds.get(value.identifier, 0) + 1
+            for name in value._fields:
+                walk(getattr(value, name))
+        elif isinstance(value, (list, tuple)):
+            for item in value:
+                walk(item)
+
+    walk(statements)
+    return declarations, rebinds
+
+class ConstantFolder(NodeTransformer):
+    """Folds constant expressions and propagates constant variables.
+
+    Operators and pure builtin calls whose operands are all literals are
+    replaced by their value, as computed by the same Python operation the
+    engines use. An operation that would fail, such as a division by zero,
+    is left in place to fail at run time.
+
+    A variable declared exactly once and never assigned, incremented or used
+    as a loop variable holds the same value from its declaration on. If that
+    value is constant, reads of it in the statements following the
+    declaration in its block, including nested blocks, become the literal.
+    Reads anywhere else might run before the declaration and are left alone.
+    """
+    def __init__(self):
+        self.constants = set()
+        self.known = {}
+
+    def run(self, statements):
+        declarations, rebinds = assignment_counts(statements)
+        self.constants = {name for name, count in declarations.items() if count == 1 and name not in rebinds}
+        return super().run(statements)
+
+    def visit_list(self, items):
+        # A declaration's value is only known in the rest of its own block
+        saved = self.known
+        self.known = dict(saved)
+        try:
+            return super().visit_list(items)
+        finally:
+            self.known = saved
+
+    def visit_VariableDeclarationNode(self, node):
+        node = self.generic_visit(node)
+        if node.name in self.constants and is_literal(node.expression):
+            self.known[node.name] = node.expression
+        return node
+
+    def visit_VariableAccessNode(self, node):
+        value = self.known.get(node.identifier)
+        if value is None:
+            return node
+        return make_literal(type(value), value.value)
+
+    def visit_BinaryOperatorNode(self, node):
+        node = self.generic_visit(node)
+        if not is_literal(node.left):
+            return node
+        left = node.left.value
+        # Like the engines, AND and OR give back one of their operands
+        if node.operator == 'AND':
+            return node.right if left else node.left
+        if node.operator == 'OR':
+            return node.left if left else node.right
+        if not is_literal(node.right):
+            return node
+        right = node.right.value
+        function = FOLDABLE_OPERATORS.get(node.operator)
+        if function is None or self.too_large(node.operator, left, right):
+            return node
+        return self.fold(node, function, left, right)
+
+    def visit_UnaryOperatorNode(self, node):
+        node = self.generic_visit(node)
+        if not is_literal(node.operand):
+            return node
+        if node.operator == 'NEGATE':
+            return self.fold(node, operator.neg, node.operand.value)
+        if node.operator == 'NOT':
+            return self.fold(node, operator.not_, node.operand.value)
+        return node
+
+    def visit_FunctionCallNode(self, node):
+        node = self.generic_visit(node)
+        function = PURE_FUNCTIONS.get(node.function_name)
+        if function is None or not all(is_literal(argument) for argument in node.arguments):
+            return node
+        arguments = [argument.value for argument in node.arguments]
+        if function is math_utils.pow and len(arguments) == 2 and self.too_large('POW', *arguments):
+            return node
+        return self.fold(node, function, *arguments)
+
+    @staticmethod
+    def too_large(operator_name, left, right):
+        """Whether folding would build a huge string or number."""
+        if operator_name == 'MULTIPLY':
+            for sequence, count in ((left, right), (right, left)):
+                if isinstance(sequence, str) and isinstance(count, int) and len(sequence) * count > MAX_FOLDED_LENGTH:
+                    return True
+        elif operator_name == 'POW':
+            return isinstance(right, (int, float)) and abs(right) > MAX_FOLDED_EXPONENT
+        return False
+
+    @staticmethod
+    def fold(node, function, *values):
+        try:
+            result = function(*values)
+        except Exception:
+            return node
+        folded = literal(result)
+        return node if folded is None else folded
+
+def group(statements):
+    """Return a statement that runs statements and evaluates to their joined results, as a taken if does."""
+    return IfNode(NumberNode(1), statements, [], None)
+
+def is_group(node):
+    return (isinstance(node, IfNode) and is_literal(node.condition) and node.condition.value
+            and not node.elif_blocks and not node.else_block)
+
+class DeadCodeEliminator(NodeTransformer):
+    """Removes code that cannot run or whose result cannot be seen.
+
+    Every if and loop evaluates to the joined results of its body, even when
+    nothing ran, and that value becomes an entry in the enclosing block's
+    results, so blank lines in the output depend on it. A pruned statement
+    therefore becomes a group, an if whose condition is a true literal,
+    keeping exactly the body that would have run:
+
+    - an if or else_if with a literal condition keeps only the branch taken,
+      and else_if blocks after a true one are dropped;
+    - a while loop with a false literal condition becomes an empty group,
+      and a do-while loop with one runs its body once as a group;
+    - statements after a stop in the same block never run, since stop
+      aborts the program.
+
+    Only the top-level block drops falsy results, so there an empty group or
+    a falsy literal statement is removed outright. Anywhere else the value of
+    an expression statement is part of the output and is kept.
+    """
+    def run(self, statements):
+        statements = super().run(statements)
+        kept = [statement for statement in statements if not self.discarded(statement)]
+        return kept if len(kept) != len(statements) else statements
+
+    @staticmethod
+    def discarded(statement):
+        """Whether a top-level statement is pure and always evaluates to a falsy result."""
+        if is_literal(statement):
+            return not statement.value
+        return is_group(statement) and not statement.then_block
+
+    def visit_list(self, items):
+        items = super().visit_list(items)
+        for position, item in enumerate(items):
+            if isinstance(item, StopNode) and position + 1 < len(items):
+                return items[:position + 1]
+        return items
+
+    def visit_IfNode(self, node):
+        node = self.generic_visit(node)
+        if is_group(node):
+            return node
+        elif_blocks = self.live_elif_blocks(node.elif_blocks or [])
+        if not is_literal(node.condition):
+            if len(elif_blocks) == len(node.elif_blocks or []):
+                return node
+            return IfNode(node.condition, node.then_block, elif_blocks, node.else_block)
+        if node.condition.value:
+            return group(node.then_block)
+        # The else block runs whenever the if condition was false
+        else_block = node.else_block or []
+        if not elif_blocks:
+            return group(else_block)
+        condition, block = elif_blocks[0]
+        if is_literal(condition):  # Necessarily true, after live_elif_blocks
+            return group(block + else_block)
+        return IfNode(node.condition, [], elif_blocks, node.else_block)
+
+    @staticmethod
+    def live_elif_blocks(elif_blocks):
+        """Drop else_if blocks that are false or come after one that is always taken."""
+        live = []
+        for condition, block in elif_blocks:
+            if is_literal(condition):
+                if not condition.value:
+                    continue
+                live.append((condition, block))
+                break
+            live.append((condition, block))
+        return live
+
+    def visit_WhileLoopNode(self, node):
+        node = self.generic_visit(node)
+        if is_literal(node.condition) and not node.condition.value:
+            return group([])
+        return node
+
+    def visit_DoWhileNode(self, node):
+        node = self.generic_visit(node)
+        if is_literal(node.condition) and not node.condition.value:
+            return group(node.body)
+        return node
+
+def written_names(node):
+    """Return the variables and temporaries node may rebind or reset, and whether it may change an array item."""
+    names = set()
+    mutates = False
+
+    def walk(value):
+        nonlocal mutates
+        if isinstance(value, Node):
+            if isinstance(value, (VariableDeclarationNode, AssignNode, ArrayDeclarationNode)):
+                names.add(value.name)
+            elif isinstance(value, (IncrementNode, DecrementNode, ForLoopNode)):
+                if isinstance(value.identifier, str):
+                    names.add(value.identifier)
+                elif not isinstance(value, ForLoopNode):
+                    mutates = True
+            elif isinstance(value, ArrayAssignNode):
+                mutates = True
+            elif isinstance(value, ResetNode):
+                names.update(value.names)
+            for name in value._fields:
+                walk(getattr(value, name))
+        elif isinstance(value, (list, tuple)):
+            for item in value:
+                walk(item)
+
+    walk(node)
+    return names, mutates
+
+def may_be_array(node, arrays):
+    """Whether node may evaluate to an array, given the variables that may hold one."""
+    if isinstance(node, LITERALS + (UnaryOperatorNode,)):
+        return False
+    if isinstance(node, FunctionCallNode):
+        return node.function_name not in PURE_FUNCTIONS
+    if isinstance(node, VariableAccessNode):
+        return node.identifier in arrays
+    if isinstance(node, ArrayAccessNode):
+        return ARRAY_ITEMS in arrays
+    if isinstance(node, TemporaryNode):
+        return may_be_array(node.expression, arrays)
+    if isinstance(node, BinaryOperatorNode):
+        return node.operator in ARRAY_OPERATORS and (may_be_array(node.left, arrays) or may_be_array(node.right, arrays))
+    return True
+
+def array_names(statements):
+    """Return the variables that may hold an array, declared as one or assigned one from another.
+
+    The result includes ARRAY_ITEMS if an array item may itself be an array.
+    """
+    arrays = set()
+    bindings = []
+
+    def walk(value):
+        if isinstance(value, Node):
+            if isinstance(value, ArrayDeclarationNode):
+                arrays.add(value.name)
+                bindings.extend((ARRAY_ITEMS, element) for element in value.elements)
+            elif isinstance(value, ArrayAssignNode):
+                bindings.append((ARRAY_ITEMS, value.value))
+            elif isinstance(value, (VariableDeclarationNode, AssignNode)):
+                bindings.append((value.name, value.expression))
+            for name in value._fields:
+                walk(getattr(value, name))
+        elif isinstance(value, (list, tuple)):
+            for item in value:
+                walk(item)
+
+    walk(statements)
+    changed = True
+    while changed:
+        changed = False
+        for name, expression in bindings:
+            if name not in arrays and may_be_array(expression, arrays):
+                arrays.add(name)
+                changed = True
+    return arrays
+
+def next_temporary(statements, prefix):
+    """Return the first number not used by a temporary named prefix + number in statements."""
+    numbers = [-1]
+
+    def walk(value):
+        if isinstance(value, Node):
+            names = value.names if isinstance(value, ResetNode) else [value.name] if isinstance(value, TemporaryNode) else []
+            for name in names:
+                if name.startswith(prefix) and name[len(prefix):].isdigit():
+                    numbers.append(int(name[len(prefix):]))
+            for name in value._fields:
+                walk(getattr(value, name))
+        elif isinstance(value, (list, tuple)):
+            for item in value:
+                walk(item)
+
+    walk(statements)
+    return max(numbers) + 1
+
+class LoopInvariantMotion(NodeTransformer):
+    """Computes expressions that cannot change inside a loop once per loop run.
+
+    An expression is invariant in a loop when it only combines literals,
+    variables the loop never rebinds, pure builtin calls and, if the loop
+    changes no array item, items of arrays it never rebinds. Each largest
+    such expression in a while or do-while loop's condition and body, or in
+    a for loop's body, becomes a temporary, and a reset of the loop's
+    temporaries goes right before the loop.
+
+    A temporary is computed where the expression was first reached, not in
+    front of the loop: a loop that never runs it must not fail on it, and
+    since an error aborts the program, an expression computed early could
+    change which error is reported. Expressions that may give an array are
+    never shared, as two variables could end up holding the same one.
+    """
+    prefix = '$loop'
+
+    def __init__(self):
+        self.count = 0
+        self.arrays = set()
+        self.written = set()
+        self.mutates = False
+        self.hoisted = []
+
+    def run(self, statements):
+        self.arrays = array_names(statements)
+        self.count = next_temporary(statements, self.prefix)
+        return super().run(statements)
+
+    def visit_list(self, items):
+        # Only a loop in a block has a place for its reset
+        result = []
+        changed = False
+        for item in items:
+            if not isinstance(item, LOOPS):
+                new = self.visit_value(item)
+            else:
+                names, new = self.hoist(item)
+                if names:
+                    result.append(ResetNode(names))
+            changed = changed or new is not item
+            result.append(new)
+        return result if changed else items
+
+    def hoist(self, loop):
+        """Return the names of the temporaries taken out of loop, and the rewritten loop."""
+        self.written, self.mutates = written_names(loop)
+        self.hoisted = names = []
+        if isinstance(loop, ForLoopNode):
+            # The end value is computed once anyway
+            values = [loop.identifier, loop.end_value, self.motion(loop.body)]
+        else:
+            values = [self.motion(getattr(loop, name)) for name in loop._fields]
+        # Loops nested in this one get their own temporaries
+        new = self.generic_visit(rebuild(loop, values))
+        if all(getattr(new, name) is getattr(loop, name) for name in loop._fields):
+            return names, loop
+        return names, new
+
+    def motion(self, value):
+        """Return value with each largest invariant expression in it replaced by a temporary."""
+        if isinstance(value, list):
+            items = [self.motion(item) for item in value]
+            return value if all(new is old for new, old in zip(items, value)) else items
+        if isinstance(value, tuple):
+            items = tuple(self.motion(item) for item in value)
+            return value if all(new is old for new, old in zip(items, value)) else items
+        if not isinstance(value, Node) or isinstance(value, FunctionDeclaration):
+            return value
+        if self.invariant(value):
+            if is_literal(value) or isinstance(value, (VariableAccessNode, TemporaryNode)) or may_be_array(value, self.arrays):
+                return value
+            name = f'{self.prefix}{self.count}'
+            self.count += 1
+            self.hoisted.append(name)
+            return TemporaryNode(name, value)
+        if isinstance(value, (IncrementNode, DecrementNode)) and isinstance(value.identifier, ArrayAccessNode):
+            # The item is changed in place; only its index can be shared
+            target = value.identifier
+            index = self.motion(target.index)
+            return value if index is target.index else type(value)(ArrayAccessNode(target.name, index))
+        values = [self.motion(getattr(value, name)) for name in value._fields]
+        if all(new is getattr(value, name) for new, name in zip(values, value._fields)):
+            return value
+        return rebuild(value, values)
+
+    def invariant(self, node):
+        """Whether node is a pure expression with the same value everywhere in the current loop."""
+        if is_literal(node):
+            return True
+        if isinstance(node, (VariableAccessNode, TemporaryNode)):
+            return (node.identifier if isinstance(node, VariableAccessNode) else node.name) not in self.written
+        if isinstance(node, BinaryOperatorNode):
+            return self.invariant(node.left) and self.invariant(node.right)
+        if isinstance(node, UnaryOperatorNode):
+            return self.invariant(node.operand)
+        if isinstance(node, ArrayAccessNode):
+            return not self.mutates and node.name not in self.written and self.invariant(node.index)
+        if isinstance(node, FunctionCallNode):
+            return node.function_name in PURE_FUNCTIONS and all(self.invariant(argument) for argument in node.arguments)
+        return False
+
+def structure(node):
+    """Return a hashable key equal for nodes that are structurally the same.
+
+    Literal values are keyed with their type, and floats by their repr, so
+    that 1, 1.0, True and 0.0, -0.0, which compare equal but print
+    differently, never share a key.
+    """
+    if isinstance(node, Node):
+        return (type(node).__name__,) + tuple(structure(getattr(node, name)) for name in node._fields)
+    if isinstance(node, (list, tuple)):
+        return tuple(structure(item) for item in node)
+    if isinstance(node, float):
+        return float, repr(node)
+    return type(node), node
+
+# Expressions whose value only depends on the variables and array items
+# they read, and that are worth computing once.
+SHAREABLE = (BinaryOperatorNode, UnaryOperatorNode, ArrayAccessNode, FunctionCallNode)
+
+class CommonSubexpressionEliminator(NodeTransformer):
+    """Computes an expression repeated within a block once, into a temporary.
+
+    Structurally equal pure expressions share a temporary while nothing
+    they read can have changed between them: an assignment, declaration,
+    increment, decrement or loop rebinding a variable ends the sharing of
+    every expression reading it, and an array assignment or an increment or
+    decrement of an item ends it for every expression reading array items.
+    A loop's writes end sharing before its condition and body, as they may
+    run again after any of them. Values first computed in a nested block
+    are only shared within it.
+
+    Each block resets the temporaries first computed in it when it starts,
+    so a loop body computes them again on every iteration. As with
+    LoopInvariantMotion, a temporary is computed where it is first
+    reached, never earlier. The block is walked twice: once to count each
+    value's uses, then to put temporaries where a value is used more than
+    once.
+    """
+    prefix = '$cse'
+
+    def __init__(self):
+        self.arrays = set()
+        self.count = 0
+        self.available = {}
+        self.opened = []
+        self.reads = []
+        self.uses = []
+        self.counts = None
+        self.names = {}
+        self.unstable = frozenset()
+        self.unstable_items = False
+        self.descriptions = {}
+
+    def run(self, statements):
+        self.arrays = array_names(statements)
+        self.descriptions = {}
+        self.count = next_temporary(statements, self.prefix)
+        # Counting pass, then the rewriting pass, which opens the same windows
+        self.block(list(statements))
+        self.counts = self.uses
+        self.available, self.reads, self.uses = {}, [], []
+        return self.block(list(statements))
+
+    def block(self, statements):
+        """Return statements with repeated values shared, resetting the temporaries computed first in them."""
+        saved = self.available, self.opened
+        self.available, self.opened = dict(self.available), []
+        try:
+            items = self.visit_list(statements)
+            names = [self.names[window] for window in self.opened if window in self.names]
+        finally:
+            self.available, self.opened = saved
+        return [ResetNode(names)] + items if names else items
+
+    def visit(self, node):
+        key = self.key(node)
+        if key is None:
+            return super().visit(node)
+        return self.share(node, key)
+
+    def key(self, node):
+        """Return the structure of node if its value can be shared, else None."""
+        description = self.describe(node) if isinstance(node, SHAREABLE) else None
+        if description is None:
+            return None
+        key, names, items, array = description
+        if array or items and self.unstable_items or not self.unstable.isdisjoint(names):
+            return None
+        return key
+
+    def describe(self, node):
+        """Describe a pure expression as (structure, names it reads, whether it reads array items, whether it may be an array).
+
+        Returns None for anything else. Descriptions are computed bottom-up
+        once per node, as both walks ask for every expression and its
+        subexpressions.
+        """
+        try:
+            return self.descriptions[id(node)]
+        except KeyError:
+            pass
+        description = None
+        if is_literal(node):
+            description = structure(node), frozenset(), False, False
+        elif isinstance(node, VariableAccessNode):
+            description = structure(node), frozenset([node.identifier]), False, node.identifier in self.arrays
+        elif isinstance(node, TemporaryNode):
+            description = ('TemporaryNode', node.name), frozenset([node.name]), False, may_be_array(node, self.arrays)
+        elif isinstance(node, (BinaryOperatorNode, UnaryOperatorNode, ArrayAccessNode)) or (
+                isinstance(node, FunctionCallNode) and node.function_name in PURE_FUNCTIONS):
+            operands = [self.describe(operand) for operand in self.operands(node)]
+            if None not in operands:
+                names = frozenset().union(*(operand[1] for operand in operands))
+                items = any(operand[2] for operand in operands)
+                array = False
+                if isinstance(node, ArrayAccessNode):
+                    names |= {node.name}
+                    items = True
+                    array = ARRAY_ITEMS in self.arrays
+                elif isinstance(node, BinaryOperatorNode):
+                    array = node.operator in ARRAY_OPERATORS and any(operand[3] for operand in operands)
+                description = self.structure(node), names, items, array
+        self.descriptions[id(node)] = description
+        return description
+
+    def structure(self, node):
+        """structure(node), reusing the structures of its already described operands."""
+        def field(value):
+            if isinstance(value, Node):
+                return self.descriptions[id(value)][0]
+            if isinstance(value, list):
+                return tuple(map(field, value))
+            return structure(value)
+        return (type(node).__name__,) + tuple(field(getattr(node, name)) for name in node._fields)
+
+    @staticmethod
+    def operands(node):
+        if isinstance(node, BinaryOperatorNode):
+            return node.left, node.right
+        if isinstance(node, UnaryOperatorNode):
+            return node.operand,
+        if isinstance(node, ArrayAccessNode):
+            return node.index,
+        return node.arguments
+
+    def share(self, node, key):
+        window = self.available.get(key)
+        if window is not None:
+            self.uses[window] += 1
+            return node if self.counts is None else TemporaryNode(self.names[window], node)
+        window = len(self.uses)
+        self.uses.append(1)
+        self.reads.append(self.descriptions[id(node)][1:3])
+        self.available[key] = window
+        self.opened.append(window)
+        new = self.generic_visit(node)
+        if self.counts is None or self.counts[window] < 2:
+            return new
+        self.names[window] = name = f'{self.prefix}{self.count}'
+        self.count += 1
+        return TemporaryNode(name, new)
+
+    def invalidate(self, names=(), items=False):
+        """Stop sharing the values that read any of names, or array items if items is true."""
+        names = set(names)
+        for key, window in list(self.available.items()):
+            reads, reads_items = self.reads[window]
+            if items and reads_items or not names.isdisjoint(reads):
+                del self.available[key]
+
+    def invalidate_writes(self, node):
+        self.invalidate(*written_names(node))
+
+    def visit_TemporaryNode(self, node):
+        return node
+
+    def visit_FunctionDeclaration(self, node):
+        return node
+
+    def visit_VariableDeclarationNode(self, node):
+        node = self.generic_visit(node)
+        self.invalidate([node.name])
+        return node
+
+    visit_AssignNode = visit_ArrayDeclarationNode = visit_VariableDeclarationNode
+
+    def visit_ArrayAssignNode(self, node):
+        node = self.generic_visit(node)
+        self.invalidate(items=True)
+        return node
+
+    visit_UncheckedArrayAssignNode = visit_ArrayAssignNode
+
+    def visit_IncrementNode(self, node):
+        target = node.identifier
+        if isinstance(target, str):
+            self.invalidate([target])
+            return node
+        # The item is changed in place, so only its index can be shared
+        index = self.visit(target.index)
+        self.invalidate(items=True)
+        return node if index is target.index else type(node)(ArrayAccessNode(target.name, index))
+
+    visit_DecrementNode = visit_IncrementNode
+
+    def visit_ResetNode(self, node):
+        self.invalidate(node.names)
+        return node
+
+    def visit_IfNode(self, node):
+        condition = self.visit(node.condition)
+        then_block = self.block(node.then_block)
+        elif_blocks = [(self.visit(test), self.block(block)) for test, block in node.elif_blocks or []]
+        if all(new is old for pair in zip(elif_blocks, node.elif_blocks or []) for new, old in zip(*pair)):
+            elif_blocks = node.elif_blocks
+        else_block = node.else_block
+        if else_block:
+            # The else block may run after an else_if block has
+            saved = self.available
+            self.available = dict(saved)
+            for _, block in node.elif_blocks or []:
+                self.invalidate_writes(block)
+            else_block = self.block(else_block)
+            self.available = saved
+        self.invalidate_writes(node)
+        values = [condition, then_block, elif_blocks, else_block]
+        if all(new is getattr(node, name) for new, name in zip(values, node._fields)):
+            return node
+        return IfNode(*values)
+
+    def loop(self, node, condition):
+        """Visit a loop's condition, or None, with only the values the loop cannot change shared."""
+        if condition is None:
+            return None
+        saved = self.unstable, self.unstable_items
+        self.unstable, self.unstable_items = written_names(node)
+        try:
+            return self.visit(condition)
+        finally:
+            self.unstable, self.unstable_items = saved
+
+    def visit_WhileLoopNode(self, node):
+        self.invalidate_writes(node)
+        condition = self.loop(node, node.condition)
+        body = self.block(node.body)
+        if condition is node.condition and body is node.body:
+            return node
+        return WhileLoopNode(condition, body)
+
+    def visit_DoWhileNode(self, node):
+        self.invalidate_writes(node)
+        body = self.block(node.body)
+        condition = self.loop(node, node.condition)
+        if condition is node.condition and body is node.body:
+            return node
+        return DoWhileNode(body, condition)
+
+    def visit_ForLoopNode(self, node):
+        end_value = self.visit(node.end_value)
+        self.invalidate_writes(node)
+        body = self.block(node.body)
+        if end_value is node.end_value and body is node.body:
+            return node
+        return ForLoopNode(node.identifier, end_value, body)
+
+class TypeSpecializer(NodeTransformer):
+    """Replaces arithmetic and comparisons on operands of known types with typed nodes.
+
+    Operators on two integers become IntegerOperatorNodes, on other numbers
+    DoubleOperatorNodes, and + on two strings a ConcatenateNode, using the
+    types TypeInference proved. The engines evaluate these without testing
+    which operator or operand types they have.
+    """
+    def __init__(self):
+        self.types = None
+
+    def run(self, statements):
+        self.types = infer_types(statements)
+        return super().run(statements)
+
+    def visit_BinaryOperatorNode(self, node):
+        left = self.types.of(node.left)
+        right = self.types.of(node.right)
+        new = self.generic_visit(node)
+        if node.operator not in FOLDABLE_OPERATORS:
+            return new
+        if left == right == INTEGER:
+            return IntegerOperatorNode(new.left, node.operator, new.right)
+        if left in NUMERIC and right in NUMERIC:
+            return DoubleOperatorNode(new.left, node.operator, new.right)
+        if left == right == STRING and node.operator == 'PLUS':
+            return ConcatenateNode(new.left, new.right)
+        return new
+
+def array_lengths(statements):
+    """Return the shortest length each array can have, for the names only array declarations bind.
+
+    Arrays never change length, so such a name, once declared, always holds
+    an array at least that long.
+    """
+    lengths = {}
+    rebound = set()
+
+    def walk(value):
+        if isinstance(value, Node):
+            if isinstance(value, ArrayDeclarationNode):
+                lengths[value.name] = min(lengths.get(value.name, len(value.elements)), len(value.elements))
+            elif isinstance(value, (VariableDeclarationNode, AssignNode)):
+                rebound.add(value.name)
+            elif isinstance(value, (IncrementNode, DecrementNode, ForLoopNode)) and isinstance(value.identifier, str):
+                rebound.add(value.identifier)
+            for name in value._fields:
+                walk(getattr(value, name))
+        elif isinstance(value, (list, tuple)):
+            for item in value:
+                walk(item)
+
+    walk(statements)
+    return {name: length for name, length in lengths.items() if name not in rebound}
+
+class BoundsCheckEliminator(NodeTransformer):
+    """Replaces array reads and stores that cannot fail their checks with unchecked nodes.
+
+    An access needs no check when its array is certainly declared by then,
+    by a declaration earlier in the same block or an enclosing one, and its
+    index is certainly within the array. Indexes are bounded by interval
+    arithmetic over integer literals and for loop variables: in the body of
+    a for loop that never rebinds its variable, the variable lies between
+    its start, when the statement binding it last before the loop is in the
+    same block, and the end value less one.
+    """
+    def __init__(self):
+        self.lengths = {}
+        self.declared = set()
+        self.ranges = {}
+
+    def run(self, statements):
+        self.lengths = array_lengths(statements)
+        if not self.lengths:
+            return statements
+        return super().run(statements)
+
+    def visit_list(self, items):
+        saved = self.declared
+        self.declared = set(saved)
+        try:
+            result = []
+            changed = False
+            for position, item in enumerate(items):
+                if isinstance(item, ForLoopNode):
+                    new = self.visit_loop(item, items[:position])
+                else:
+                    new = self.visit_value(item)
+                changed = changed or new is not item
+                result.append(new)
+                if isinstance(item, ArrayDeclarationNode):
+                    self.declared.add(item.name)
+            return result if changed else items
+        finally:
+            self.declared = saved
+
+    def visit_loop(self, node, before):
+        end_value = self.visit(node.end_value)
+        bounds = None
+        start = self.start(node.identifier, before)
+        end = self.interval(node.end_value)
+        if start is not None and end is not None and node.identifier not in written_names(node.body)[0]:
+            bounds = (start[0], end[1] - 1)
+        saved = self.ranges
+        self.ranges = dict(saved)
+        if bounds is None:
+            self.ranges.pop(node.identifier, None)
+        else:
+            self.ranges[node.identifier] = bounds
+        try:
+            body = self.visit_list(node.body)
+        finally:
+            self.ranges = saved
+        if end_value is node.end_value and body is node.body:
+            return node
+        return ForLoopNode(node.identifier, end_value, body)
+
+    def visit_ForLoopNode(self, node):
+        # Not in a block, so nothing bounds its start
+        return self.visit_loop(node, [])
+
+    def start(self, name, before):
+        """Return the interval of name's value after the statements before, from the last one binding it."""
+        for statement in reversed(before):
+            if isinstance(statement, (VariableDeclarationNode, AssignNode)) and statement.name == name:
+                return self.interval(statement.expression)
+            if name in written_names(statement)[0]:
+                return None
+        return None
+
+    def interval(self, node):
+        """Return (low, high) bounding node's integer value here, or None."""
+        if isinstance(node, NumberNode) and isinstance(node.value, int):
+            return node.value, node.value
+        if isinstance(node, VariableAccessNode):
+            return self.ranges.get(node.identifier)
+        if isinstance(node, TemporaryNode):
+            return self.interval(node.expression)
+        if isinstance(node, UnaryOperatorNode) and node.operator == 'NEGATE':
+            operand = self.interval(node.operand)
+            return None if operand is None else (-operand[1], -operand[0])
+        if isinstance(node, (BinaryOperatorNode, IntegerOperatorNode)) and node.operator in ('PLUS', 'MINUS', 'MULTIPLY'):
+            left = self.interval(node.left)
+            right = self.interval(node.right) if left is not None else None
+            if right is None:
+                return None
+            if node.operator == 'PLUS':
+                return left[0] + right[0], left[1] + right[1]
+            if node.operator == 'MINUS':
+                return left[0] - right[1], left[1] - right[0]
+            products = [a * b for a in left for b in right]
+            return min(products), max(products)
+        return None
+
+    def in_bounds(self, name, index):
+        if name not in self.declared or name not in self.lengths:
+            return False
+        bounds = self.interval(index)
+        return bounds is not None and bounds[0] >= 0 and bounds[1] < self.lengths[name]
+
+    def visit_ArrayAccessNode(self, node):
+        new = self.generic_visit(node)
+        if self.in_bounds(node.name, node.index):
+            return UncheckedArrayAccessNode(new.name, new.index)
+        return new
+
+    def visit_ArrayAssignNode(self, node):
+        new = self.generic_visit(node)
+        if self.in_bounds(node.array_name, node.index):
+            return UncheckedArrayAssignNode(new.array_name, new.index, new.value)
+        return new
+
+    def visit_IncrementNode(self, node):
+        # The engines change the item in place; only its index is visited
+        target = node.identifier
+        if not isinstance(target, ArrayAccessNode):
+            return node
+        index = self.visit(target.index)
+        return node if index is target.index else type(node)(ArrayAccessNode(target.name, index))
+
+    visit_DecrementNode = visit_IncrementNode
+
+def optimize(statements, passes=None):
+    """Return an optimized copy of a parsed program; the original is left unchanged.
+
+    passes is a sequence of NodeTransformer classes, run in order, by default PASSES.
+    When they include TypeSpecializer and the 'optimizer' trace channel is on,
+    the type errors check_types finds are traced first.
+    """
+    if isinstance(statements, FlatAST):
+        statements = statements.to_nodes()
+    passes = PASSES if passes is None else passes
+    if trace.info and TypeSpecializer in passes:
+        trace_type_errors(statements)
+    for optimization in passes:
+        statements = optimization().run(statements)
+    return statements
+
+def trace_type_errors(statements):
+    """Emit the type errors check_types finds in a parsed program on the 'optimizer' channel.
+
+    Declared types are not enforced at run time, so these are warnings: the
+    program still runs, and an operation that always fails still fails there
+    with its usual message.
+    """
+    for error in check_types(statements):
+        trace.emit(f"Warning: {error}")
+
+PASSES = (
+    ConstantFolder,
+    DeadCodeEliminator,
+    LoopInvariantMotion,
+    CommonSubexpressionEliminator,
+    TypeSpecializer,
+    BoundsCheckEliminator,
+)
+
+if __name__ == "__main__":
+    from lexer import Lexer
+    from parser import Parser
+
+    code = '''integer limit : 4 * 25
+string name : "quet" + "zal"
+integer i : 0
+while i < limit - 1
+    i++
+    if limit < 50 then
+        -> "never"
+    else_if limit > 50 then
+        -> "always"
+while limit < 0
+    -> "never"
+-> name
+'''
+    for statement in optimize(Parser(Lexer(code).tokenize()).parse()):
+        print(statement)
@@ -0,0 +1,161 @@
+import io
+import sys
+
+# Characters a buffered sink collects before passing them on
+DEFAULT_BUFFER_SIZE = io.DEFAULT_BUFFER_SIZE
+
+class Sink:
+    """Where a running program's output goes, one line per result.
+
+    Lines are collected until buffer_size characters are waiting and then
+    passed to send() together; a buffer_size of 0 sends every line as it is
+    written. Subclasses implement send(). flush() sends whatever is waiting,
+    and close() flushes and releases what the sink holds.
+    """
+    def __init__(self, buffer_size=DEFAULT_BUFFER_SIZE):
+        self.buffer_size = buffer_size
+        self.pending = []
+        self.size = 0
+
+    def write(self, text):
+        if not self.buffer_size:
+            self.send(text)
+            return
+        self.pending.append(text)
+        self.size += len(text)
+        if self.size >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            text = ''.join(self.pending)
+            self.pending = []
+            self.size = 0
+            self.send(text)
+
+    def send(self, text):
+        raise NotImplementedError
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class StreamSink(Sink):
+    """Writes output to a text stream; None means whatever sys.stdout is at the time."""
+    def __init__(self, stream=None, buffer_size=DEFAULT_BUFFER_SIZE):
+        super().__init__(buffer_size)
+        self.stream = stream
+
+    def send(self, text):
+        (self.stream or sys.stdout).write(text)
+
+    def flush(self):
+        super().flush()
+        (self.stream or sys.stdout).flush()
+
+class FileSink(StreamSink):
+    """Writes output to a file, which it opens and closes itself."""
+    def __init__(self, path, buffer_size=DEFAULT_BUFFER_SIZE, encoding='utf-8'):
+        super().__init__(open(path, 'w', encoding=encoding), buffer_size)
+
+    def close(self):
+        if not self.stream.closed:
+            super().close()
+            self.stream.close()
+
+class MemorySink(Sink):
+    """Keeps all output in memory; getvalue() returns it.
+
+    Buffering joins lines into chunks of about buffer_size characters, so
+    the sink holds a few large strings rather than one per line.
+    """
+    def __init__(self, buffer_size=DEFAULT_BUFFER_SIZE):
+        super().__init__(buffer_size)
+        self.chunks = []
+
+    def send(self, text):
+        self.chunks.append(text)
+
+    def getvalue(self):
+        self.flush()
+        return ''.join(self.chunks)
+
+class QueueSink(Sink):
+    """Puts output on a queue.Queue, for a consumer in another thread such as the GUI."""
+    def __init__(self, queue, buffer_size=DEFAULT_BUFFER_SIZE):
+        super().__init__(buffer_size)
+        self.queue = queue
+
+    def send(self, text):
+        self.queue.put(text)
+
+class ResultWriter:
+    """Writes statement results to a sink, line for line as Interpreter.interpret once joined them.
+
+    Compound statements used to return their block's results joined with
+    newlines, which interpret() joined again, dropping empty ones. Here they
+    call open() and close() around their block instead, so each result is
+    written once, as soon as it exists. The rules of the old joins are kept:
+    a nested block with no results still adds an empty line, and a top-level
+    statement whose whole text would have been empty adds nothing.
+    """
+    def __init__(self, sink):
+        self.sink = sink
+        self.counts = []  # results so far in each open block, innermost last
+        self.lines = 0  # lines so far of the open top-level statement
+        self.held = False  # that statement's only line so far is empty, and not yet written
+
+    def result(self, value):
+        """Write a statement's value, which is not None."""
+        if self.counts:
+            self.line(str(value))
+        elif value:
+            self.sink.write(f'{value}\n')
+
+    def line(self, text):
+        self.counts[-1] += 1
+        self.lines += 1
+        if self.lines == 1 and not text:
+            self.held = True
+            return
+        if self.held:
+            self.held = False
+            self.sink.write('\n')
+        self.sink.write(text + '\n')
+
+    def open(self):
+        if not self.counts:
+            self.lines = 0
+            self.held = False
+        self.counts.append(0)
+
+    def close(self):
+        if not self.counts.pop() and self.counts:
+            self.line('')
+
+class ResultCollector:
+    """A ResultWriter that keeps one compound statement's lines, for text()."""
+    def __init__(self):
+        self.lines = []
+        self.counts = []
+
+    def result(self, value):
+        if self.counts:
+            self.counts[-1] += 1
+        self.lines.append(str(value))
+
+    def open(self):
+        self.counts.append(0)
+
+    def close(self):
+        if not self.counts.pop() and self.counts:
+            self.result('')
+
+    def text(self):
+        """Return the statement's value as the tree-walker once returned it."""
+        return '\n'.join(self.lines)
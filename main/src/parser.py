@@ -1,4 +1,5 @@
-from lexer import Lexer
+import tracing
+from lexer import Lexer, TokenBuffer
 from ast import (
     FunctionDeclaration,
     ForLoopNode,
@@ -6,6 +7,7 @@ from ast import (
     DoWhileNode,
     IfNode,
     BinaryOperatorNode,
+    UnaryOperatorNode,
     NumberNode,
     VariableDeclarationNode,
     AssignNode,
@@ -24,119 +26,261 @@ from ast import (
     StopNode
 )
 
+trace = tracing.get_channel('parser')
+
+# The operator table. Binary operators map to their binding power (higher
+# binds tighter, all are left-associative); prefix operators map to the
+# operator name of the UnaryOperatorNode they build and bind tighter still.
+BINARY_OPERATORS = {
+    'OR': 1,
+    'AND': 2,
+    'EQUAL': 3,
+    'NOT_EQUAL': 3,
+    'GREATER': 3,
+    'LESS': 3,
+    'GREATER_EQUAL': 3,
+    'LESS_EQUAL': 3,
+    'PLUS': 4,
+    'MINUS': 4,
+    'MULTIPLY': 5,
+    'DIVIDE': 5,
+}
+PREFIX_OPERATORS = {
+    'MINUS': 'NEGATE',
+    'NOT_EQUAL': 'NOT',
+}
+
 class SyntaxError(Exception):
     """Custom Syntax Error for parsing."""
     pass
 
+class TokenStream:
+    """A cursor over tokens with O(1) lookahead and cheap backtracking.
+
+    Indexable token buffers (a TokenBuffer or a list of (type, lexeme) tuples)
+    are read in place. Any other iterable, such as Lexer.stream(), is pulled
+    into a window on demand; tokens behind the cursor are dropped from the
+    window while no mark is held, so streamed sources parse in bounded memory.
+    """
+    # Consumed tokens kept before a streamed window is compacted
+    WINDOW_SLACK = 1024
+
+    def __init__(self, tokens):
+        if isinstance(tokens, (TokenBuffer, list, tuple)):
+            self.buffer = tokens
+            self.source = None
+        else:
+            self.buffer = []
+            self.source = iter(tokens)
+        if isinstance(tokens, TokenBuffer):
+            self._type_at = tokens.type_at
+        else:
+            self._type_at = lambda index: self.buffer[index][0]
+        self.length = len(self.buffer)
+        self.base = 0  # Absolute index of buffer[0]
+        self.index = 0  # Absolute index of the current token
+        self.marks = []
+        self.type = self.peek(0)  # Type of the current token, None at the end
+
+    def _fill(self, offset):
+        """Pull streamed tokens until buffer[offset] exists. Returns False at the end of input."""
+        buffer = self.buffer
+        for token in self.source:
+            buffer.append(token)
+            if len(buffer) > offset:
+                self.length = len(buffer)
+                return True
+        self.length = len(buffer)
+        self.source = None
+        return False
+
+    def peek(self, k=1):
+        """Return the type of the token k places ahead (0 is the current one), or None past the end."""
+        offset = self.index - self.base + k
+        if offset >= self.length and (self.source is None or not self._fill(offset)):
+            return None
+        return self._type_at(offset)
+
+    def current(self):
+        """Return the current (type, lexeme) token, or None at the end of input."""
+        if self.type is None:
+            return None
+        return self.buffer[self.index - self.base]
+
+    def value(self):
+        """Return the lexeme of the current token."""
+        return self.buffer[self.index - self.base][1]
+
+    def advance(self):
+        """Consume the current token and return it as a (type, lexeme) tuple."""
+        token = self.current()
+        self.skip()
+        return token
+
+    def skip(self):
+        """Consume the current token without materializing it."""
+        self.index += 1
+        if self.source is not None and not self.marks and self.index - self.base > self.WINDOW_SLACK:
+            del self.buffer[:self.index - self.base]
+            self.base = self.index
+            self.length = len(self.buffer)
+        self.type = self.peek(0)
+
+    def mark(self):
+        """Remember the current position for a later reset() or release()."""
+        self.marks.append(self.index)
+        return self.index
+
+    def reset(self, mark):
+        """Rewind to a position returned by mark() and release that mark."""
+        self.marks.remove(mark)
+        self.index = mark
+        self.type = self.peek(0)
+
+    def release(self, mark):
+        """Drop a mark that is no longer needed without moving."""
+        self.marks.remove(mark)
+
+    def position(self):
+        """Return (line, column) of the current token when the buffer knows it, else None."""
+        if isinstance(self.buffer, TokenBuffer) and self.type is not None:
+            return self.buffer.position_at(self.index)
+        return None
+
+    def describe(self):
+        """Describe the current location for error messages."""
+        position = self.position()
+        if position is not None:
+            return f"line {position[0]}, column {position[1]}"
+        return f"token {self.index}"
+
 class Parser:
     def __init__(self, tokens):
-        self.tokens = iter(tokens)
-        self.current_token = None
-        self.next_token()
+        self.tokens = tokens if isinstance(tokens, TokenStream) else TokenStream(tokens)
+
+    @property
+    def current_token(self):
+        return self.tokens.current()
 
     def next_token(self):
-        try:
-            self.current_token = next(self.tokens)
-        except StopIteration:
-            self.current_token = None
+        self.tokens.skip()
 
     def expect(self, token_type):
-        if self.current_token is not None and self.current_token[0] == token_type:
-            token = self.current_token
-            self.next_token()
-            return token
-        else:
-            raise SyntaxError(f"Expected token type '{token_type}', but got '{self.current_token[0]}' instead.")
+        if self.tokens.type == token_type:
+            return self.tokens.advance()
+        raise SyntaxError(f"Expected token type '{token_type}', but got '{self.tokens.type}' instead at {self.tokens.describe()}.")
+
+    def consume(self, token_type):
+        """Like expect(), for callers that don't need the token itself."""
+        if self.tokens.type != token_type:
+            self.expect(token_type)
+        self.tokens.skip()
+
+    def peek(self, k=1):
+        return self.tokens.peek(k)
 
     def parse(self):
         ast = []
-        while self.current_token is not None:
-            if self.current_token[0] == 'IF':
-                ast.append(self.parse_if_statement())
-            elif self.current_token[0] == 'FOR':
-                ast.append(self.parse_for_loop())
-            elif self.current_token[0] == 'WHILE':  # Correct token checking for WHILE
-                ast.append(self.parse_while_loop())
-            elif self.current_token[0] == 'DO':
-                ast.append(self.parse_do_while_loop())
-            elif self.current_token[0].startswith('TYPE_'):
-                ast.append(self.parse_variable_declaration())
-            elif self.current_token[0] == 'ARRAY':
-                ast.append(self.parse_array_declaration())
-            elif self.current_token[0] == 'OUTPUT':
-                ast.append(self.parse_output())
-            elif self.current_token[0] == 'IDENTIFIER' and self.peek() == 'COLON':
-                ast.append(self.parse_assignment())
-            elif self.current_token[0] == 'IDENTIFIER':
-                ast.append(self.parse_variable_access())
-            else:
+        statement_parsers = self.statement_parsers
+        while self.tokens.type is not None:
+            parse_statement = statement_parsers.get(self.tokens.type)
+            if parse_statement is None:
                 self.next_token()  # Skip unknown or unhandled tokens
+            else:
+                self.add_statement(ast, parse_statement(self))
         return ast
 
+    def add_statement(self, statements, statement):
+        # A for loop that declares its variable parses to [declaration, loop]
+        if isinstance(statement, list):
+            statements.extend(statement)
+        else:
+            statements.append(statement)
+
     def parse_variable_declaration(self):
-        if self.current_token[0] == 'ARRAY':
-            self.expect('ARRAY')
-            array_type = self.expect(self.current_token[0])[1]
+        if self.tokens.type == 'ARRAY':
+            self.consume('ARRAY')
+            array_type = self.expect(self.tokens.type)[1]
             name = self.expect('IDENTIFIER')[1]
-            self.expect('SQUARE_OPEN')
+            self.consume('SQUARE_OPEN')
             elements = []
-            while self.current_token[0] != 'SQUARE_CLOSE':
-                if self.current_token[0] in ['NUMBER', 'STRING_LITERAL', 'CHARACTER_LITERAL']:
+            while self.tokens.type != 'SQUARE_CLOSE':
+                if self.tokens.type in ['NUMBER', 'STRING_LITERAL', 'CHARACTER_LITERAL']:
                     elements.append(self.parse_primary_expression())
-                if self.current_token[0] == 'COMMA':
+                if self.tokens.type == 'COMMA':
                     self.next_token()
-            self.expect('SQUARE_CLOSE')
+            self.consume('SQUARE_CLOSE')
             return ArrayDeclarationNode(array_type, name, elements)
         else:
-            type_token = self.expect(self.current_token[0])[0]
+            type_token = self.expect(self.tokens.type)[0]
             identifier = self.expect('IDENTIFIER')[1]
-            self.expect('COLON')
+            self.consume('COLON')
             expression = self.parse_expression()
             return VariableDeclarationNode(type_token[len('TYPE_'):].lower(), identifier, expression)
     
     def parse_array_declaration(self):
-        self.expect('ARRAY')
-        type_token = self.expect(self.current_token[0])[0]
+        self.consume('ARRAY')
+        type_token = self.expect(self.tokens.type)[0]
         identifier = self.expect('IDENTIFIER')[1]
-        self.expect('SQUARE_OPEN')
+        self.consume('SQUARE_OPEN')
         elements = []
-        while self.current_token[0] != 'SQUARE_CLOSE':
+        while self.tokens.type != 'SQUARE_CLOSE':
             elements.append(self.parse_expression())
-            if self.current_token[0] == 'COMMA':
+            if self.tokens.type == 'COMMA':
                 self.next_token()
-        self.expect('SQUARE_CLOSE')
+        self.consume('SQUARE_CLOSE')
         return ArrayDeclarationNode(type_token[len('TYPE_'):].lower(), identifier, elements)
     
     def parse_array_access(self, identifier):
-        self.expect('SQUARE_OPEN')
+        self.consume('SQUARE_OPEN')
         index = self.parse_expression()
-        self.expect('SQUARE_CLOSE')
-        if self.current_token[0] == 'INCREMENT':
+        self.consume('SQUARE_CLOSE')
+        if self.tokens.type == 'COLON':
+            self.next_token()
+            return ArrayAssignNode(identifier, index, self.parse_expression())
+        elif self.tokens.type == 'INCREMENT':
             self.next_token()
             return IncrementNode(ArrayAccessNode(identifier, index))
-        elif self.current_token[0] == 'DECREMENT':
+        elif self.tokens.type == 'DECREMENT':
             self.next_token()
             return DecrementNode(ArrayAccessNode(identifier, index))
         return ArrayAccessNode(identifier, index)
 
     def parse_output(self):
-        self.expect('OUTPUT')
-        if self.current_token[0] == 'IDENTIFIER':
+        self.consume('OUTPUT')
+        if self.tokens.type == 'IDENTIFIER':
             identifier = self.expect('IDENTIFIER')[1]
-            if self.current_token and self.current_token[0] == 'SQUARE_OPEN':
-                self.expect('SQUARE_OPEN')
+            if self.tokens.type == 'SQUARE_OPEN':
+                self.consume('SQUARE_OPEN')
                 index = self.parse_expression()
-                self.expect('SQUARE_CLOSE')
+                self.consume('SQUARE_CLOSE')
                 return OutputNode(ArrayAccessNode(identifier, index))
             return OutputNode(VariableAccessNode(identifier))
-        elif self.current_token[0] == 'STRING_LITERAL':
+        elif self.tokens.type == 'STRING_LITERAL':
             string = self.expect('STRING_LITERAL')[1]
             return OutputNode(StringLiteralNode(string))
-        elif self.current_token[0] == 'CHARACTER_LITERAL':
+        elif self.tokens.type == 'CHARACTER_LITERAL':
             char = self.expect('CHARACTER_LITERAL')[1]
             return OutputNode(CharacterNode(char))
         else:
-            raise SyntaxError(f"Unexpected token {self.current_token[0]} in output")
+            raise SyntaxError(f"Unexpected token {self.tokens.type} in output")
+
+    def parse_identifier_statement(self):
+        """Parse a statement that starts with an identifier.
+
+        Lookahead of one token picks between an assignment, an array access
+        or store, a postfix increment or decrement, and a plain variable
+        access, so nothing is parsed twice.
+        """
+        next_type = self.tokens.peek()
+        if next_type == 'COLON':
+            return self.parse_assignment()
+        if next_type == 'SQUARE_OPEN':
+            identifier = self.expect('IDENTIFIER')[1]
+            return self.parse_array_access(identifier)
+        if next_type == 'INCREMENT' or next_type == 'DECREMENT':
+            return self.parse_primary_expression()  # Postfix x++ / x--
+        return self.parse_variable_access()
 
     def parse_variable_access(self):
         identifier = self.expect('IDENTIFIER')[1]
@@ -144,47 +288,48 @@ class Parser:
 
     def parse_assignment(self):
         identifier = self.expect('IDENTIFIER')[1]
-        if self.current_token and self.current_token[0] == 'SQUARE_OPEN':
-            self.expect('SQUARE_OPEN')
+        if self.tokens.type == 'SQUARE_OPEN':
+            self.consume('SQUARE_OPEN')
             index = self.parse_expression()
-            self.expect('SQUARE_CLOSE')
-            self.expect('COLON')
+            self.consume('SQUARE_CLOSE')
+            self.consume('COLON')
             value = self.parse_expression()
             return ArrayAssignNode(identifier, index, value)
-        self.expect('COLON')
+        self.consume('COLON')
         value = self.parse_expression()
         return AssignNode(identifier, value)
 
     def parse_if_statement(self):
-        self.expect('IF')
+        self.consume('IF')
         condition = self.parse_expression()
-        self.expect('THEN')
+        self.consume('THEN')
         then_block = self.parse_block()
 
         elif_blocks = []
-        while self.current_token and self.current_token[0] == 'ELSE_IF':
-            self.expect('ELSE_IF')
+        while self.tokens.type == 'ELSE_IF':
+            self.consume('ELSE_IF')
             elif_condition = self.parse_expression()
-            self.expect('THEN')
+            self.consume('THEN')
             elif_block = self.parse_block()
             elif_blocks.append((elif_condition, elif_block))
 
         else_block = None
-        if self.current_token and self.current_token[0] == 'ELSE':
-            self.expect('ELSE')
-            self.expect('THEN')
+        if self.tokens.type == 'ELSE':
+            self.consume('ELSE')
+            self.consume('THEN')
             else_block = self.parse_block()
 
         return IfNode(condition, then_block, elif_blocks, else_block)
 
     def parse_for_loop(self):
-        self.expect('FOR')
-        if self.current_token[0].startswith('TYPE_'):
+        self.consume('FOR')
+        declaration = None
+        if self.tokens.type.startswith('TYPE_'):
             declaration = self.parse_variable_declaration()
             identifier = declaration.name
         else:
             identifier = self.expect('IDENTIFIER')[1]
-        self.expect('TO')
+        self.consume('TO')
         end_value = self.parse_expression()
         body = self.parse_block()
         if isinstance(declaration, VariableDeclarationNode):
@@ -192,96 +337,136 @@ class Parser:
         return ForLoopNode(identifier, end_value, body)
     
     def parse_while_loop(self):
-        self.expect('WHILE')
+        self.consume('WHILE')
         condition = self.parse_expression()
-        print(f"Parsed WHILE condition: {condition}")
+        if trace.debug:
+            trace.emit(f"Parsed WHILE condition: {condition}")
         body = self.parse_block()
-        print(f"Parsed WHILE body: {body}")
+        if trace.debug:
+            trace.emit(f"Parsed WHILE body: {body}")
         return WhileLoopNode(condition, body)
     
     def parse_do_while_loop(self):
-        self.expect('DO')
+        self.consume('DO')
         body = self.parse_block()
-        self.expect('WHILE')
+        self.consume('WHILE')
         condition = self.parse_expression()
-        print(f"Parsed DO-WHILE body: {body}")
-        print(f"Parsed DO-WHILE condition: {condition}")
+        if trace.debug:
+            trace.emit(f"Parsed DO-WHILE body: {body}")
+            trace.emit(f"Parsed DO-WHILE condition: {condition}")
         return DoWhileNode(body, condition)
 
     def parse_block(self):
         block = []
-        self.expect('INDENT')
-        while self.current_token and self.current_token[0] != 'DEDENT':
-            if self.current_token[0] == 'INCREMENT':
-                self.next_token()  # Consume the INCREMENT token
-                identifier = self.expect('IDENTIFIER')[1]
-                block.append(IncrementNode(identifier))
-            elif self.current_token[0] == 'DECREMENT':
-                self.next_token()  # Consume the DECREMENT token
-                identifier = self.expect('IDENTIFIER')[1]
-                block.append(DecrementNode(identifier))
-            elif self.current_token[0] == 'OUTPUT':
-                block.append(self.parse_output())
-            elif self.current_token[0].startswith('TYPE_') or self.current_token[0] == 'ARRAY':
-                block.append(self.parse_variable_declaration())
-            elif self.current_token[0] == 'IDENTIFIER':
-                identifier = self.expect('IDENTIFIER')[1]
-                if self.current_token[0] == 'SQUARE_OPEN':
-                    block.append(self.parse_array_access(identifier))
-                else:
-                    block.append(VariableAccessNode(identifier))
-            else:
+        statement_parsers = self.statement_parsers
+        self.consume('INDENT')
+        while self.tokens.type not in ('DEDENT', None):
+            parse_statement = statement_parsers.get(self.tokens.type)
+            if parse_statement is None:
                 block.append(self.parse_expression())
-        self.expect('DEDENT')
+            else:
+                self.add_statement(block, parse_statement(self))
+        self.consume('DEDENT')
         return block
 
+    def parse_prefix_increment(self):
+        self.consume('INCREMENT')
+        return IncrementNode(self.expect('IDENTIFIER')[1])
+
+    def parse_prefix_decrement(self):
+        self.consume('DECREMENT')
+        return DecrementNode(self.expect('IDENTIFIER')[1])
+
     def parse_expression(self):
-        expr = self.parse_primary_expression()
+        """Parse an expression by precedence climbing.
 
-        while self.current_token and self.current_token[0] in ['PLUS', 'MINUS', 'DIVIDE', 'MULTIPLY', 'GREATER', 'LESS', 'GREATER_EQUAL', 'LESS_EQUAL', 'EQUAL']:
-            operator = self.current_token[0]
-            self.next_token()
-            right = self.parse_primary_expression()
-            expr = BinaryOperatorNode(expr, operator, right)
+        The core is iterative: operands and pending operators live on two
+        explicit stacks and are reduced whenever an operator of lower or equal
+        binding power arrives, so long operator chains use no recursion.
+        """
+        binary_operators = BINARY_OPERATORS
+        tokens = self.tokens
+        operands = [self.parse_unary_expression()]
+        operators = []
+        while True:
+            operator = tokens.type
+            precedence = binary_operators.get(operator)
+            if precedence is None:
+                break
+            tokens.skip()
+            while operators and operators[-1][0] >= precedence:
+                right = operands.pop()
+                operands[-1] = BinaryOperatorNode(operands[-1], operators.pop()[1], right)
+            operators.append((precedence, operator))
+            operands.append(self.parse_unary_expression())
+        while operators:
+            right = operands.pop()
+            operands[-1] = BinaryOperatorNode(operands[-1], operators.pop()[1], right)
+        return operands[0]
 
+    def parse_unary_expression(self):
+        prefixes = []
+        while self.tokens.type in PREFIX_OPERATORS:
+            prefixes.append(PREFIX_OPERATORS[self.tokens.type])
+            self.tokens.skip()
+        expr = self.parse_primary_expression()
+        for operator in reversed(prefixes):
+            expr = UnaryOperatorNode(operator, expr)
         return expr
 
     def parse_primary_expression(self):
-        if self.current_token[0] == 'IDENTIFIER':
+        if self.tokens.type == 'IDENTIFIER':
             identifier = self.expect('IDENTIFIER')[1]
-            if self.current_token and self.current_token[0] == 'SQUARE_OPEN':
-                self.expect('SQUARE_OPEN')
+            if self.tokens.type == 'SQUARE_OPEN':
+                self.consume('SQUARE_OPEN')
                 index = self.parse_expression()
-                self.expect('SQUARE_CLOSE')
+                self.consume('SQUARE_CLOSE')
                 return ArrayAccessNode(identifier, index)
-            if self.current_token and self.current_token[0] == 'INCREMENT':
+            if self.tokens.type == 'INCREMENT':
                 self.next_token()  # Consume the INCREMENT token
                 return IncrementNode(identifier)
-            elif self.current_token and self.current_token[0] == 'DECREMENT':
+            elif self.tokens.type == 'DECREMENT':
                 self.next_token()  # Consume the DECREMENT token
                 return DecrementNode(identifier)
             return VariableAccessNode(identifier)
-        elif self.current_token[0] == 'NUMBER':
+        elif self.tokens.type == 'OPEN_PAREN':
+            self.tokens.skip()
+            expr = self.parse_expression()
+            self.consume('CLOSE_PAREN')
+            return expr
+        elif self.tokens.type == 'NUMBER':
             number = int(self.expect('NUMBER')[1])
             return NumberNode(number)
-        elif self.current_token[0] == 'FLOAT_LITERAL':
+        elif self.tokens.type == 'FLOAT_LITERAL':
             float_number = float(self.expect('FLOAT_LITERAL')[1])
             return DoubleNode(float_number)
-        elif self.current_token[0] == 'STRING_LITERAL':
+        elif self.tokens.type == 'STRING_LITERAL':
             string = self.expect('STRING_LITERAL')[1]
             return StringLiteralNode(string)
-        elif self.current_token[0] == 'CHARACTER_LITERAL':
+        elif self.tokens.type == 'CHARACTER_LITERAL':
             char = self.expect('CHARACTER_LITERAL')[1]
             return CharacterNode(char)
         else:
-            raise SyntaxError(f"Unexpected token type {self.current_token[0]}")
-
-    def peek(self):
-        save_point = self.tokens
-        next_token = next(save_point, None)
-        self.tokens = save_point
-        return next_token[0] if next_token else None
+            raise SyntaxError(f"Unexpected token type {self.tokens.type}")
 
+# Statement parsers keyed by the type of a statement's first token. Top-level
+# and block parsing share this table, so selecting a statement is one dict
+# lookup and a new statement only needs an entry here.
+Parser.statement_parsers = {
+    'IF': Parser.parse_if_statement,
+    'FOR': Parser.parse_for_loop,
+    'WHILE': Parser.parse_while_loop,
+    'DO': Parser.parse_do_while_loop,
+    'TYPE_STRING': Parser.parse_variable_declaration,
+    'TYPE_INTEGER': Parser.parse_variable_declaration,
+    'TYPE_DOUBLE': Parser.parse_variable_declaration,
+    'TYPE_CHARACTER': Parser.parse_variable_declaration,
+    'ARRAY': Parser.parse_array_declaration,
+    'OUTPUT': Parser.parse_output,
+    'IDENTIFIER': Parser.parse_identifier_statement,
+    'INCREMENT': Parser.parse_prefix_increment,
+    'DECREMENT': Parser.parse_prefix_decrement,
+}
 
 if __name__ == "__main__":
     code = '''integer int : 10
@@ -0,0 +1,143 @@
+from ast import (
+    ArrayAccessNode,
+    ArrayAssignNode,
+    ArrayDeclarationNode,
+    AssignNode,
+    DecrementNode,
+    ForLoopNode,
+    IncrementNode,
+    Node,
+    ResetNode,
+    TemporaryNode,
+    VariableAccessNode,
+    VariableDeclarationNode,
+)
+
+class _Unset:
+    __slots__ = ()
+
+    def __repr__(self):
+        return 'UNSET'
+
+# What every slot of a new frame holds, so reading a variable that was never
+# assigned is an identity test rather than a failed dict lookup.
+UNSET = _Unset()
+
+def referenced_name(node):
+    """Return the variable or temporary node declares, assigns or reads directly, or None."""
+    if isinstance(node, (VariableDeclarationNode, AssignNode, ArrayDeclarationNode, ArrayAccessNode, TemporaryNode)):
+        return node.name
+    if isinstance(node, ArrayAssignNode):
+        return node.array_name
+    if isinstance(node, (IncrementNode, DecrementNode, ForLoopNode, VariableAccessNode)):
+        if isinstance(node.identifier, str):
+            return node.identifier
+    return None
+
+class Scope:
+    """Maps the variables of one scope to slot indices in its frames.
+
+    Scopes nest through parent; lookup() returns how many scopes out a name
+    was found and its slot there, which is how a frame chain is walked at run
+    time. Quetzal programs currently have a single scope, the program's.
+    """
+    def __init__(self, parent=None):
+        self.parent = parent
+        self.slots = {}
+        self.names = []
+
+    def declare(self, name):
+        """Return name's slot in this scope, giving it the next free one if it has none."""
+        slot = self.slots.get(name)
+        if slot is None:
+            slot = self.slots[name] = len(self.names)
+            self.names.append(name)
+        return slot
+
+    def lookup(self, name):
+        """Return (depth, slot) for name in this scope or an enclosing one, or None."""
+        scope = self
+        depth = 0
+        while scope is not None:
+            slot = scope.slots.get(name)
+            if slot is not None:
+                return depth, slot
+            scope = scope.parent
+            depth += 1
+        return None
+
+    def child(self):
+        return Scope(self)
+
+    def frame(self, parent=None):
+        """Return a new Frame for this scope with every slot UNSET."""
+        return Frame(len(self.names), parent)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __repr__(self):
+        return f"Scope({', '.join(self.names)})"
+
+class Frame:
+    """The values of one activation of a Scope, indexed by slot."""
+    __slots__ = ('values', 'parent')
+
+    def __init__(self, size, parent=None):
+        self.values = [UNSET] * size
+        self.parent = parent
+
+    def outer(self, depth):
+        """Return the frame depth links up the parent chain."""
+        frame = self
+        for _ in range(depth):
+            frame = frame.parent
+        return frame
+
+    def as_dict(self, scope):
+        """Return the assigned variables by name, like the tree-walker's environment."""
+        return {name: value for name, value in zip(scope.names, self.values) if value is not UNSET}
+
+class Resolver:
+    """Gives every variable a program refers to a slot, before it runs.
+
+    Any reference declares the name: reads of a variable that is never
+    assigned still need a slot, so the engines can report them as undefined
+    when they run, exactly where the tree-walker would.
+    """
+    def __init__(self, scope=None):
+        self.scope = scope if scope is not None else Scope()
+
+    def resolve(self, statements):
+        self.visit(statements)
+        return self.scope
+
+    def visit(self, value):
+        if isinstance(value, Node):
+            name = referenced_name(value)
+            if name is not None:
+                self.scope.declare(name)
+            elif isinstance(value, ResetNode):
+                for name in value.names:
+                    self.scope.declare(name)
+            for field in value._fields:
+                self.visit(getattr(value, field))
+        elif isinstance(value, (list, tuple)):
+            for item in value:
+                self.visit(item)
+
+def resolve(statements, scope=None):
+    """Return the Scope holding a slot for every variable in statements."""
+    return Resolver(scope).resolve(statements)
+
+if __name__ == "__main__":
+    from lexer import Lexer
+    from parser import Parser
+
+    code = '''integer total : 0
+for integer i : 0 to 5
+    total : total + i
+-> total
+'''
+    scope = resolve(Parser(Lexer(code).tokenize()).parse())
+    print(scope, scope.slots)
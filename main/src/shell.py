@@ -1,17 +1,27 @@
-def run_quetzal_code(code):
-    # This function would interface with your interpreter
-    # Placeholder for actual interpreter call
-    return "Output from running code"
+from cache import ParseCache
+from interpreter import run
+from output import StreamSink
+
+# Shared across inputs so repeated statements are only parsed once
+parse_cache = ParseCache()
+
+# Results are printed as they are produced rather than when a program ends
+output_sink = StreamSink(buffer_size=0)
+
+def run_quetzal_code(code, sink=None):
+    return run(code, cache=parse_cache, sink=sink)
 
 def quetzal_shell():
-    print("Welcome to the Quetzal interactive shell. Type 'exit' to exit.")
+    print("Welcome to the Quetzal interactive shell. Type 'exit' to exit or 'cache' for parse cache statistics.")
     while True:
         try:
             code = input("quetzal> ")
             if code.lower() == "exit":
                 break
-            output = run_quetzal_code(code)
-            print(output)
+            if code.lower() == "cache":
+                print(parse_cache)
+                continue
+            run_quetzal_code(code, output_sink)
         except Exception as e:
             print(f"Error: {e}")
 
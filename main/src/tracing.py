@@ -0,0 +1,96 @@
+import contextlib
+import os
+import sys
+
+# Trace levels, quietest first. A channel emits every message at or below its level.
+OFF = 0
+INFO = 1
+DEBUG = 2
+
+LEVELS = {'off': OFF, 'info': INFO, 'debug': DEBUG}
+
+class Channel:
+    """A named trace channel with precomputed level flags.
+
+    Call sites test a flag before building their message:
+
+        if trace.debug:
+            trace.emit(f"Visiting: {type(node).__name__}")
+
+    so a channel that is off costs a single attribute read, with no string
+    formatting and no I/O.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.set_level(OFF)
+
+    def set_level(self, level):
+        self.level = level
+        self.info = level >= INFO
+        self.debug = level >= DEBUG
+
+    def emit(self, message):
+        print(message, file=output or sys.stdout)
+
+    def __repr__(self):
+        return f"Channel({self.name!r}, level={self.level})"
+
+# Where trace messages go; None means whatever sys.stdout is at the time.
+output = None
+
+channels = {}
+
+def get_channel(name):
+    """Return the channel called name, creating it (switched off) if needed."""
+    channel = channels.get(name)
+    if channel is None:
+        channel = channels[name] = Channel(name)
+    return channel
+
+for _name in ('lexer', 'parser', 'optimizer', 'interpreter', 'loop'):
+    get_channel(_name)
+
+def parse_spec(spec):
+    """Turn a spec like 'lexer=debug,loop' into {channel: level}.
+
+    A bare channel name means debug, and the name 'all' applies to every channel.
+    """
+    levels = {}
+    for item in spec.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        name, _, level_name = item.partition('=')
+        level_name = level_name.strip().lower() or 'debug'
+        if level_name not in LEVELS:
+            raise ValueError(f"Unknown trace level '{level_name}' for channel '{name}'")
+        levels[name.strip()] = LEVELS[level_name]
+    return levels
+
+def configure(spec='', stream=None):
+    """Set every channel's level from spec, switching off any channel it doesn't name."""
+    global output
+    levels = parse_spec(spec) if isinstance(spec, str) else dict(spec)
+    default = levels.pop('all', OFF)
+    for name in levels:
+        get_channel(name)
+    for name, channel in channels.items():
+        channel.set_level(levels.get(name, default))
+    output = stream
+
+@contextlib.contextmanager
+def configured(spec='', stream=None):
+    """Apply a trace configuration for the duration of a with block, e.g. a single run."""
+    global output
+    saved_levels = {name: channel.level for name, channel in channels.items()}
+    saved_output = output
+    configure(spec, stream)
+    try:
+        yield
+    finally:
+        for name, channel in channels.items():
+            channel.set_level(saved_levels.get(name, OFF))
+        output = saved_output
+
+# Tracing can be switched on without touching code, e.g. QUETZAL_TRACE=loop=info,lexer
+configure(os.environ.get('QUETZAL_TRACE', ''))
@@ -0,0 +1,468 @@
+import builtins
+import math
+
+from ast import (
+    ArrayAccessNode,
+    ArrayAssignNode,
+    ArrayDeclarationNode,
+    AssignNode,
+    BinaryOperatorNode,
+    CharacterNode,
+    DecrementNode,
+    DoWhileNode,
+    DoubleNode,
+    ForLoopNode,
+    IfNode,
+    IncrementNode,
+    NumberNode,
+    OutputNode,
+    ResetNode,
+    StringLiteralNode,
+    VariableDeclarationNode,
+    WhileLoopNode,
+)
+from output import MemorySink, ResultCollector, ResultWriter
+from resolver import UNSET, resolve
+
+# Python operator and precedence for each binary operator. Operands bind
+# tighter than their operator get no parentheses, so long left-leaning
+# chains don't run into the Python parser's nesting limit.
+BINARY_OPERATORS = {
+    'OR': ('or', 1),
+    'AND': ('and', 2),
+    'EQUAL': ('==', 4),
+    'NOT_EQUAL': ('!=', 4),
+    'GREATER': ('>', 4),
+    'LESS': ('<', 4),
+    'GREATER_EQUAL': ('>=', 4),
+    'LESS_EQUAL': ('<=', 4),
+    'PLUS': ('+', 6),
+    'MINUS': ('-', 6),
+    'MULTIPLY': ('*', 7),
+    'DIVIDE': ('/', 7),
+}
+NOT_PRECEDENCE = 3
+COMPARISON_PRECEDENCE = 4
+UNARY_PRECEDENCE = 8
+ATOM = 10
+
+LITERALS = (NumberNode, StringLiteralNode, CharacterNode, DoubleNode)
+
+# Statements that open and close a block of results
+COMPOUND = (IfNode, WhileLoopNode, DoWhileNode, ForLoopNode)
+LOOPS = (WhileLoopNode, DoWhileNode, ForLoopNode)
+
+# CPython compiles at most 20 loops nested in one function and 100 levels of
+# indentation in one source. A loop nested deeper than MAX_LOOPS moves into a
+# function of its own; a program indented deeper than MAX_DEPTH can't be
+# transpiled at all.
+MAX_LOOPS = 16
+MAX_DEPTH = 90
+
+# Statements with a compiled statement form; anywhere else, such as inside an
+# expression of a hand-built tree, they run as a nested function.
+STATEMENTS = (
+    VariableDeclarationNode, AssignNode, ArrayDeclarationNode, ArrayAssignNode,
+    IncrementNode, DecrementNode, OutputNode, IfNode, ForLoopNode, DoWhileNode,
+    ResetNode,
+)
+
+def undefined(name):
+    raise Exception(f"Undefined variable {name}")
+
+def missing(name):
+    # The tree-walker reads arrays and loop variables with environment[name]
+    raise KeyError(name)
+
+def fail(message, *operands):
+    raise Exception(message)
+
+class NestingError(Exception):
+    """Raised for a program whose blocks nest deeper than CPython can compile."""
+
+class Transpiler:
+    """Writes a parsed program as the source of one Python function.
+
+    Quetzal variables become locals of _program, arrays become lists, and
+    every statement becomes the Python statements that write the results
+    Interpreter.execute would write for it to an output.ResultWriter, so the
+    program runs on CPython's own eval loop. Every local starts out bound to
+    UNSET, and reads are only checked against it where the variable is not
+    certain to be assigned on every path to them.
+    """
+    def __init__(self):
+        self.lines = []
+        self.depth = 0
+        self.loops = 0  # Loops open in the function being written
+        self.locals = {}
+        self.assigned = set()
+        self.counter = 0
+
+    def transpile(self, statements):
+        """Return Python source defining _program(_writer), which runs statements like Interpreter.interpret."""
+        for name in resolve(statements).names:
+            self.locals[name] = 'v_' + name if name.isidentifier() else f'w{len(self.locals)}'
+        self.block(statements, '_writer')
+        header = ['def _program(_writer, _UNSET=_UNSET):']
+        if self.locals:
+            header.append('    ' + ' = '.join(self.locals.values()) + ' = _UNSET')
+        return '\n'.join(header + self.lines) + '\n'
+
+    def emit(self, line):
+        self.lines.append('    ' * self.depth + line)
+
+    def temporary(self, prefix):
+        self.counter += 1
+        return f'{prefix}{self.counter}'
+
+    def load(self, name, undefined_helper):
+        """Return an expression for a variable's value, raising through undefined_helper if it was never assigned."""
+        local = self.locals[name]
+        if name in self.assigned:
+            return local
+        self.assigned.add(name)
+        return f'({local} if {local} is not _UNSET else {undefined_helper}({name!r}))'
+
+    def message(self, text, local):
+        """Return an f-string of text followed by the value of local."""
+        return 'f' + repr(text.replace('{', '{{').replace('}', '}}') + '{' + local + '}')
+
+    # Statements
+
+    def block(self, statements, writer):
+        """Emit statements one level deeper, writing their results with the ResultWriter named writer."""
+        self.depth += 1
+        if self.depth > MAX_DEPTH:
+            raise NestingError(f"blocks nest more than {MAX_DEPTH} levels deep")
+        start = len(self.lines)
+        for statement in statements:
+            self.statement(statement, writer)
+        if len(self.lines) == start:
+            self.emit('pass')
+        self.depth -= 1
+
+    def branch(self, statements, writer, assigned):
+        """Emit a block that may not run, so its assignments don't count after it."""
+        self.assigned = set(assigned)
+        self.block(statements, writer)
+        self.assigned = assigned
+
+    def statement(self, node, writer):
+        if isinstance(node, LOOPS) and self.loops == MAX_LOOPS:
+            self.helper(node, writer)
+            return
+        method = getattr(self, 'statement_' + type(node).__name__, None)
+        if method is not None:
+            method(node, writer)
+        elif type(node) in LITERALS:
+            if node.value is not None:
+                self.emit(f'{writer}.result({self.expression(node)})')
+        else:
+            self.emit(f'_t = {self.expression(node)}')
+            self.emit(f'if _t is not None: {writer}.result(_t)')
+
+    def helper(self, node, writer):
+        """Emit node as a function sharing the program's locals and call it, so its loops count afresh."""
+        function = self.temporary('_s')
+        self.emit(f'def {function}({writer}):')
+        self.depth += 1
+        if self.locals:
+            self.emit('nonlocal ' + ', '.join(self.locals.values()))
+        loops, self.loops = self.loops, 0
+        self.statement(node, writer)
+        self.loops = loops
+        self.depth -= 1
+        self.emit(f'{function}({writer})')
+
+    def statement_VariableDeclarationNode(self, node, writer):
+        local = self.locals[node.name]
+        self.emit(f'{local} = {self.expression(node.expression)}')
+        self.assigned.add(node.name)
+        message = self.message(f"Variable '{node.name}' set to ", local)
+        self.emit(f'{writer}.result({message})')
+
+    def statement_AssignNode(self, node, writer):
+        local = self.locals[node.name]
+        self.emit(f'{local} = {self.expression(node.expression)}')
+        self.assigned.add(node.name)
+        message = self.message(f"Variable {node.name} assigned value ", local)
+        self.emit(f'{writer}.result({message})')
+
+    def statement_ArrayDeclarationNode(self, node, writer):
+        local = self.locals[node.name]
+        elements = ', '.join(self.expression(element) for element in node.elements)
+        self.emit(f'{local} = [{elements}]')
+        self.assigned.add(node.name)
+        message = self.message(f"Array '{node.name}' set to ", local)
+        self.emit(f'{writer}.result({message})')
+
+    def statement_ArrayAssignNode(self, node, writer):
+        name = node.array_name
+        local = self.locals[name]
+        # environment.get() semantics: an unassigned array is None, not an error
+        array = local if name in self.assigned else f'({local} if {local} is not _UNSET else None)'
+        self.emit(f'_array = {array}')
+        self.emit(f'_index = {self.expression(node.index)}')
+        self.emit(f'_value = {self.expression(node.value)}')
+        self.emit('if _array is not None and 0 <= _index < len(_array):')
+        self.emit('    _array[_index] = _value')
+        self.emit('else:')
+        message = f"Array assignment out of bounds or array '{name}' not defined"
+        self.emit(f'    _fail({message!r})')
+
+    def statement_UncheckedArrayAssignNode(self, node, writer):
+        # Python evaluates the value before the index in a[i] = v
+        self.emit(f'_index = {self.expression(node.index)}')
+        self.emit(f'{self.locals[node.array_name]}[_index] = {self.expression(node.value)}')
+
+    def statement_IncrementNode(self, node, writer, operator='+='):
+        target = node.identifier
+        if isinstance(target, ArrayAccessNode):
+            array = self.load(target.name, '_missing')
+            self.emit(f'{array}[{self.expression(target.index)}] {operator} 1')
+            return
+        local = self.locals[target]
+        if target not in self.assigned:
+            self.emit(f'if {local} is _UNSET: _missing({target!r})')
+            self.assigned.add(target)
+        self.emit(f'{local} {operator} 1')
+
+    def statement_DecrementNode(self, node, writer):
+        self.statement_IncrementNode(node, writer, '-=')
+
+    def statement_ResetNode(self, node, writer):
+        if node.names:
+            self.emit(' = '.join(self.locals[name] for name in node.names) + ' = _UNSET')
+
+    def statement_OutputNode(self, node, writer):
+        self.emit(f'{writer}.result(str({self.expression(node.value)}))')
+
+    def statement_IfNode(self, node, writer):
+        condition = self.expression(node.condition)
+        assigned = self.assigned
+        # Each else_if test only runs after the ones before it, so their
+        # reads count for the tests and blocks that follow. The tests are
+        # written out first so any nested functions they need are defined
+        # ahead of the whole chain.
+        self.assigned = set(assigned)
+        tests = []
+        for test, statements in node.elif_blocks or []:
+            tests.append((self.expression(test), statements, set(self.assigned)))
+        self.assigned = assigned
+        self.emit(f'{writer}.open()')
+        self.emit(f'if {condition}:')
+        self.branch(node.then_block, writer, assigned)
+        else_block = node.else_block or []
+        if tests and else_block:
+            # As in the tree-walker, the else block runs whenever the if
+            # condition was false, even after an else_if block has run.
+            self.emit('else:')
+            self.depth += 1
+            self.elif_chain(tests, writer, 'if')
+            self.assigned = set(assigned)
+            for statement in else_block:
+                self.statement(statement, writer)
+            self.assigned = assigned
+            self.depth -= 1
+        elif tests:
+            self.elif_chain(tests, writer, 'elif')
+        elif else_block:
+            self.emit('else:')
+            self.branch(else_block, writer, assigned)
+        self.emit(f'{writer}.close()')
+
+    def elif_chain(self, tests, writer, keyword):
+        assigned = self.assigned
+        for condition, statements, tested in tests:
+            self.emit(f'{keyword} {condition}:')
+            self.branch(statements, writer, tested)
+            keyword = 'elif'
+        self.assigned = assigned
+
+    def statement_WhileLoopNode(self, node, writer):
+        self.emit(f'{writer}.open()')
+        self.emit(f'while {self.expression(node.condition)}:')
+        self.loops += 1
+        self.branch(node.body, writer, self.assigned)
+        self.loops -= 1
+        self.emit(f'{writer}.close()')
+
+    def statement_DoWhileNode(self, node, writer):
+        self.emit(f'{writer}.open()')
+        self.emit('while True:')
+        self.loops += 1
+        self.block(node.body, writer)
+        self.depth += 1
+        self.emit(f'if not {self.expression(node.condition, NOT_PRECEDENCE)}: break')
+        self.depth -= 1
+        self.loops -= 1
+        self.emit(f'{writer}.close()')
+
+    def statement_ForLoopNode(self, node, writer):
+        self.emit(f'{writer}.open()')
+        start = self.load(node.identifier, '_missing')
+        end = self.expression(node.end_value)
+        self.emit(f'for {self.locals[node.identifier]} in range({start}, {end}):')
+        self.loops += 1
+        self.branch(node.body, writer, self.assigned)
+        self.loops -= 1
+        self.emit(f'{writer}.close()')
+
+    # Expressions
+
+    def expression(self, node, context=0):
+        """Return Python source for node's value, parenthesized if it binds looser than context."""
+        text, precedence = self.operand(node)
+        if precedence < context:
+            return f'({text})'
+        return text
+
+    def operand(self, node):
+        """Return (source, precedence) for node's value."""
+        method = getattr(self, 'expression_' + type(node).__name__, None)
+        if method is not None:
+            return method(node)
+        if isinstance(node, STATEMENTS) or hasattr(self, 'statement_' + type(node).__name__):
+            return self.nested(node), ATOM
+        return f"_fail({f'No visit_{type(node).__name__} method'!r})", ATOM
+
+    def nested(self, node):
+        """Emit node as a function sharing the program's locals and return a call to it."""
+        function = self.temporary('_s')
+        collector = self.temporary('_c')
+        self.emit(f'def {function}():')
+        self.depth += 1
+        if self.locals:
+            self.emit('nonlocal ' + ', '.join(self.locals.values()))
+        self.emit(f'{collector} = _ResultCollector()')
+        loops, self.loops = self.loops, 0
+        self.statement(node, collector)
+        self.loops = loops
+        if isinstance(node, COMPOUND):
+            self.emit(f'return {collector}.text()')
+        else:
+            self.emit(f'return {collector}.lines[0] if {collector}.lines else None')
+        self.depth -= 1
+        return f'{function}()'
+
+    def expression_NumberNode(self, node):
+        value = node.value
+        if isinstance(value, float) and not math.isfinite(value):
+            return f'float({str(value)!r})', ATOM
+        text = repr(value)
+        return text, UNARY_PRECEDENCE if text.startswith('-') else ATOM
+
+    expression_StringLiteralNode = expression_CharacterNode = expression_DoubleNode = expression_NumberNode
+
+    def expression_VariableAccessNode(self, node):
+        return self.load(node.identifier, '_undefined'), ATOM
+
+    def expression_ArrayAccessNode(self, node):
+        array = self.load(node.name, '_missing')
+        return f'{array}[{self.expression(node.index)}]', ATOM
+
+    def expression_UncheckedArrayAccessNode(self, node):
+        return f'{self.locals[node.name]}[{self.expression(node.index)}]', ATOM
+
+    def expression_BinaryOperatorNode(self, node):
+        if node.operator not in BINARY_OPERATORS:
+            left = self.expression(node.left)
+            right = self.expression(node.right)
+            return f"_fail({f'Unsupported operator {node.operator}'!r}, {left}, {right})", ATOM
+        operator, precedence = BINARY_OPERATORS[node.operator]
+        # Comparisons chain in Python, so a comparison operand always gets parentheses
+        left = self.expression(node.left, precedence + (precedence == COMPARISON_PRECEDENCE))
+        if node.operator in ('AND', 'OR'):
+            # The right operand may not run, so its reads don't count after it
+            assigned = set(self.assigned)
+            right = self.expression(node.right, precedence + 1)
+            self.assigned = assigned
+        else:
+            right = self.expression(node.right, precedence + 1)
+        return f'{left} {operator} {right}', precedence
+
+    expression_IntegerOperatorNode = expression_DoubleOperatorNode = expression_BinaryOperatorNode
+
+    def expression_ConcatenateNode(self, node):
+        return self.expression_BinaryOperatorNode(BinaryOperatorNode(node.left, 'PLUS', node.right))
+
+    def expression_UnaryOperatorNode(self, node):
+        if node.operator == 'NEGATE':
+            return f'-{self.expression(node.operand, UNARY_PRECEDENCE)}', UNARY_PRECEDENCE
+        if node.operator == 'NOT':
+            return f'not {self.expression(node.operand, NOT_PRECEDENCE)}', NOT_PRECEDENCE
+        operand = self.expression(node.operand)
+        return f"_fail({f'Unsupported operator {node.operator}'!r}, {operand})", ATOM
+
+    def expression_TemporaryNode(self, node):
+        local = self.locals[node.name]
+        return f'({local} if {local} is not _UNSET else ({local} := {self.expression(node.expression)}))', ATOM
+
+    def expression_OutputNode(self, node):
+        return f'str({self.expression(node.value)})', ATOM
+
+    def expression_FunctionCallNode(self, node):
+        arguments = ', '.join(self.expression(argument) for argument in node.arguments)
+        return f'_function({node.function_name!r})({arguments})', ATOM
+
+def transpile(statements):
+    """Return the Python source of a parsed program."""
+    return Transpiler().transpile(statements)
+
+def compile_python(statements):
+    """Transpile a parsed program and compile it into a Python code object.
+
+    Raises NestingError if its blocks nest too deep for CPython; run it with
+    another engine then.
+    """
+    return compile(transpile(statements), '<quetzal>', 'exec')
+
+def load(code, namespace=None):
+    """Execute a code object from compile_python and return a function running its program.
+
+    namespace holds the builtin functions a program can call, by name. The
+    function writes the program's results to the sink it is given, or
+    returns them as Interpreter.interpret would if none is.
+    """
+    functions = namespace if namespace is not None else {}
+
+    def function(name):
+        found = functions.get(name)
+        if found:
+            return found
+        raise NameError(f"Function {name} not defined")
+
+    scope = {
+        '__builtins__': builtins,
+        '_UNSET': UNSET,
+        '_undefined': undefined,
+        '_missing': missing,
+        '_fail': fail,
+        '_function': function,
+        '_ResultCollector': ResultCollector,
+    }
+    exec(code, scope)
+    _program = scope['_program']
+
+    def program(sink=None):
+        memory = MemorySink() if sink is None else None
+        try:
+            _program(ResultWriter(sink or memory))
+        finally:
+            (sink or memory).flush()
+        if memory is not None:
+            return memory.getvalue()[:-1]
+    return program
+
+if __name__ == "__main__":
+    from lexer import Lexer
+    from parser import Parser
+
+    code = '''integer total : 0
+for integer i : 0 to 5
+    total : total + i
+-> total
+'''
+    statements = Parser(Lexer(code).tokenize()).parse()
+    print(transpile(statements))
+    print(load(compile_python(statements))())
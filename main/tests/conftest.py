@@ -0,0 +1,24 @@
+import glob
+import importlib
+import os
+import sys
+
+SOURCE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+
+# Front ends that open windows or read stdin when imported
+SKIPPED = {'gui', 'main', 'shell'}
+
+# The interpreter's modules import each other by name from src, and its ast
+# module shadows the standard library's, which pytest has already imported.
+# Import them with src's ast in place, then give the standard one back to
+# pytest; the modules keep the names they imported.
+sys.path.insert(0, SOURCE)
+standard_ast = sys.modules.pop('ast')
+try:
+    for path in sorted(glob.glob(os.path.join(SOURCE, '*.py'))):
+        name = os.path.splitext(os.path.basename(path))[0]
+        if name not in SKIPPED:
+            importlib.import_module(name)
+finally:
+    sys.modules['quetzal_ast'] = sys.modules['ast']
+    sys.modules['ast'] = standard_ast
@@ -0,0 +1,98 @@
+from benchmarks import SAMPLE_PROGRAM
+from cache import HEADER, ParseCache, ProgramCache, _padding
+from conformance import CORPUS
+from lexer import Lexer
+from parser import Parser, SyntaxError
+
+SOURCES = [program for program in CORPUS.values() if isinstance(program, str)]
+
+def parse(source):
+    return Parser(Lexer(source).tokenize()).parse()
+
+def test_program_cache_round_trip(tmp_path):
+    cache = ProgramCache(str(tmp_path))
+    for source in SOURCES:
+        assert cache.get(source) is None
+        cache.put(source, parse(source))
+        assert repr(cache.get(source).to_nodes()) == repr(parse(source))
+
+def test_parse_cache_matches_parser():
+    cache = ParseCache()
+    for source in SOURCES + [SAMPLE_PROGRAM]:
+        assert repr(cache.parse(source)) == repr(parse(source))
+    assert repr(cache.parse(SAMPLE_PROGRAM)) == repr(parse(SAMPLE_PROGRAM))
+    assert cache.hits
+
+def test_parse_cache_statements_continued_on_unindented_lines():
+    cache = ParseCache()
+    for source in ('integer x : 1 +\n2\n-> x\n', 'array integer v[1, 2,\n3]\n-> v[2]\n'):
+        assert repr(cache.parse(source)) == repr(parse(source))
+        assert repr(cache.parse(source)) == repr(parse(source))
+
+def test_parse_cache_reports_errors_at_their_line():
+    source = 'integer a : 1\n-> a\nif a > 1 -> a\n-> b\n'
+    try:
+        parse(source)
+    except SyntaxError as error:
+        expected = str(error)
+    try:
+        ParseCache().parse(source)
+    except SyntaxError as error:
+        assert str(error) == expected
+    else:
+        raise AssertionError("ParseCache accepted a program the parser rejects")
+
+def test_program_cache_ignores_corrupt_entries(tmp_path):
+    cache = ProgramCache(str(tmp_path))
+    source = 'string s : "hello"\ninteger x : 3\n-> s\n-> x\n'
+    expected = repr(parse(source))
+    cache.put(source, parse(source))
+    path = cache.path(cache.digest(source))
+    with open(path, 'rb') as file:
+        data = file.read()
+    padding = range(HEADER.size, HEADER.size + _padding(HEADER.size))
+    for position in range(len(data)):
+        corrupt = bytearray(data)
+        corrupt[position] ^= 0x41
+        with open(path, 'wb') as file:
+            file.write(corrupt)
+        flat = cache.get(source)
+        if position in padding:  # the only bytes neither the header nor the CRC covers
+            assert repr(flat.to_nodes()) == expected
+        else:
+            assert flat is None
+    for length in (0, 10, len(data) // 2, len(data) - 1):
+        with open(path, 'wb') as file:
+            file.write(data[:length])
+        assert cache.get(source) is None
+
+def test_program_cache_keeps_optimized_and_plain_entries_apart(tmp_path):
+    cache = ProgramCache(str(tmp_path))
+    source = 'integer x : 1 + 2\n-> x\n'
+    plain, folded = parse(source), parse('integer x : 3\n-> x\n')
+    assert cache.digest(source) != cache.digest(source, optimized=True)
+    cache.put(source, plain)
+    assert cache.get(source, optimized=True) is None
+    cache.put(source, folded, optimized=True)
+    assert repr(cache.get(source).to_nodes()) == repr(plain)
+    assert repr(cache.get(source, optimized=True).to_nodes()) == repr(folded)
+    cache.put_code(source, compile('plain = 1', '<plain>', 'exec'))
+    assert cache.get_code(source, optimized=True) is None
+    assert cache.get_code(source).co_filename == '<plain>'
+
+def test_program_cache_stores_optimized_programs(tmp_path, monkeypatch):
+    import interpreter
+    cache = ProgramCache(str(tmp_path))
+    expected = {}
+    for engine in ('tree', 'python'):
+        for source in SOURCES:
+            expected[engine, source] = interpreter.run(source, engine=engine, optimize=True)
+            assert interpreter.run(source, cache=cache, engine=engine, optimize=True) == expected[engine, source]
+    assert cache.get(SOURCES[0], optimized=True) is not None
+    assert cache.get(SOURCES[0]) is None
+
+    def no_passes(ast):
+        raise AssertionError('optimizer ran on a cached program')
+    monkeypatch.setattr(interpreter, 'optimize_program', no_passes)
+    for (engine, source), result in expected.items():
+        assert interpreter.run(source, cache=cache, engine=engine, optimize=True) == result
@@ -0,0 +1,25 @@
+import pytest
+
+from conformance import CORPUS, parse, run_quietly, sink_output
+from interpreter import ENGINES
+
+# Every engine, as parsed and optimized, except the unoptimized tree-walker
+# the others are compared with.
+CONFIGURATIONS = [
+    (engine, optimize)
+    for engine in ENGINES
+    for optimize in (False, True)
+    if engine != 'tree' or optimize
+]
+
+@pytest.mark.parametrize('name', list(CORPUS))
+@pytest.mark.parametrize('engine, optimize', CONFIGURATIONS)
+def test_engine_matches_tree_walker(name, engine, optimize):
+    ast = parse(CORPUS[name])
+    assert run_quietly(ast, engine, optimize) == run_quietly(ast, 'tree')
+
+@pytest.mark.parametrize('name', list(CORPUS))
+@pytest.mark.parametrize('engine, optimize', CONFIGURATIONS)
+def test_engine_writes_sink_like_tree_walker(name, engine, optimize):
+    ast = parse(CORPUS[name])
+    assert sink_output(ast, engine, optimize) == sink_output(ast, 'tree')
@@ -0,0 +1,40 @@
+import io
+
+from benchmarks import SAMPLE_PROGRAM, generate_source, legacy_tokenize
+from lexer import IncrementalLexer, Lexer
+
+def test_tokens_match_original_lexer(capsys):
+    source = generate_source(200)
+    assert list(Lexer(source).tokenize()) == list(legacy_tokenize(source))
+
+def test_stream_matches_tokenize():
+    assert list(Lexer(io.StringIO(SAMPLE_PROGRAM)).stream()) == list(Lexer(SAMPLE_PROGRAM).tokenize())
+
+def test_incremental_edit_matches_fresh_lex():
+    lexer = IncrementalLexer(SAMPLE_PROGRAM)
+    lexer.set_text(SAMPLE_PROGRAM.replace('"Hello"', '"Bye"').replace('counter > 4', 'counter > 6'))
+    assert lexer.tokens() == list(Lexer(lexer.source()).tokenize())
+
+def test_incremental_edit_relexes_until_indentation_agrees():
+    source = 'integer a : 1\nwhile a < 3\n    a++\n    -> a\n-> a\n'
+    lexer = IncrementalLexer(source)
+    # Same indentation: only the edited line is lexed again
+    assert lexer.edit(3, 4, '    -> a + 1') == 1
+    assert lexer.tokens() == list(Lexer(lexer.source()).tokenize())
+    # Unindenting line 2 changes the indent stack entering line 3, whose
+    # checkpoint is then stale; lexing stops once the states agree again.
+    assert lexer.edit(2, 3, 'a++') == 2
+    assert lexer.checkpoints[3] == (0,)
+    assert lexer.tokens() == list(Lexer(lexer.source()).tokenize())
+    assert lexer.edit(2, 3, '    a++') == 2
+    assert lexer.checkpoints[3] == (0, 4)
+    assert lexer.tokens() == list(Lexer(source.replace('-> a\n-> a', '-> a + 1\n-> a')).tokenize())
+
+def test_parallel_lexing_matches_tokenize():
+    # Small chunks put chunk boundaries inside indented blocks, where the
+    # INDENT and DEDENT tokens have to be reconstructed across chunks.
+    source = generate_source(60)
+    assert '\n    ' in source
+    expected = list(Lexer(source).tokenize())
+    assert list(Lexer(source).tokenize_parallel(workers=2, min_chunk_size=64)) == expected
+    assert list(Lexer(source).tokenize_parallel(min_chunk_size=len(source) * 2)) == expected
@@ -0,0 +1,51 @@
+import io
+
+import pytest
+
+import tracing
+from cache import ProgramCache
+from conformance import CORPUS, parse, run_quietly
+from interpreter import run
+from optimizer import PASSES, ConstantFolder, optimize
+
+@pytest.mark.parametrize('name', list(CORPUS))
+@pytest.mark.parametrize('optimizer_pass', PASSES, ids=lambda optimizer_pass: optimizer_pass.__name__)
+def test_pass_keeps_results(name, optimizer_pass):
+    ast = parse(CORPUS[name])
+    assert run_quietly(optimize(ast, (optimizer_pass,)), 'tree') == run_quietly(ast, 'tree')
+
+@pytest.mark.parametrize('name', list(CORPUS))
+def test_optimizing_twice_keeps_results(name):
+    ast = parse(CORPUS[name])
+    assert run_quietly(optimize(optimize(ast)), 'tree') == run_quietly(ast, 'tree')
+
+def test_string_concatenation_is_folded():
+    folded = optimize(parse('string s : "a" + "b"\n-> s\n'), (ConstantFolder,))
+    assert type(folded[0].expression).__name__ == 'StringLiteralNode'
+    assert folded[0].expression.value == 'ab'
+    assert run_quietly(folded, 'tree') == "Variable 's' set to ab\nab"
+
+def test_folded_string_keeps_quotes():
+    folded = optimize(parse('''string s : "a" + '"'
+-> s
+'''))
+    assert folded[0].expression.value == 'a"'
+    assert run_quietly(folded, 'tree') == 'Variable \'s\' set to a"\na"'
+
+def test_type_errors_are_traced_on_the_optimizer_channel(tmp_path, capsys):
+    source = 'integer wrong : "a"\n-> wrong\n'
+    warning = "Warning: Type error: variable 'wrong' is declared integer but given a string\n"
+    assert run(source, optimize=True) == run(source)
+    assert capsys.readouterr().out == ''
+    cache = ProgramCache(str(tmp_path))
+    for engine in ('tree', 'python'):
+        for _ in range(2):  # cold, then warm from the cache
+            stream = io.StringIO()
+            with tracing.configured('optimizer=info', stream):
+                assert run(source, cache=cache, engine=engine, optimize=True) == run(source)
+            assert stream.getvalue() == warning
+    stream = io.StringIO()
+    with tracing.configured('optimizer=info', stream):
+        optimize(parse(source), (ConstantFolder,))
+        optimize(parse('integer right : 1\n-> right\n'))
+    assert stream.getvalue() == ''
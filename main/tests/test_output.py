@@ -0,0 +1,40 @@
+import queue
+
+from interpreter import run
+from output import FileSink, MemorySink, QueueSink, ResultCollector, ResultWriter
+
+def test_buffered_sink_sends_once_buffer_size_is_reached():
+    sink = MemorySink(buffer_size=4)
+    sink.write('ab\n')
+    assert sink.chunks == []
+    sink.write('c\n')
+    assert sink.chunks == ['ab\nc\n']
+    sink.write('d\n')
+    assert sink.getvalue() == 'ab\nc\nd\n'
+    assert sink.chunks == ['ab\nc\n', 'd\n']
+
+def test_queue_sink_puts_each_line_when_unbuffered():
+    lines = queue.Queue()
+    run('-> "a"\n-> "b"\n', sink=QueueSink(lines, buffer_size=0))
+    assert [lines.get_nowait() for _ in range(lines.qsize())] == ['a\n', 'b\n']
+
+def test_file_sink_writes_and_closes_its_file(tmp_path):
+    path = tmp_path / 'out.txt'
+    with FileSink(path) as sink:
+        run('for integer i : 0 to 3\n    -> i\n', sink=sink)
+    assert sink.stream.closed
+    assert path.read_text(encoding='utf-8') == "Variable 'i' set to 0\n0\n1\n2\n"
+    sink.close()
+
+def test_collector_text_matches_the_written_lines():
+    collector = ResultCollector()
+    writer = ResultWriter(MemorySink())
+    for target in (collector, writer):
+        target.open()
+        target.result('a')
+        target.open()
+        target.close()
+        target.result('b')
+        target.close()
+    assert collector.text() == 'a\n\nb'
+    assert writer.sink.getvalue() == 'a\n\nb\n'
@@ -0,0 +1,54 @@
+from interpreter import run, run_tokens
+from lexer import Lexer
+from parser import TokenStream
+
+PROGRAM = '''integer counter : 10
+string greeting : "Hello"
+array integer values[1, 2, 3]
+while counter > 4
+    -> greeting
+    -> values[0]
+    --counter
+if counter :> 3 then
+    -> counter
+else then
+    -> greeting
+'''
+
+def test_peek_looks_ahead_without_consuming():
+    tokens = TokenStream(Lexer('integer a : 1\n').tokenize())
+    assert [tokens.peek(k) for k in range(5)] == ['TYPE_INTEGER', 'IDENTIFIER', 'COLON', 'NUMBER', None]
+    assert tokens.advance() == ('TYPE_INTEGER', 'integer')
+    assert tokens.peek() == 'COLON'
+    assert tokens.value() == 'a'
+
+def test_reset_rewinds_to_a_mark_and_release_keeps_the_position():
+    tokens = TokenStream(Lexer('integer a : 1\n').tokenize())
+    mark = tokens.mark()
+    tokens.advance()
+    tokens.advance()
+    tokens.reset(mark)
+    assert tokens.current() == ('TYPE_INTEGER', 'integer')
+    mark = tokens.mark()
+    tokens.advance()
+    tokens.release(mark)
+    assert tokens.current() == ('IDENTIFIER', 'a')
+    assert tokens.marks == []
+
+def test_streamed_window_is_compacted_only_while_no_mark_is_held():
+    source = 'integer a : 1\n' * 2000
+    tokens = TokenStream(Lexer(source).stream())
+    mark = tokens.mark()
+    for _ in range(TokenStream.WINDOW_SLACK * 2):
+        tokens.advance()
+    assert tokens.base == 0
+    tokens.reset(mark)
+    assert tokens.current() == ('TYPE_INTEGER', 'integer')
+    for _ in range(TokenStream.WINDOW_SLACK * 2):
+        tokens.advance()
+    assert tokens.base > 0
+    assert len(tokens.buffer) <= TokenStream.WINDOW_SLACK + 1
+
+def test_streamed_tokens_run_like_a_buffer():
+    # run() parses a string from a TokenBuffer
+    assert run_tokens(Lexer(PROGRAM).stream()) == run(PROGRAM)
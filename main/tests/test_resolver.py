@@ -0,0 +1,40 @@
+from conformance import CORPUS, parse
+from resolver import UNSET, Scope, resolve
+
+def test_every_variable_gets_a_slot():
+    scope = resolve(parse('integer total : 0\nfor integer i : 0 to 5\n    total : total + i\n-> total\n'))
+    assert scope.names == ['total', 'i']
+    assert scope.slots == {'total': 0, 'i': 1}
+    for program in CORPUS.values():
+        scope = resolve(parse(program))
+        assert [scope.slots[name] for name in scope.names] == list(range(len(scope)))
+
+def test_lookup_walks_enclosing_scopes():
+    program = Scope()
+    program.declare('a')
+    program.declare('b')
+    inner = program.child()
+    inner.declare('b')
+    innermost = inner.child()
+    innermost.declare('c')
+    assert innermost.lookup('c') == (0, 0)
+    assert innermost.lookup('b') == (1, 0)
+    assert innermost.lookup('a') == (2, 0)
+    assert inner.lookup('b') == (0, 0)
+    assert program.lookup('b') == (0, 1)
+    assert innermost.lookup('missing') is None
+
+def test_frames_chain_like_their_scopes():
+    program = Scope()
+    program.declare('a')
+    inner = program.child()
+    inner.declare('b')
+    outer_frame = program.frame()
+    frame = inner.frame(outer_frame)
+    assert frame.values == [UNSET]
+    depth, slot = inner.lookup('a')
+    frame.outer(depth).values[slot] = 1
+    assert outer_frame.values == [1]
+    assert frame.outer(0) is frame
+    assert outer_frame.as_dict(program) == {'a': 1}
+    assert frame.as_dict(inner) == {}
@@ -0,0 +1,38 @@
+import io
+
+import pytest
+
+import tracing
+from interpreter import run
+
+def test_parse_spec():
+    assert tracing.parse_spec('lexer=debug, loop=info,interpreter') == {
+        'lexer': tracing.DEBUG, 'loop': tracing.INFO, 'interpreter': tracing.DEBUG,
+    }
+    assert tracing.parse_spec('') == {}
+    with pytest.raises(ValueError):
+        tracing.parse_spec('loop=loud')
+
+def test_configured_sets_levels_and_restores_them():
+    loop = tracing.get_channel('loop')
+    lexer = tracing.get_channel('lexer')
+    stream = io.StringIO()
+    with tracing.configured('loop=info', stream):
+        assert loop.info and not loop.debug
+        assert not lexer.info
+        loop.emit('traced')
+        with tracing.configured('all=debug'):
+            assert lexer.debug
+        assert not lexer.info
+    assert not loop.info
+    assert tracing.output is None
+    assert stream.getvalue() == 'traced\n'
+
+def test_run_traces_only_for_that_run(capsys):
+    source = 'integer i : 0\nwhile i < 2\n    ++i\n-> i\n'
+    assert run(source, trace='loop=info') == "Variable 'i' set to 0\n2"
+    out = capsys.readouterr().out
+    assert 'WHILE loop condition' in out
+    assert 'End of WHILE loop iteration' not in out
+    run(source)
+    assert capsys.readouterr().out == ''